@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.0/ref/settings/
 """
 import os
+import tempfile
 from datetime import timedelta
 from pathlib import Path
 
@@ -50,6 +51,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'trading_network.middleware.MetricsMiddleware',
+    'trading_network.middleware.SqlInstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -57,6 +60,8 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'trading_network.middleware.ReplicaRoutingMiddleware',
+    'trading_network.middleware.ProfilingMiddleware',
 ]
 
 ROOT_URLCONF = 'electronics_trading_network.urls'
@@ -83,15 +88,108 @@ WSGI_APPLICATION = 'electronics_trading_network.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.0/ref/settings/#databases
 
+# ASGI=1 - проект запущен под ASGI (electronics_trading_network.asgi): каждый запрос работает с базой
+# из своего потока, постоянные соединения не переиспользуются, поэтому CONN_MAX_AGE по умолчанию 0
+ASGI = os.getenv('ASGI') == '1'
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.postgresql_psycopg2',
         'NAME': os.getenv('POSTGRES_DB'),
         'USER': os.getenv('POSTGRES_USER'),
         'PASSWORD': os.getenv('POSTGRES_PASSWORD'),
+        'HOST': os.getenv('POSTGRES_HOST', ''),
+        'PORT': os.getenv('POSTGRES_PORT', ''),
+        # постоянные соединения с проверкой перед повторным использованием
+        'CONN_MAX_AGE': int(os.getenv('CONN_MAX_AGE', 0 if ASGI else 60)),
+        'CONN_HEALTH_CHECKS': True,
+    }
+}
+
+# Реплики для чтения: POSTGRES_REPLICA_HOSTS=host1,host2 (алиасы replica_1, replica_2, ...).
+# Без них алиас replica_1 - зеркало основной базы, чтение с него не включается (нужен для тестов маршрутизации)
+REPLICA_HOSTS = [host for host in os.getenv('POSTGRES_REPLICA_HOSTS', '').split(',') if host]
+for number, host in enumerate(REPLICA_HOSTS or [DATABASES['default']['HOST']], 1):
+    DATABASES[f'replica_{number}'] = {**DATABASES['default'], 'HOST': host, 'TEST': {'MIRROR': 'default'}}
+DATABASE_READ_REPLICAS = [f'replica_{number}' for number in range(1, len(REPLICA_HOSTS) + 1)]
+DATABASE_ROUTERS = ['trading_network.routers.ReplicaRouter']
+
+# Сколько секунд после записи клиент читает из основной базы (отставание реплик)
+REPLICA_STICKY_SECONDS = int(os.getenv('REPLICA_STICKY_SECONDS', 5))
+REPLICA_STICKY_COOKIE = 'read_primary_until'
+
+# Учет SQL-запросов (SqlInstrumentationMiddleware): доля запросов с учетом (0..1), пространства имен
+# представлений, порог медленного выражения и медленного запроса (мс) для журнала trading_network.sql
+SQL_INSTRUMENTATION_SAMPLE_RATE = float(os.getenv('SQL_INSTRUMENTATION_SAMPLE_RATE', 1))
+SQL_INSTRUMENTATION_NAMESPACES = ['trading_network', 'users']
+SQL_SLOW_QUERY_MS = float(os.getenv('SQL_SLOW_QUERY_MS', 100))
+SQL_SLOW_REQUEST_MS = float(os.getenv('SQL_SLOW_REQUEST_MS', 500))
+
+# Метрики по имени URL (/metrics/, только для администраторов). При нескольких процессах-воркерах укажите общий
+# каталог METRICS_DIR (очищается перед запуском): каждый процесс раз в METRICS_FLUSH_SECONDS пишет туда свой снимок
+METRICS_DIR = os.getenv('METRICS_DIR', '')
+METRICS_FLUSH_SECONDS = float(os.getenv('METRICS_FLUSH_SECONDS', 5))
+
+# Профили запросов администраторов (заголовок X-Profile или ?profile=cprofile|stacks): каталог (по умолчанию -
+# во временном каталоге системы, не в репозитории), число хранимых профилей и интервал выборки стеков (мс)
+PROFILE_DIR = os.getenv('PROFILE_DIR', Path(tempfile.gettempdir()) / 'trading_network_profiles')
+PROFILE_KEEP = int(os.getenv('PROFILE_KEEP', 100))
+PROFILE_SAMPLE_INTERVAL_MS = float(os.getenv('PROFILE_SAMPLE_INTERVAL_MS', 1))
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'message': {'format': '%(message)s'},
+    },
+    'handlers': {
+        'sql': {'class': 'logging.StreamHandler', 'formatter': 'message'},
+    },
+    'loggers': {
+        'trading_network.sql': {'handlers': ['sql'], 'level': 'WARNING', 'propagate': False},
+    },
+}
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.0/topics/cache/
+# При нескольких процессах-воркерах используйте общий файловый кэш:
+# CACHE_BACKEND=django.core.cache.backends.filebased.FileBasedCache, CACHE_LOCATION=/var/tmp/trading_network
+
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', 'trading_network'),
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+        },
     }
 }
 
+# Время жизни закэшированных ответов API (секунды)
+RESPONSE_CACHE_TIMEOUT = int(os.getenv('RESPONSE_CACHE_TIMEOUT', 300))
+
+# Время жизни пользователя, закэшированного при JWT-аутентификации (секунды): изменения, которые не сбрасывают
+# кэш (queryset.update() или кэш в памяти другого процесса), действуют не позже чем через это время
+JWT_USER_CACHE_TIMEOUT = int(os.getenv('JWT_USER_CACHE_TIMEOUT', 60))
+
+# Время жизни закэшированного списка городов в фильтре админки (секунды)
+ADMIN_FACET_CACHE_TIMEOUT = int(os.getenv('ADMIN_FACET_CACHE_TIMEOUT', 600))
+
+# Начиная с этого числа строк списки админки без фильтров показывают оценку количества из статистики PostgreSQL
+ADMIN_COUNT_ESTIMATE_THRESHOLD = int(os.getenv('ADMIN_COUNT_ESTIMATE_THRESHOLD', 100000))
+
+# Очистка задолженности из админки: размер пачки (одна транзакция) и способ запуска задания -
+# thread (фоновый поток веб-процесса) или command (python manage.py process_debt_jobs)
+DEBT_CLEAR_CHUNK_SIZE = int(os.getenv('DEBT_CLEAR_CHUNK_SIZE', 1000))
+DEBT_JOB_RUNNER = os.getenv('DEBT_JOB_RUNNER', 'thread')
+# Задание в статусе running без обработанных пачек дольше этого времени (секунды) считается зависшим
+# (например, веб-процесс перезапущен во время выполнения) и продолжается командой process_debt_jobs
+DEBT_JOB_STALE_SECONDS = int(os.getenv('DEBT_JOB_STALE_SECONDS', 600))
+# Снимки балансов журнала делаются не позже чем за это время (секунды) до текущего момента: проводка получает время
+# до фиксации своей транзакции, поэтому отставание должно быть больше самой долгой транзакции с проводками
+DEBT_SNAPSHOT_LAG_SECONDS = int(os.getenv('DEBT_SNAPSHOT_LAG_SECONDS', 300))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
@@ -140,7 +238,7 @@ REST_FRAMEWORK = {
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 10,
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'users.authentication.CachedJWTAuthentication',
     ),
     'DEFAULT_FILTER_BACKENDS': (
         'django_filters.rest_framework.DjangoFilterBackend',
@@ -151,6 +249,9 @@ REST_FRAMEWORK = {
     'TEST_REQUEST_DEFAULT_FORMAT': 'json',
 }
 
+# Максимальный размер страницы, который клиент может запросить параметром page_size
+MAX_PAGE_SIZE = int(os.getenv('MAX_PAGE_SIZE', 1000))
+
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(hours=5),
     'REFRESH_TOKEN_LIFETIME': timedelta(days=1),
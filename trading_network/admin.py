@@ -1,28 +1,75 @@
+from django.conf import settings
 from django.contrib import admin, messages
+from django.contrib.admin.widgets import AutocompleteSelect, AutocompleteSelectMultiple
+from django.contrib.postgres.expressions import ArraySubquery
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db.models import Count, Exists, OuterRef, Subquery
 from django.urls import reverse
 from django.utils.html import format_html
-from django.utils.translation import ngettext
 
 from trading_network.forms import LinkAdminForm
-from trading_network.models import Link, Product, Contact
+from trading_network.jobs import enqueue_clean_debt
+from trading_network.models import DebtClearJob, DebtClearRecord, DebtTransaction, Link, Product, Contact
+from trading_network.paginators import EstimatedCountPaginator
 
 
 @admin.action(description='Очистить задолженность перед поставщиками у выбранных объектов')
 def clean_debt(modeladmin, request, queryset):
-    updated = queryset.update(debt=None)
-    print(updated)
+    job = enqueue_clean_debt(queryset, request.user if request.user.is_authenticated else None)
+    url = reverse('admin:trading_network_debtclearjob_change', args=[job.pk])
     modeladmin.message_user(
         request,
-        ngettext(
-            "%d задолженность успешно очищена",
-            "%d задолженности успешно очищены",
-            updated,
-        )
-        % updated,
+        format_html(
+            'Очистка задолженности у {} звеньев поставлена в очередь: <a href="{}">задание №{}</a>',
+            job.total, url, job.pk,
+        ),
         messages.SUCCESS,
     )
 
 
+class CityListFilter(admin.SimpleListFilter):
+    """Фильтр по городу контактов: список городов кэшируется, отбор звеньев - EXISTS по индексу (city, link)"""
+    title = 'Город'
+    parameter_name = 'city'
+    cache_key = 'trading_network:admin:cities'
+
+    def lookups(self, request, model_admin):
+        cities = cache.get(self.cache_key)
+        if cities is None:
+            cities = list(Contact.objects.order_by('city').values_list('city', flat=True).distinct())
+            cache.set(self.cache_key, cities, settings.ADMIN_FACET_CACHE_TIMEOUT)
+        return [(city, city) for city in cities]
+
+    def queryset(self, request, queryset):
+        if self.value() is None:
+            return queryset
+        return queryset.filter(Exists(Contact.objects.filter(link=OuterRef('pk'), city=self.value())))
+
+
+class ValidChoicesMixin:
+    """Автокомплит, который при повторном показе невалидной формы пропускает некорректные id вместо ошибки"""
+
+    def optgroups(self, name, value, attr=None):
+        pk = self.field.remote_field.model._meta.pk
+        valid = []
+        for item in value:
+            try:
+                pk.to_python(item)
+            except ValidationError:
+                continue
+            valid.append(item)
+        return super().optgroups(name, valid, attr)
+
+
+class LinkAutocompleteSelect(ValidChoicesMixin, AutocompleteSelect):
+    pass
+
+
+class LinkAutocompleteSelectMultiple(ValidChoicesMixin, AutocompleteSelectMultiple):
+    pass
+
+
 class ContactInline(admin.StackedInline):
     model = Contact
     extra = 0
@@ -33,33 +80,61 @@ class ContactInline(admin.StackedInline):
 @admin.register(Link)
 class LinkAdmin(admin.ModelAdmin):
     list_display = ('id', 'name', 'supplier_link', 'level', 'debt', 'created_at')
-    list_filter = ('contact__city',)
+    list_filter = (CityListFilter,)
     list_display_links = ('id', 'name')
-    filter_horizontal = ('products', )
+    list_select_related = ('supplier',)
+    search_fields = ('name',)
+    autocomplete_fields = ('supplier', 'products')
     readonly_fields = ('level', 'created_at')
     inlines = [ContactInline]
     actions = [clean_debt]
     form = LinkAdminForm
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
 
     def supplier_link(self, obj):
         # Возвращает ссылку на поставщика
-        if obj.supplier:
-            link = reverse('admin:trading_network_link_change', args=[obj.supplier.id])
+        if obj.supplier_id:
+            link = reverse('admin:trading_network_link_change', args=[obj.supplier_id])
             return format_html('<a href="{}">{}</a>', link, obj.supplier)
         else:
             return None
 
     supplier_link.short_description = 'ссылка на «Поставщика»'
 
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        if db_field.name in self.autocomplete_fields:
+            kwargs['widget'] = LinkAutocompleteSelect(db_field, self.admin_site, using=kwargs.get('using'))
+        return super().formfield_for_foreignkey(db_field, request, **kwargs)
+
+    def formfield_for_manytomany(self, db_field, request, **kwargs):
+        if db_field.name in self.autocomplete_fields:
+            kwargs['widget'] = LinkAutocompleteSelectMultiple(db_field, self.admin_site, using=kwargs.get('using'))
+        return super().formfield_for_manytomany(db_field, request, **kwargs)
+
 
 @admin.register(Product)
 class ProductAdmin(admin.ModelAdmin):
     list_display = ('id', 'name', 'model', 'date', 'supplier_list')
     list_display_links = ('id', 'name')
+    search_fields = ('name', 'model')
     readonly_fields = ('supplier_list',)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    supplier_list_limit = 10
+
+    def get_queryset(self, request):
+        # Первые названия звеньев и их общее число считаются подзапросами для всей страницы сразу
+        links = Link.objects.filter(products=OuterRef('pk'))
+        return super().get_queryset(request).annotate(
+            supplier_names=ArraySubquery(links.order_by('name').values('name')[:self.supplier_list_limit]),
+            supplier_count=Subquery(links.order_by().values('products').annotate(count=Count('pk')).values('count')),
+        )
 
     def supplier_list(self, obj):
-        return ', '.join([link.name for link in obj.link_set.all()])
+        names = getattr(obj, 'supplier_names', None) or []
+        rest = (getattr(obj, 'supplier_count', None) or 0) - len(names)
+        return f'{", ".join(names)} и еще {rest}' if rest > 0 else ', '.join(names)
 
     supplier_list.short_description = 'Список поставщиков использующих продукт'
 
@@ -67,4 +142,71 @@ class ProductAdmin(admin.ModelAdmin):
 @admin.register(Contact)
 class ContactAdmin(admin.ModelAdmin):
     list_display = ('email', 'link')
+    list_select_related = ('link',)
+    search_fields = ('email', 'city')
     readonly_fields = ('link',)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+
+@admin.register(DebtClearJob)
+class DebtClearJobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'status', 'progress', 'cleared_total', 'created_by', 'created_at', 'finished_at')
+    list_filter = ('status',)
+    list_select_related = ('created_by',)
+    readonly_fields = ('status', 'progress', 'total', 'processed', 'cleared_total', 'created_by', 'created_at',
+                       'started_at', 'finished_at', 'error', 'records_link')
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def progress(self, obj):
+        percent = obj.processed * 100 // obj.total if obj.total else 100
+        return f'{obj.processed} / {obj.total} ({percent}%)'
+
+    progress.short_description = 'Прогресс'
+
+    def records_link(self, obj):
+        url = reverse('admin:trading_network_debtclearrecord_changelist')
+        return format_html('<a href="{}?job__id__exact={}">Записи задания</a>', url, obj.pk)
+
+    records_link.short_description = 'Аудит'
+
+
+@admin.register(DebtClearRecord)
+class DebtClearRecordAdmin(admin.ModelAdmin):
+    list_display = ('job', 'link', 'debt', 'processed_at')
+    list_filter = ('job',)
+    list_select_related = ('job', 'link')
+    readonly_fields = ('job', 'link', 'debt', 'processed_at')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(DebtTransaction)
+class DebtTransactionAdmin(admin.ModelAdmin):
+    list_display = ('id', 'link', 'kind', 'amount', 'comment', 'created_at')
+    list_filter = ('kind',)
+    list_select_related = ('link',)
+    search_fields = ('link__name',)
+    readonly_fields = ('link', 'kind', 'amount', 'comment', 'created_at')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
@@ -1,6 +1,13 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
 
 
 class TradingNetworkConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'trading_network'
+
+    def ready(self):
+        import trading_network.signals  # noqa: F401
+        from trading_network import instrumentation
+
+        connection_created.connect(instrumentation.install, dispatch_uid='trading_network.instrumentation')
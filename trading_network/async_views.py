@@ -0,0 +1,166 @@
+from abc import ABC, abstractmethod
+
+from django.contrib.auth.models import AnonymousUser
+from django.core.paginator import InvalidPage, Paginator
+from django.http import HttpResponse
+from django.views import View
+from django_filters.utils import translate_validation
+from rest_framework.exceptions import APIException, NotAuthenticated, NotFound, ValidationError
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from trading_network.filters import LinkFilter
+from trading_network.models import Contact, Link, Product
+from trading_network.paginators import KeysetPagination, LinkPagination, OptionalCursorPagination
+from trading_network.serializers import ContactSerializer, LinkReadSerializer, ProductSerializer
+from users.authentication import CachedJWTAuthentication
+
+
+class AsyncReadView(View, ABC):
+    """Асинхронное представление на чтение поверх async ORM, под ASGI не занимает поток на время запроса
+
+    Аутентификация, формат ошибок, фильтры, навигация по номеру страницы и вывод совпадают
+    с синхронными DRF-представлениями. Ответы не кэшируются, навигация по курсору не поддерживается.
+    """
+    http_method_names = ['get', 'head', 'options']
+    queryset = None
+    serializer_class = None
+    filterset_class = None
+    pagination_class = OptionalCursorPagination
+    authentication = CachedJWTAuthentication()
+    renderer = JSONRenderer()
+    read_replica = True
+
+    async def get(self, request, *args, **kwargs):
+        try:
+            user = await self.authenticate(request)
+            if not user.is_authenticated:
+                raise NotAuthenticated()
+            data = await self.get_data(request, *args, **kwargs)
+        except APIException as exc:
+            return self.handle_exception(request, exc)
+        return self.render(data)
+
+    @abstractmethod
+    async def get_data(self, request, *args, **kwargs):
+        """Данные ответа (список или страница с результатами); ошибки - исключения APIException"""
+
+    async def authenticate(self, request):
+        # как у синхронных представлений - только JWT: без токена запрос анонимный, даже с cookie сессии
+        result = await self.authentication.aauthenticate(request)
+        request.user = result[0] if result is not None else AnonymousUser()
+        return request.user
+
+    def get_queryset(self):
+        queryset = self.queryset.all()
+        if hasattr(self.serializer_class, 'setup_eager_loading'):
+            queryset = self.serializer_class.setup_eager_loading(queryset)
+        return queryset
+
+    def handle_exception(self, request, exc):
+        # как rest_framework.views.exception_handler: 401 с WWW-Authenticate, detail-словарь как есть
+        data = exc.detail if isinstance(exc.detail, (list, dict)) else {'detail': exc.detail}
+        response = self.render(data, exc.status_code)
+        if exc.status_code == 401:
+            response['WWW-Authenticate'] = self.authentication.authenticate_header(request)
+        return response
+
+    def render(self, data, status=200):
+        return HttpResponse(self.renderer.render(data), status=status, content_type=self.renderer.media_type)
+
+
+class AsyncListView(AsyncReadView):
+    async def get_data(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(request, self.get_queryset())
+        if not queryset.ordered:
+            queryset = queryset.order_by('pk')
+        page = await self.paginate_queryset(request, queryset)
+        data = self.serializer_class([obj async for obj in page.object_list], many=True).data
+        return {
+            'count': page.paginator.count,
+            'next': self.get_page_link(request, page.next_page_number() if page.has_next() else None),
+            'previous': self.get_page_link(request, page.previous_page_number() if page.has_previous() else None),
+            'results': data,
+        }
+
+    def filter_queryset(self, request, queryset):
+        if self.filterset_class is None:
+            return queryset
+        filterset = self.filterset_class(request.GET, queryset=queryset, request=request)
+        if not filterset.is_valid():
+            raise translate_validation(filterset.errors)
+        return filterset.qs
+
+    async def paginate_queryset(self, request, queryset):
+        pagination = self.pagination_class
+        if request.GET.get('pagination') == 'cursor' or KeysetPagination.cursor_query_param in request.GET:
+            raise ValidationError({'pagination': ['Навигация по курсору доступна только в синхронных представлениях']})
+
+        page_size = pagination.page_size
+        try:
+            requested = int(request.GET[pagination.page_size_query_param])
+            if requested > 0:
+                page_size = min(requested, pagination.max_page_size)
+        except (KeyError, ValueError):
+            pass
+
+        paginator = Paginator(queryset, page_size)
+        # COUNT(*) выполняется заранее через async ORM, страница - ленивый срез queryset
+        paginator.count = await queryset.acount()
+        number = request.GET.get(pagination.page_query_param) or 1
+        if number in pagination.last_page_strings:
+            number = paginator.num_pages
+        try:
+            return paginator.page(number)
+        except InvalidPage as exc:
+            raise NotFound(pagination.invalid_page_message.format(page_number=number, message=str(exc)))
+
+    def get_page_link(self, request, number):
+        if number is None:
+            return None
+        url = request.build_absolute_uri()
+        if number == 1:
+            return remove_query_param(url, self.pagination_class.page_query_param)
+        return replace_query_param(url, self.pagination_class.page_query_param, number)
+
+
+class AsyncRetrieveView(AsyncReadView):
+    async def get_data(self, request, *args, **kwargs):
+        model = self.queryset.model
+        try:
+            obj = await self.get_queryset().aget(pk=kwargs['pk'])
+        except model.DoesNotExist:
+            raise NotFound(f'No {model._meta.object_name} matches the given query.')
+        return self.serializer_class(obj).data
+
+
+class LinkListView(AsyncListView):
+    queryset = Link.objects.all()
+    serializer_class = LinkReadSerializer
+    filterset_class = LinkFilter
+    pagination_class = LinkPagination
+
+
+class LinkRetrieveView(AsyncRetrieveView):
+    queryset = Link.objects.all()
+    serializer_class = LinkReadSerializer
+
+
+class ProductListView(AsyncListView):
+    queryset = Product.objects.all()
+    serializer_class = ProductSerializer
+
+
+class ProductRetrieveView(AsyncRetrieveView):
+    queryset = Product.objects.all()
+    serializer_class = ProductSerializer
+
+
+class ContactListView(AsyncListView):
+    queryset = Contact.objects.all()
+    serializer_class = ContactSerializer
+
+
+class ContactRetrieveView(AsyncRetrieveView):
+    queryset = Contact.objects.all()
+    serializer_class = ContactSerializer
@@ -0,0 +1,120 @@
+import statistics
+from dataclasses import dataclass, field
+
+from django.urls import URLResolver, get_resolver
+from django.utils import timezone
+
+from trading_network.models import Contact, Link
+
+NAMESPACES = ('trading_network', 'users')
+BENCH_PASSWORD = 'benchmark-password'
+
+
+@dataclass
+class Fixtures:
+    """Звенья и объекты существующей сети, на которых измеряются эндпоинты"""
+    factory: int
+    retail: int
+    entrepreneur: int
+    catalog: list
+    product: int
+    contact: int
+    search: str
+    email: str = ''
+    refresh: str = ''
+
+
+@dataclass
+class Case:
+    method: str
+    args: list = field(default_factory=list)
+    data: object = None
+
+
+def endpoint_names():
+    """Имена всех маршрутов trading_network и users в порядке объявления, без повторов суффиксов формата"""
+    names = []
+    for resolver in get_resolver().url_patterns:
+        if isinstance(resolver, URLResolver) and resolver.namespace in NAMESPACES:
+            for pattern in resolver.url_patterns:
+                name = f'{resolver.namespace}:{pattern.name}'
+                if pattern.name and name not in names:
+                    names.append(name)
+    return names
+
+
+def load_fixtures():
+    """Выбор звена самого нижнего уровня и его поставщиков; None, если сеть пуста"""
+    leaf = (Link.objects.filter(level=2).order_by('-pk').first()
+            or Link.objects.filter(level=1).order_by('-pk').first())
+    if leaf is None:
+        return None
+    ancestors = leaf.ancestor_ids
+    catalog = list(leaf.supplier.products.order_by('pk').values_list('pk', flat=True)[:3])
+    contact = Contact.objects.filter(link=leaf).values_list('pk', flat=True).first()
+    return Fixtures(
+        factory=ancestors[0], retail=ancestors[-1], entrepreneur=leaf.pk, catalog=catalog,
+        product=catalog[0] if catalog else None,
+        contact=contact or Contact.objects.values_list('pk', flat=True).first(),
+        # начало названия звена, как при поиске по части названия
+        search=leaf.name[:-1] or leaf.name,
+    )
+
+
+def link_payload(fixtures, name):
+    return {
+        'status_link': 'entrepreneur', 'supplier': fixtures.retail, 'name': name, 'products': fixtures.catalog[:2],
+        'contact': [{'email': 'bench@example.com', 'country': 'Russia', 'city': 'Moscow', 'street': 'Main',
+                     'num_house': '1'}],
+    }
+
+
+CASES = {
+    'trading_network:link': lambda f: Case('get', [f.entrepreneur]),
+    'trading_network:link_tree': lambda f: Case('get', [f.factory]),
+    'trading_network:link_ancestors': lambda f: Case('get', [f.entrepreneur]),
+    'trading_network:link_list': lambda f: Case('get'),
+    'trading_network:link_export': lambda f: Case('get', data={'output': 'ndjson', 'level': '0'}),
+    'trading_network:link_debt': lambda f: Case('get', data={'group_by': 'root,level'}),
+    'trading_network:link_create': lambda f: Case('post', data=link_payload(f, 'benchmark link')),
+    'trading_network:link_bulk': lambda f: Case('post', data=[link_payload(f, f'benchmark {i}') for i in range(10)]),
+    'trading_network:link_update': lambda f: Case('patch', [f.entrepreneur], {'name': 'benchmark renamed'}),
+    'trading_network:link_catalog_prune': lambda f: Case('post', [f.factory], {'dry_run': True}),
+    'trading_network:link_ledger': lambda f: Case('get', [f.retail]),
+    'trading_network:link_balance': lambda f: Case('get', [f.retail], {'as_of': timezone.now().isoformat()}),
+    'trading_network:link_delete': lambda f: Case('delete', [f.entrepreneur]),
+    'trading_network:async_link_list': lambda f: Case('get'),
+    'trading_network:async_link': lambda f: Case('get', [f.entrepreneur]),
+    'trading_network:async_product_list': lambda f: Case('get'),
+    'trading_network:async_product': lambda f: Case('get', [f.product]),
+    'trading_network:async_contact_list': lambda f: Case('get'),
+    'trading_network:async_contact': lambda f: Case('get', [f.contact]),
+    'trading_network:search': lambda f: Case('get', data={'q': f.search}),
+    'trading_network:metrics': lambda f: Case('get'),
+    'trading_network:profile_list': lambda f: Case('get'),
+    'trading_network:api-root': lambda f: Case('get'),
+    'trading_network:contact-list': lambda f: Case('get'),
+    'trading_network:contact-detail': lambda f: Case('get', [f.contact]),
+    'trading_network:product-list': lambda f: Case('get'),
+    'trading_network:product-detail': lambda f: Case('get', [f.product]),
+    'users:register': lambda f: Case('post', data={'email': 'benchmark-register@example.com', 'password': 'x'}),
+    'users:token_obtain_pair': lambda f: Case('post', data={'email': f.email, 'password': BENCH_PASSWORD}),
+    'users:token_refresh': lambda f: Case('post', data={'refresh': f.refresh}),
+}
+
+
+def percentile(values, share):
+    """Перцентиль по ближайшему рангу, values отсортированы"""
+    return values[min(int(len(values) * share), len(values) - 1)]
+
+
+def summarize(latencies):
+    """Сводка задержек в миллисекундах"""
+    latencies = sorted(latency * 1000 for latency in latencies)
+    return {
+        'mean': round(statistics.mean(latencies), 3),
+        'p50': round(percentile(latencies, 0.5), 3),
+        'p95': round(percentile(latencies, 0.95), 3),
+        'p99': round(percentile(latencies, 0.99), 3),
+        'min': round(latencies[0], 3),
+    }
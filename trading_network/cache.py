@@ -0,0 +1,70 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.cache import get_conditional_response
+from django.utils.http import quote_etag
+from rest_framework.response import Response
+
+VERSION_KEY = 'trading_network:version:{}'
+
+
+def get_versions(namespaces):
+    """Текущие версии пространств кэша, версия - время последнего изменения в наносекундах"""
+    keys = [VERSION_KEY.format(namespace) for namespace in namespaces]
+    versions = cache.get_many(keys)
+    missing = {key: time.time_ns() for key in keys if key not in versions}
+    if missing:
+        cache.set_many(missing, timeout=None)
+        versions.update(missing)
+    return [versions[key] for key in keys]
+
+
+def bump_versions(*namespaces):
+    cache.set_many({VERSION_KEY.format(namespace): time.time_ns() for namespace in namespaces}, timeout=None)
+
+
+def invalidate(*namespaces):
+    """Сброс кэша ответов сразу и повторно после фиксации транзакции,
+    чтобы ответ, собранный по еще не зафиксированным данным, не остался в кэше"""
+    bump_versions(*namespaces)
+    transaction.on_commit(lambda: bump_versions(*namespaces))
+
+
+class CachedResponseMixin:
+    """Кэширование ответов list/retrieve с ETag
+
+    Ключ кэша включает версии пространств cache_namespaces, которые сбрасываются
+    сигналами изменения моделей (trading_network.signals), поэтому устаревшие записи не читаются.
+    Last-Modified не отдается: он с точностью до секунды, и изменение в ту же секунду давало бы 304.
+    """
+    cache_namespaces = ('link', 'product', 'contact')
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(request, lambda: super(CachedResponseMixin, self).list(request, *args, **kwargs))
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(
+            request, lambda: super(CachedResponseMixin, self).retrieve(request, *args, **kwargs))
+
+    def cached_response(self, request, get_response):
+        versions = get_versions(self.cache_namespaces)
+        key = hashlib.md5(f'{request.get_full_path()}:{versions}'.encode()).hexdigest()
+        etag = quote_etag(f'{key}-{request.accepted_renderer.format}')
+
+        not_modified = get_conditional_response(request, etag=etag)
+        if not_modified is not None:
+            return not_modified
+
+        cache_key = f'trading_network:response:{key}'
+        data = cache.get(cache_key)
+        if data is None:
+            response = get_response()
+            if response.status_code == 200:
+                cache.set(cache_key, response.data, settings.RESPONSE_CACHE_TIMEOUT)
+        else:
+            response = Response(data)
+        response['ETag'] = etag
+        return response
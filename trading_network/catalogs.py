@@ -0,0 +1,33 @@
+from django.db.models import Q
+
+from trading_network.cache import invalidate
+from trading_network.models import Link
+
+
+def prune_descendant_catalogs(removed, dry_run=False):
+    """Удаление продуктов, исключенных из каталога звена, из каталогов всего его поддерева
+
+    removed - {звено: id исключенных продуктов}, None вместо списка id - все продукты, которых нет
+    в каталоге звена. Строки through-таблицы удаляются одним DELETE по индексу path,
+    dry_run=True только возвращает число строк, которые будут удалены.
+    """
+    LinkProduct = Link.products.through
+    scope = Q()
+    for link, product_ids in removed.items():
+        if product_ids is None:
+            products = ~Q(product_id__in=LinkProduct.objects.filter(link_id=link.pk).values('product_id'))
+        elif product_ids:
+            products = Q(product_id__in=product_ids)
+        else:
+            continue
+        scope |= Q(link__path__startswith=link.descendants_prefix) & products
+    if not scope:
+        return 0
+
+    rows = LinkProduct.objects.filter(scope)
+    if dry_run:
+        return rows.count()
+    deleted, _ = rows.delete()
+    if deleted:
+        invalidate('link')
+    return deleted
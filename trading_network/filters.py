@@ -1,12 +1,40 @@
+from django.db.models import Exists, OuterRef
 from django_filters import rest_framework as filters
 
-from trading_network.models import Link
+from trading_network.models import Contact, Link
+
+
+class CharInFilter(filters.BaseInFilter, filters.CharFilter):
+    pass
+
+
+class NumberInFilter(filters.BaseInFilter, filters.NumberFilter):
+    pass
 
 
 class LinkFilter(filters.FilterSet):
-    """Осуществление фильтрации объектов Link по стране"""
-    country = filters.CharFilter(field_name='contact__country', lookup_expr='exact', label='Country')
+    """Осуществление фильтрации объектов Link по стране и городу контактов, уровню, типу звена,
+    продукту, задолженности и времени создания. Списки значений передаются через запятую.
+
+    Фильтры по контактам и продуктам выполняются через EXISTS, поэтому звенья не дублируются.
+    """
+    country = CharInFilter(method='filter_contact', label='Country')
+    city = CharInFilter(method='filter_contact', label='City')
+    level = NumberInFilter(field_name='level', lookup_expr='in', label='Level')
+    status_link = CharInFilter(field_name='status_link', lookup_expr='in', label='Status link')
+    product = NumberInFilter(method='filter_product', label='Product')
+    debt = filters.RangeFilter(field_name='debt', label='Debt')
+    created_at = filters.IsoDateTimeFromToRangeFilter(field_name='created_at', label='Created at')
+    ordering = filters.OrderingFilter(fields=('debt', 'level', 'created_at', 'id'))
 
     class Meta:
         model = Link
-        fields = ['country']
+        fields = ['country', 'city', 'level', 'status_link', 'product', 'debt', 'created_at']
+
+    def filter_contact(self, queryset, name, value):
+        contacts = Contact.objects.filter(link=OuterRef('pk'), **{f'{name}__in': value})
+        return queryset.filter(Exists(contacts))
+
+    def filter_product(self, queryset, name, value):
+        products = Link.products.through.objects.filter(link=OuterRef('pk'), product__in=value)
+        return queryset.filter(Exists(products))
@@ -1,7 +1,7 @@
 from django import forms
-from django.utils.translation import ngettext
 
 from trading_network.models import Link
+from trading_network.validators import SupplierCatalog, SupplierCycleValidator, foreign_products_message
 
 
 class LinkAdminForm(forms.ModelForm):
@@ -20,18 +20,12 @@ class LinkAdminForm(forms.ModelForm):
             raise forms.ValidationError('У завода не может быть Поставщика / Задолженности перед поставщиком')
         if supplier is None and status_link != 'factory':
             raise forms.ValidationError('Без поставщика может быть только Завод')
-        if supplier:
-            supplier_products = supplier.products.all()
-            products = [product.name for product in product_list if product not in supplier_products]
+        if supplier and product_list:
+            products = SupplierCatalog().missing_products(supplier, product_list)
             if products:
-                raise forms.ValidationError(
-                    ngettext(
-                        "Продукт %s не принадлежит поставщику %s",
-                        "Продукты %s не принадлежат поставщику %s",
-                        len(products),
-                    )
-                    % (', '.join(products), supplier.name)
-                )
+                raise forms.ValidationError(foreign_products_message(products, supplier))
+        if self.instance.is_supplier_cycle(supplier):
+            raise forms.ValidationError(SupplierCycleValidator.message)
         if supplier and supplier.level == 2:
             raise forms.ValidationError('Иерархическая структура не может состоять более чем из 3 уровней')
         return cleaned_data
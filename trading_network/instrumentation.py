@@ -0,0 +1,60 @@
+import time
+from collections import Counter
+from contextvars import ContextVar
+
+_stats = ContextVar('sql_stats', default=None)
+
+
+class QueryStats:
+    """SQL-запросы одного запроса: число, суммарное время, повторы и медленные выражения"""
+
+    def __init__(self, slow_query_ms):
+        self.slow_query = slow_query_ms / 1000
+        self.count = 0
+        self.duration = 0.0
+        self.statements = Counter()
+        self.slow = []
+
+    def add(self, sql, duration):
+        self.count += 1
+        self.duration += duration
+        self.statements[sql] += 1
+        if duration >= self.slow_query:
+            self.slow.append((sql, duration))
+
+    @property
+    def duplicates(self):
+        """Выражения, выполненные больше одного раза (обычно N+1), и число лишних выполнений"""
+        return {sql: count for sql, count in self.statements.items() if count > 1}
+
+    @property
+    def duplicated(self):
+        return sum(count - 1 for count in self.duplicates.values())
+
+
+def begin(slow_query_ms):
+    """Учет запросов к базе для текущего запроса и токен для его сброса"""
+    stats = QueryStats(slow_query_ms)
+    return stats, _stats.set(stats)
+
+
+def reset(token):
+    _stats.reset(token)
+
+
+def record(execute, sql, params, many, context):
+    """execute_wrapper: время выражения учитывается, если для запроса включен учет (begin)"""
+    stats = _stats.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.add(sql, time.perf_counter() - started)
+
+
+def install(sender, connection, **kwargs):
+    """Обработчик connection_created: record ставится на каждое соединение один раз"""
+    if record not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record)
@@ -0,0 +1,136 @@
+import logging
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, connections, transaction
+from django.db.models import Exists, F, OuterRef
+from django.utils import timezone
+
+from trading_network import ledger, rollups
+from trading_network.cache import invalidate
+from trading_network.models import DebtClearJob, DebtClearRecord, DebtTransaction, Link
+
+logger = logging.getLogger(__name__)
+
+
+def enqueue_clean_debt(queryset, user=None):
+    """Постановка в очередь очистки задолженности звеньев queryset
+
+    Звенья с задолженностью копируются в записи задания одним INSERT ... SELECT, без блокировки звеньев.
+    Выполнение запускается после фиксации транзакции (см. start).
+    """
+    with transaction.atomic():
+        job = DebtClearJob.objects.create(created_by=user)
+        sql, params = queryset.filter(debt__isnull=False).values('pk').query.sql_with_params()
+        quote = connection.ops.quote_name
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {quote(DebtClearRecord._meta.db_table)} ({quote("job_id")}, {quote("link_id")}) '
+                f'SELECT %s, {quote("id")} FROM ({sql}) AS selection',
+                [job.pk, *params],
+            )
+            job.total = cursor.rowcount
+        job.save(update_fields=['total'])
+        transaction.on_commit(lambda: start(job.pk))
+    return job
+
+
+def start(job_id):
+    """DEBT_JOB_RUNNER='thread' - задание выполняется в фоновом потоке процесса,
+    'command' - командой process_debt_jobs"""
+    if settings.DEBT_JOB_RUNNER == 'thread':
+        threading.Thread(target=_run_in_thread, args=(job_id,), name=f'debt-clear-{job_id}', daemon=True).start()
+
+
+def _run_in_thread(job_id):
+    try:
+        run(job_id)
+    except Exception:
+        logger.exception('Задание очистки задолженности %s завершилось с ошибкой', job_id)
+    finally:
+        connections.close_all()
+
+
+def run(job_id, resume=False, chunk_size=None):
+    """Выполнение задания пачками по chunk_size звеньев, каждая пачка - отдельная короткая транзакция
+
+    Задание со статусом pending захватывается одним исполнителем; resume=True продолжает прерванное
+    или завершившееся ошибкой задание с первой необработанной записи.
+    """
+    statuses = [DebtClearJob.Status.RUNNING, DebtClearJob.Status.FAILED] if resume else [DebtClearJob.Status.PENDING]
+    claimed = DebtClearJob.objects.filter(pk=job_id, status__in=statuses).update(
+        status=DebtClearJob.Status.RUNNING, started_at=timezone.now(), error='',
+    )
+    if not claimed:
+        return False
+    return _execute(job_id, chunk_size)
+
+
+def _execute(job_id, chunk_size=None):
+    chunk_size = chunk_size or settings.DEBT_CLEAR_CHUNK_SIZE
+    try:
+        while _clear_chunk(job_id, chunk_size):
+            pass
+    except Exception as exc:
+        DebtClearJob.objects.filter(pk=job_id).update(status=DebtClearJob.Status.FAILED, error=str(exc))
+        raise
+    DebtClearJob.objects.filter(pk=job_id).update(status=DebtClearJob.Status.DONE, finished_at=timezone.now())
+    return True
+
+
+def _clear_chunk(job_id, chunk_size):
+    with transaction.atomic():
+        # skip_locked: при повторном запуске прерванного задания пачки не обрабатываются дважды
+        pending = DebtClearRecord.objects.select_for_update(skip_locked=True)
+        records = list(pending.filter(job_id=job_id, processed_at__isnull=True).order_by('pk')[:chunk_size])
+        if not records:
+            return False
+
+        # блокируются только звенья пачки и только до конца ее транзакции
+        links = Link.objects.filter(pk__in=[record.link_id for record in records])
+        debts = dict(links.select_for_update().filter(debt__isnull=False).values_list('pk', 'debt'))
+        indebted = links.filter(pk__in=list(debts))
+        rollups.apply_queryset(indebted, -1)
+        indebted.update(debt=None)
+        ledger.record_many({link_id: -debt for link_id, debt in debts.items()}, DebtTransaction.Kind.CLEAR)
+
+        processed_at = timezone.now()
+        for record in records:
+            record.debt = debts.get(record.link_id)
+            record.processed_at = processed_at
+        DebtClearRecord.objects.bulk_update(records, ['debt', 'processed_at'])
+        DebtClearJob.objects.filter(pk=job_id).update(
+            processed=F('processed') + len(records),
+            cleared_total=F('cleared_total') + sum(debts.values()),
+        )
+        if debts:
+            invalidate('link')
+    return True
+
+
+def stale_jobs():
+    """Задания со статусом running без обработанных пачек за последние DEBT_JOB_STALE_SECONDS секунд:
+    их исполнитель (поток веб-процесса или команда) остановился, не завершив задание"""
+    cutoff = timezone.now() - timedelta(seconds=settings.DEBT_JOB_STALE_SECONDS)
+    recent = DebtClearRecord.objects.filter(job=OuterRef('pk'), processed_at__gte=cutoff)
+    running = DebtClearJob.objects.filter(status=DebtClearJob.Status.RUNNING, started_at__lt=cutoff)
+    return running.exclude(Exists(recent))
+
+
+def reclaim(job):
+    """Захват зависшего задания: время запуска сравнивается с прочитанным, поэтому задание продолжает
+    только один исполнитель"""
+    return DebtClearJob.objects.filter(pk=job.pk, status=DebtClearJob.Status.RUNNING,
+                                       started_at=job.started_at).update(started_at=timezone.now())
+
+
+def process_pending(chunk_size=None):
+    """Выполнение всех заданий в очереди и продолжение зависших, возвращает число выполненных"""
+    finished = 0
+    for job in list(stale_jobs().order_by('pk')):
+        if reclaim(job):
+            logger.warning('Задание очистки задолженности %s зависло и продолжено', job.pk)
+            finished += _execute(job.pk, chunk_size)
+    pending = DebtClearJob.objects.filter(status=DebtClearJob.Status.PENDING).order_by('pk')
+    return finished + sum(run(job_id, chunk_size=chunk_size) for job_id in list(pending.values_list('pk', flat=True)))
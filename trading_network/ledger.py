@@ -0,0 +1,101 @@
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import models, transaction
+from django.db.models import F, Max, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from trading_network import rollups
+from trading_network.cache import invalidate
+from trading_network.models import DebtSnapshot, DebtTransaction, Link
+
+ZERO = Decimal('0.00')
+
+
+def post(link_id, amount, kind=DebtTransaction.Kind.CHARGE, comment=''):
+    """Проводка по задолженности звена: запись в журнал и изменение баланса одним UPDATE с F-выражением
+
+    Строка звена блокируется до конца транзакции, поэтому одновременные проводки выполняются по очереди
+    и сводка задолженности пересчитывается по согласованным значениям.
+    """
+    with transaction.atomic():
+        if not Link.objects.select_for_update().filter(pk=link_id).exists():
+            raise Link.DoesNotExist
+        with rollups.track([link_id]):
+            entry = DebtTransaction.objects.create(link_id=link_id, amount=amount, kind=kind, comment=comment)
+            Link.objects.filter(pk=link_id).update(
+                debt=Coalesce(F('debt'), Value(ZERO)) + Value(amount, output_field=models.DecimalField()),
+            )
+        invalidate('link')
+    return entry
+
+
+def record_change(link_id, old, new, created=False):
+    """Запись в журнал изменения задолженности, сохраненного напрямую (админка, save модели)"""
+    amount = (new or ZERO) - (old or ZERO)
+    if amount:
+        kind = DebtTransaction.Kind.OPENING if created else DebtTransaction.Kind.ADJUSTMENT
+        DebtTransaction.objects.create(link_id=link_id, amount=amount, kind=kind)
+
+
+def record_many(balances, kind):
+    """Журнал для bulk-изменений баланса: {id звена: изменение задолженности}, одним INSERT"""
+    now = timezone.now()
+    DebtTransaction.objects.bulk_create(
+        DebtTransaction(link_id=link_id, amount=amount, kind=kind, created_at=now)
+        for link_id, amount in balances.items() if amount
+    )
+
+
+def balance(link_id, moment=None):
+    """Задолженность звена по журналу на момент moment (по умолчанию - текущая)
+
+    Последний снимок до moment и проводки после него читаются по индексам (звено, время),
+    поэтому число читаемых строк ограничено проводками между двумя снимками.
+    """
+    moment = moment or timezone.now()
+    entries = DebtTransaction.objects.filter(link_id=link_id, created_at__lte=moment)
+    opening = ZERO
+    snapshot = (DebtSnapshot.objects.filter(link_id=link_id, taken_at__lte=moment)
+                .order_by('-taken_at').values_list('taken_at', 'balance').first())
+    if snapshot is not None:
+        entries = entries.filter(created_at__gt=snapshot[0])
+        opening = snapshot[1]
+    return opening + entries.aggregate(total=Coalesce(Sum('amount'), Value(ZERO)))['total']
+
+
+def take_snapshot(moment=None, batch_size=2000):
+    """Снимок балансов на moment для звеньев с проводками после предыдущего снимка, возвращает число снимков
+
+    Снимки делаются только вперед по времени: moment должен быть позже последнего снимка и не позже
+    текущего момента минус DEBT_SNAPSHOT_LAG_SECONDS (по умолчанию - ровно этот момент). Иначе проводка
+    со временем до moment, зафиксированная после снимка, не попала бы ни в него, ни в следующий.
+    """
+    cutoff = timezone.now() - timedelta(seconds=settings.DEBT_SNAPSHOT_LAG_SECONDS)
+    moment = moment or cutoff
+    if moment > cutoff:
+        raise ValueError(f'Снимок на {moment} позже {cutoff}: проводки до этого момента могут быть не зафиксированы')
+    with transaction.atomic():
+        previous = DebtSnapshot.objects.aggregate(taken_at=Max('taken_at'))['taken_at']
+        if previous is not None and previous >= moment:
+            raise ValueError(f'Снимок на {moment} не позже последнего снимка ({previous})')
+
+        changes = DebtTransaction.objects.filter(created_at__lte=moment)
+        if previous is not None:
+            changes = changes.filter(created_at__gt=previous)
+        changes = dict(changes.values('link').annotate(delta=Sum('amount')).values_list('link', 'delta'))
+        # последний снимок каждого звена - коррелированный подзапрос по индексу (звено, время), работает не только
+        # в PostgreSQL, в отличие от DISTINCT ON
+        latest = DebtSnapshot.objects.filter(link=OuterRef('link')).order_by('-taken_at').values('taken_at')[:1]
+        balances = dict(
+            DebtSnapshot.objects.filter(link__in=list(changes), taken_at=Subquery(latest))
+            .values_list('link', 'balance')
+        ) if changes else {}
+        DebtSnapshot.objects.bulk_create(
+            (DebtSnapshot(link_id=link_id, taken_at=moment, balance=balances.get(link_id, ZERO) + delta)
+             for link_id, delta in changes.items()),
+            batch_size=batch_size,
+        )
+    return len(changes)
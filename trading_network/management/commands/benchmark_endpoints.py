@@ -0,0 +1,157 @@
+import json
+import platform
+import time
+import tracemalloc
+from pathlib import Path
+
+import django
+from django.conf import settings
+from django.core.management import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+
+from trading_network.benchmarks import BENCH_PASSWORD, CASES, endpoint_names, load_fixtures, summarize
+from trading_network.models import Contact, Link, Product
+from users.authentication import forget_users
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = ('Measure latency, query count and peak memory of every trading_network and users endpoint '
+            'against the current database, save the results as JSON and compare them with a previous run. '
+            'Requests run in a transaction that is rolled back, so writes leave no trace')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=20, help='timed requests per endpoint')
+        parser.add_argument('--warmup', type=int, default=2)
+        parser.add_argument('--only', action='append', metavar='NAME',
+                            help='URL name to measure (e.g. trading_network:link_list), may be repeated')
+        parser.add_argument('--cached', action='store_true', help='keep the response cache of read views')
+        parser.add_argument('--output', type=Path,
+                            help='result file, defaults to benchmarks/endpoints-<timestamp>.json')
+        parser.add_argument('--compare', type=Path, help='previous result file to compare with')
+        parser.add_argument('--threshold', type=float, default=0.25,
+                            help='relative p50 latency growth reported as a regression')
+        parser.add_argument('--fail-on-regression', action='store_true')
+
+    def handle(self, *args, **options):
+        fixtures = load_fixtures()
+        if fixtures is None:
+            raise CommandError('The network is empty, generate one with generate_network first')
+        names = endpoint_names()
+        if options['only']:
+            unknown = set(options['only']) - set(names)
+            if unknown:
+                raise CommandError(f'Unknown URL names: {", ".join(sorted(unknown))}')
+            names = options['only']
+
+        overrides = {'ALLOWED_HOSTS': [*settings.ALLOWED_HOSTS, 'testserver']}
+        if not options['cached']:
+            overrides['RESPONSE_CACHE_TIMEOUT'] = 0
+        results, skipped = {}, []
+        with override_settings(**overrides), transaction.atomic():
+            user = User.objects.create(email=f'benchmark-{time.time_ns()}@example.com', is_active=True,
+                                       is_staff=True, is_superuser=True)
+            user.set_password(BENCH_PASSWORD)
+            user.save()
+            fixtures.email, fixtures.refresh = user.email, str(RefreshToken.for_user(user))
+            self.client = APIClient()
+            self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(user)}')
+
+            for name in names:
+                if name not in CASES:
+                    skipped.append(name)
+                    self.stdout.write(self.style.WARNING(f'{name}: no benchmark case, skipped'))
+                    continue
+                results[name] = self.measure(name, CASES[name](fixtures), options['warmup'], options['repeat'])
+                self.report(name, results[name])
+            transaction.set_rollback(True)
+        forget_users(user.pk)
+
+        document = {
+            'created_at': timezone.now().isoformat(),
+            'environment': {
+                'python': platform.python_version(), 'django': django.get_version(), 'database': connection.vendor,
+                'links': Link.objects.count(), 'products': Product.objects.count(),
+                'contacts': Contact.objects.count(),
+            },
+            'repeat': options['repeat'],
+            'cached': options['cached'],
+            'results': results,
+            'skipped': skipped,
+        }
+        output = options['output'] or Path(settings.BASE_DIR) / 'benchmarks' / (
+            f'endpoints-{timezone.now():%Y%m%d-%H%M%S}.json')
+        output.parent.mkdir(parents=True, exist_ok=True)
+        output.write_text(json.dumps(document, indent=2))
+        self.stdout.write(self.style.SUCCESS(f'Results saved to {output}'))
+
+        if options['compare']:
+            regressions = self.compare(json.loads(options['compare'].read_text()), document, options['threshold'])
+            if regressions and options['fail_on_regression']:
+                raise CommandError(f'{len(regressions)} endpoints regressed: {", ".join(regressions)}')
+
+    def request(self, case, url):
+        # каждый запрос в своей точке сохранения: записи откатываются и не влияют на повторы
+        with transaction.atomic():
+            started = time.perf_counter()
+            response = getattr(self.client, case.method)(url, case.data, format='json')
+            if response.streaming:
+                b''.join(response.streaming_content)
+            elapsed = time.perf_counter() - started
+            transaction.set_rollback(True)
+        return response, elapsed
+
+    def measure(self, name, case, warmup, repeat):
+        url = reverse(name, args=case.args)
+        for _ in range(warmup):
+            self.request(case, url)
+
+        # запросы и память - в отдельном прогоне, чтобы их учет не искажал время
+        tracemalloc.start()
+        with CaptureQueriesContext(connection) as queries:
+            response, _ = self.request(case, url)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        # точки сохранения самого бенчмарка не считаются
+        queries = [query for query in queries.captured_queries if 'SAVEPOINT' not in query['sql']]
+
+        latencies = [self.request(case, url)[1] for _ in range(repeat)]
+        return {
+            'method': case.method.upper(),
+            'path': url,
+            'status': response.status_code,
+            'queries': len(queries),
+            'sql_ms': round(sum(float(query['time']) for query in queries) * 1000, 3),
+            'memory_peak_kb': round(peak / 1024, 1),
+            'latency_ms': summarize(latencies),
+        }
+
+    def report(self, name, result):
+        latency = result['latency_ms']
+        style = self.style.ERROR if result['status'] >= 400 else (lambda text: text)
+        self.stdout.write(style(
+            f'{name} {result["method"]} {result["status"]}: p50 {latency["p50"]:.1f} ms, p95 {latency["p95"]:.1f} ms, '
+            f'{result["queries"]} queries, peak {result["memory_peak_kb"]:.0f} KiB'
+        ))
+
+    def compare(self, baseline, current, threshold):
+        """Сравнение с предыдущим прогоном: рост p50 больше threshold или рост числа запросов - регрессия"""
+        regressions = []
+        for name, result in current['results'].items():
+            previous = baseline['results'].get(name)
+            if previous is None:
+                continue
+            old, new = previous['latency_ms']['p50'], result['latency_ms']['p50']
+            change = (new - old) / old if old else 0
+            regressed = change > threshold or result['queries'] > previous['queries']
+            line = (f'{name}: p50 {old:.1f} -> {new:.1f} ms ({change:+.0%}), '
+                    f'queries {previous["queries"]} -> {result["queries"]}')
+            self.stdout.write(self.style.ERROR(f'{line} REGRESSION') if regressed else line)
+            if regressed:
+                regressions.append(name)
+        return regressions
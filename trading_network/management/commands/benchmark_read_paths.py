@@ -0,0 +1,146 @@
+import asyncio
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from urllib.parse import urlsplit
+from wsgiref.util import setup_testing_defaults
+
+from django.core.asgi import get_asgi_application
+from django.core.management import BaseCommand, CommandError
+from django.core.wsgi import get_wsgi_application
+from django.db import connections
+from django.test.utils import override_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+from users.models import User
+
+DEFAULT_PATHS = [
+    ('/link/', '/async/link/'),
+    ('/product/', '/async/product/'),
+    ('/contact/', '/async/contact/'),
+]
+
+
+class Command(BaseCommand):
+    help = 'Compare throughput of the sync (WSGI, thread per request) and async (ASGI, one event loop) read paths'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=500, help='requests per path and mode')
+        parser.add_argument('--concurrency', type=int, default=20,
+                            help='WSGI threads of one worker / concurrent requests on one ASGI event loop')
+        parser.add_argument('--path', action='append', dest='paths', metavar='SYNC,ASYNC',
+                            help='pair of sync and async paths with the same output, may be repeated')
+        parser.add_argument('--user', help='email of the user to authenticate as, first active user by default')
+        parser.add_argument('--host', default='localhost', help='Host header, must be allowed by ALLOWED_HOSTS')
+        parser.add_argument('--cached', action='store_true',
+                            help='keep the response cache of sync views, disabled by default to compare database reads')
+
+    def handle(self, *args, **options):
+        users = User.objects.filter(is_active=True).order_by('pk')
+        user = (users.filter(email=options['user']) if options['user'] else users).first()
+        if user is None:
+            raise CommandError('No active user to authenticate as')
+        self.headers = {'host': options['host'], 'authorization': f'Bearer {AccessToken.for_user(user)}'}
+
+        paths = []
+        for pair in options['paths'] or []:
+            sync_path, _, async_path = pair.partition(',')
+            if not async_path:
+                raise CommandError(f'--path expects SYNC,ASYNC, got {pair!r}')
+            paths.append((sync_path, async_path))
+
+        timeout = {} if options['cached'] else {'RESPONSE_CACHE_TIMEOUT': 0}
+        with override_settings(**timeout):
+            for sync_path, async_path in paths or DEFAULT_PATHS:
+                for mode, path, bench in (('wsgi', sync_path, self.bench_wsgi), ('asgi', async_path, self.bench_asgi)):
+                    latencies, errors, elapsed = bench(path, options['requests'], options['concurrency'])
+                    self.report(mode, path, latencies, errors, elapsed)
+
+    def bench_wsgi(self, path, count, concurrency):
+        application = get_wsgi_application()
+        url = urlsplit(path)
+
+        def request():
+            environ = {
+                'REQUEST_METHOD': 'GET', 'PATH_INFO': url.path, 'QUERY_STRING': url.query,
+                'HTTP_HOST': self.headers['host'], 'HTTP_AUTHORIZATION': self.headers['authorization'],
+                'wsgi.input': BytesIO(),
+            }
+            setup_testing_defaults(environ)
+            status = []
+            start = time.perf_counter()
+            response = application(environ, lambda status_line, headers: status.append(int(status_line[:3])))
+            b''.join(response)
+            response.close()
+            return time.perf_counter() - start, status[0]
+
+        def worker(requests):
+            try:
+                return [request() for _ in range(requests)]
+            finally:
+                connections.close_all()
+
+        self.check_response(path, *request())
+        start = time.perf_counter()
+        with ThreadPoolExecutor(concurrency) as executor:
+            results = [result for chunk in executor.map(worker, self.split(count, concurrency)) for result in chunk]
+        return [latency for latency, _ in results], sum(code != 200 for _, code in results), time.perf_counter() - start
+
+    def bench_asgi(self, path, count, concurrency):
+        application = get_asgi_application()
+        url = urlsplit(path)
+
+        async def request():
+            scope = {
+                'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET', 'scheme': 'http',
+                'path': url.path, 'raw_path': url.path.encode(), 'query_string': url.query.encode(), 'root_path': '',
+                'headers': [(name.encode(), value.encode()) for name, value in self.headers.items()],
+                'client': ('127.0.0.1', 0), 'server': (self.headers['host'], 80),
+            }
+            body_sent = False
+            status = []
+
+            async def receive():
+                nonlocal body_sent
+                if body_sent:
+                    # клиент не отключается, обработчик отменит ожидание после ответа
+                    await asyncio.Future()
+                body_sent = True
+                return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+            async def send(message):
+                if message['type'] == 'http.response.start':
+                    status.append(message['status'])
+
+            start = time.perf_counter()
+            await application(scope, receive, send)
+            return time.perf_counter() - start, status[0]
+
+        async def worker(requests):
+            return [await request() for _ in range(requests)]
+
+        async def run():
+            self.check_response(path, *await request())
+            start = time.perf_counter()
+            chunks = await asyncio.gather(*(worker(requests) for requests in self.split(count, concurrency)))
+            return [result for chunk in chunks for result in chunk], time.perf_counter() - start
+
+        results, elapsed = asyncio.run(run())
+        return [latency for latency, _ in results], sum(code != 200 for _, code in results), elapsed
+
+    def check_response(self, path, latency, code):
+        if code != 200:
+            raise CommandError(f'Warm-up request to {path} returned {code}')
+
+    def split(self, count, parts):
+        sizes = [count // parts + (part < count % parts) for part in range(parts)]
+        return [size for size in sizes if size]
+
+    def report(self, mode, path, latencies, errors, elapsed):
+        latencies = sorted(latencies)
+        p95 = latencies[min(int(len(latencies) * 0.95), len(latencies) - 1)]
+        self.stdout.write(
+            f'{mode} {path}: {len(latencies) / elapsed:.1f} req/s, mean {statistics.mean(latencies) * 1000:.1f} ms, '
+            f'p95 {p95 * 1000:.1f} ms, errors {errors}'
+        )
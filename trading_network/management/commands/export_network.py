@@ -0,0 +1,36 @@
+from django.core.management import BaseCommand, CommandError
+
+from trading_network.filters import LinkFilter
+from trading_network.models import Link
+from trading_network.serializers import LinkReadSerializer
+from trading_network.services import EXPORT_FORMATS
+
+
+class Command(BaseCommand):
+    help = 'Stream links with supplier, products and contacts to NDJSON or CSV'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', choices=list(EXPORT_FORMATS), default='ndjson')
+        parser.add_argument('--file', help='defaults to stdout')
+        parser.add_argument('--chunk-size', type=int, default=2000)
+        parser.add_argument('--filter', action='append', default=[], metavar='NAME=VALUE',
+                            help='LinkFilter parameter, e.g. --filter country=Russia')
+
+    def handle(self, *args, **options):
+        try:
+            data = dict(item.split('=', 1) for item in options['filter'])
+        except ValueError:
+            raise CommandError('Filters must be given as NAME=VALUE')
+        queryset = LinkReadSerializer.setup_eager_loading(Link.objects.order_by('id'))
+        filterset = LinkFilter(data=data, queryset=queryset)
+        if not filterset.is_valid():
+            raise CommandError(filterset.errors.as_text())
+
+        iter_rows = EXPORT_FORMATS[options['output']][0]
+        rows = iter_rows(filterset.qs, LinkReadSerializer, chunk_size=options['chunk_size'])
+        if options['file']:
+            with open(options['file'], 'w', encoding='utf-8', newline='') as file:
+                file.writelines(rows)
+        else:
+            for row in rows:
+                self.stdout.write(row, ending='')
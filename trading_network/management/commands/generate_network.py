@@ -0,0 +1,164 @@
+import random
+import time
+from collections import defaultdict
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.core.management import BaseCommand, CommandError
+from django.db import transaction
+
+from trading_network import ledger, rollups
+from trading_network.cache import invalidate
+from trading_network.models import Contact, DebtRollup, DebtTransaction, Link, Product
+
+LOCATIONS = {
+    'Russia': ['Moscow', 'Saint Petersburg', 'Kazan', 'Novosibirsk', 'Yekaterinburg'],
+    'China': ['Beijing', 'Shanghai', 'Shenzhen', 'Guangzhou'],
+    'India': ['Mumbai', 'Delhi', 'Bangalore'],
+    'Germany': ['Berlin', 'Munich', 'Hamburg'],
+    'USA': ['New York', 'Chicago', 'Seattle', 'Austin'],
+    'Brazil': ['Sao Paulo', 'Rio de Janeiro'],
+    'Kazakhstan': ['Almaty', 'Astana'],
+    'Turkey': ['Istanbul', 'Ankara'],
+}
+STREETS = ['Lenina', 'Main', 'Park', 'Market', 'Station', 'River', 'Garden', 'Industrial']
+BRANDS = ['Apex', 'Nova', 'Orbit', 'Pulse', 'Vertex', 'Zenith', 'Quant', 'Helix']
+DEVICES = ['Phone', 'Laptop', 'Tablet', 'Monitor', 'Router', 'Camera', 'Speaker', 'Watch']
+# поля ключа строки сводки в порядке ключей rollups.contributions
+ROLLUP_KEY = ['root_id', 'level', 'status_link', 'country']
+
+
+class Command(BaseCommand):
+    help = ('Generate a synthetic trading network with bulk inserts: factories, retail networks and '
+            'entrepreneurs with products, contacts, debts and the matching ledger and debt rollup rows')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--factories', type=int, default=10)
+        parser.add_argument('--retail', type=int, default=100, help='retail networks, supplied by factories')
+        parser.add_argument('--entrepreneurs', type=int, default=1000,
+                            help='entrepreneurs, supplied by retail networks and factories')
+        parser.add_argument('--products', type=int, default=200)
+        parser.add_argument('--products-per-link', type=int, default=5,
+                            help='catalog size of retail networks and entrepreneurs, factories get four times more')
+        parser.add_argument('--contacts-per-link', type=int, default=1)
+        parser.add_argument('--debt-ratio', type=float, default=0.7, help='share of non-factory links with a debt')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--seed', type=int, help='random seed for a reproducible network')
+        parser.add_argument('--prefix', help='link and product name prefix, unique per run by default')
+
+    def handle(self, *args, **options):
+        if options['factories'] < 1 or options['products'] < 1:
+            raise CommandError('At least one factory and one product are required')
+        self.random = random.Random(options['seed'])
+        self.prefix = options['prefix'] or f'gen-{int(time.time())}'
+        if Link.objects.filter(name__startswith=f'{self.prefix} ').exists():
+            raise CommandError(f'Links with prefix {self.prefix!r} already exist, pass another --prefix')
+        self.batch_size = options['batch_size']
+        self.catalog_size = options['products_per_link']
+        self.contacts_per_link = options['contacts_per_link']
+        self.debt_ratio = options['debt_ratio']
+        # итоги сводки задолженности копятся в памяти: заводы новые, поэтому строки сводки для них меняет только
+        # эта команда, и каждая пачка записывает итоги затронутых строк целиком в своей транзакции
+        self.rollup = defaultdict(lambda: [0, 0])
+
+        started = time.monotonic()
+        products = self.generate_products(options['products'])
+        factories = self.generate_links('factories', Link.LinkStatus.FACTORY, options['factories'],
+                                        lambda: None, lambda supplier: self.sample(products, self.catalog_size * 4))
+        retail = self.generate_links('retail', Link.LinkStatus.RETAIL_NETWORK, options['retail'],
+                                     lambda: self.random.choice(factories), self.supplier_catalog)
+        self.generate_links('entrepreneurs', Link.LinkStatus.ENTREPRENEUR, options['entrepreneurs'],
+                            lambda: self.random.choice(retail if retail and self.random.random() < 0.9 else factories),
+                            self.supplier_catalog, keep=False)
+        invalidate('link', 'product', 'contact')
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(f'Generated network {self.prefix!r} in {elapsed:.1f}s'))
+
+    def sample(self, population, size):
+        return self.random.sample(population, min(size, len(population)))
+
+    def supplier_catalog(self, supplier):
+        return self.sample(supplier.catalog, self.catalog_size)
+
+    def report(self, phase, rows, started):
+        elapsed = time.monotonic() - started
+        self.stdout.write(f'{phase}: {rows} rows, {rows / max(elapsed, 1e-9):.0f} rows/s')
+
+    def batches(self, count):
+        for start in range(0, count, self.batch_size):
+            yield range(start, min(start + self.batch_size, count))
+
+    def generate_products(self, count):
+        started, ids = time.monotonic(), []
+        for batch in self.batches(count):
+            products = Product.objects.bulk_create(
+                Product(name=f'{self.prefix} {self.random.choice(BRANDS)} {self.random.choice(DEVICES)} {i}',
+                        model=f'{self.random.choice("ABCDEFGHKMXZ")}{self.random.randint(100, 9999)}',
+                        date=date(2015, 1, 1) + timedelta(days=self.random.randint(0, 3650)))
+                for i in batch
+            )
+            ids.extend(product.pk for product in products)
+            self.report('products', len(ids), started)
+        return ids
+
+    def generate_links(self, phase, status_link, count, choose_supplier, choose_catalog, keep=True):
+        """Звенья одного уровня пачками: звено, его продукты, контакты, журнал и вклад в сводку
+
+        keep=True - звенья остаются в памяти (с каталогом) как поставщики следующего уровня.
+        """
+        started, rows, kept = time.monotonic(), 0, []
+        for batch in self.batches(count):
+            with transaction.atomic():
+                links = []
+                for i in batch:
+                    supplier = choose_supplier()
+                    path = Link.build_path(supplier)
+                    has_debt = supplier is not None and self.random.random() < self.debt_ratio
+                    link = Link(status_link=status_link, supplier=supplier, name=f'{self.prefix} {phase} {i}',
+                                path=path, level=path.count('/'),
+                                debt=Decimal(self.random.randint(1, 10 ** 7)) / 100 if has_debt else None)
+                    link.catalog = choose_catalog(supplier)
+                    links.append(link)
+                Link.objects.bulk_create(links, batch_size=self.batch_size)
+                rows += self.fill_links(links)
+            if keep:
+                kept.extend(links)
+            rows += len(links)
+            self.report(phase, rows, started)
+        return kept
+
+    def fill_links(self, links):
+        """Продукты, контакты, журнал и сводка для созданной пачки звеньев, возвращает число строк"""
+        LinkProduct = Link.products.through
+        link_products = [LinkProduct(link_id=link.pk, product_id=product_id)
+                         for link in links for product_id in link.catalog]
+        LinkProduct.objects.bulk_create(link_products, batch_size=self.batch_size)
+
+        contacts, countries = [], defaultdict(set)
+        for link in links:
+            for _ in range(self.contacts_per_link):
+                country = self.random.choice(list(LOCATIONS))
+                countries[link.pk].add(country)
+                contacts.append(Contact(
+                    link_id=link.pk, email=f'link{link.pk}@example.com', country=country,
+                    city=self.random.choice(LOCATIONS[country]), street=self.random.choice(STREETS),
+                    num_house=str(self.random.randint(1, 300)),
+                ))
+        Contact.objects.bulk_create(contacts, batch_size=self.batch_size)
+
+        indebted = [link for link in links if link.debt is not None]
+        ledger.record_many({link.pk: link.debt for link in indebted}, DebtTransaction.Kind.OPENING)
+        states = (rollups.LinkState(link.pk, link.path, link.level, link.status_link, link.debt) for link in indebted)
+        groups = rollups.contributions(states, countries)
+        for key, (total, count) in groups.items():
+            self.rollup[key][0] += total
+            self.rollup[key][1] += count
+        # после сбоя на следующей пачке созданные звенья уже учтены в сводке
+        DebtRollup.objects.bulk_create(
+            (DebtRollup(**dict(zip(ROLLUP_KEY, key)), total=self.rollup[key][0], links=self.rollup[key][1])
+             for key in groups),
+            batch_size=self.batch_size,
+            update_conflicts=True, unique_fields=ROLLUP_KEY, update_fields=['total', 'links'],
+        )
+        return len(link_products) + len(contacts) + len(indebted)
@@ -0,0 +1,200 @@
+import csv
+import json
+import time
+from decimal import Decimal
+from itertools import islice
+from pathlib import Path
+
+from django.core.management import BaseCommand, CommandError
+from django.db import transaction
+from rest_framework import serializers
+
+from trading_network import ledger, rollups
+from trading_network.cache import invalidate
+from trading_network.models import Contact, DebtTransaction, Link, Product
+from trading_network.validators import ProductSupplierRelationshipValidator, StatusLinkSupplierValidator, \
+    SupplierCatalog
+
+CONTACT_FIELDS = ['email', 'country', 'city', 'street', 'num_house']
+
+
+class Command(BaseCommand):
+    help = ('Load products, links and contacts from a CSV or NDJSON file. '
+            'Every record has a type (product, link, contact); products are identified by name and model, '
+            'links reference suppliers by name and products by name (";"-separated in CSV, a name must belong '
+            'to one product), contacts reference links by name. Links are validated like in the API; '
+            'existing products, links and contacts are skipped, so a file can be loaded again')
+
+    def add_arguments(self, parser):
+        parser.add_argument('file', type=Path)
+        parser.add_argument('--format', choices=['csv', 'ndjson'], help='defaults to the file extension')
+        parser.add_argument('--chunk-size', type=int, default=5000)
+        parser.add_argument('--state', type=Path, help='progress file, defaults to <file>.progress.json')
+        parser.add_argument('--resume', action='store_true', help='continue from the last committed chunk')
+
+    def handle(self, *args, **options):
+        self.file = options['file']
+        self.format = options['format'] or ('csv' if self.file.suffix == '.csv' else 'ndjson')
+        self.chunk_size = options['chunk_size']
+        self.state_file = options['state'] or self.file.with_name(f'{self.file.name}.progress.json')
+        self.state = {'phase': 'products', 'pass': 0, 'line': 0}
+        if options['resume'] and self.state_file.exists():
+            self.state = json.loads(self.state_file.read_text())
+            self.stdout.write(f'Resuming from {self.state}')
+
+        started = time.monotonic()
+        total = 0
+        if self.state['phase'] == 'products':
+            total += self.run_phase('products', 'product', self.load_products)
+            self.save_state('links', 0, 0)
+        if self.state['phase'] == 'links':
+            total += self.load_links()
+            self.save_state('contacts', 0, 0)
+        if self.state['phase'] == 'contacts':
+            total += self.run_phase('contacts', 'contact', self.load_contacts)
+
+        self.state_file.unlink(missing_ok=True)
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Loaded {total} rows in {elapsed:.1f}s ({total / max(elapsed, 1e-9):.0f} rows/s)'
+        ))
+
+    def read_records(self):
+        """Построчное чтение файла: (номер строки, запись)"""
+        with self.file.open(encoding='utf-8', newline='') as file:
+            if self.format == 'csv':
+                reader = csv.DictReader(file)
+                for line, row in enumerate(reader, start=1):
+                    yield line, {key: value for key, value in row.items() if value not in (None, '')}
+            else:
+                for line, row in enumerate(file, start=1):
+                    if row.strip():
+                        yield line, json.loads(row)
+
+    def chunks(self, record_type):
+        """Записи указанного типа пачками, пропуская уже загруженные при возобновлении"""
+        skip_to = self.state['line']
+        records = ((line, record) for line, record in self.read_records()
+                   if line > skip_to and record.get('type') == record_type)
+        while chunk := list(islice(records, self.chunk_size)):
+            yield chunk
+
+    def save_state(self, phase, pass_, line):
+        self.state = {'phase': phase, 'pass': pass_, 'line': line}
+        self.state_file.write_text(json.dumps(self.state))
+
+    def report(self, phase, rows, started):
+        elapsed = time.monotonic() - started
+        self.stdout.write(f'{phase}: {rows} rows, {rows / max(elapsed, 1e-9):.0f} rows/s')
+
+    def run_phase(self, phase, record_type, load_chunk, pass_=0):
+        started, rows = time.monotonic(), 0
+        for chunk in self.chunks(record_type):
+            with transaction.atomic():
+                rows += load_chunk(chunk)
+                invalidate(record_type)
+            self.save_state(phase, pass_, chunk[-1][0])
+            self.report(phase, rows, started)
+        return rows
+
+    def load_products(self, chunk):
+        # название продукта не уникально, продукт определяется парой (название, модель)
+        names = {record['name'] for _, record in chunk}
+        existing = set(Product.objects.filter(name__in=names).values_list('name', 'model'))
+        products = {}
+        for _, record in chunk:
+            key = (record['name'], record['model'])
+            if key not in existing:
+                products.setdefault(key, Product(name=record['name'], model=record['model'], date=record['date']))
+        Product.objects.bulk_create(products.values())
+        return len(products)
+
+    def load_links(self):
+        """Звенья загружаются проходами: в каждом создаются те, чей поставщик уже есть в базе"""
+        rows, pass_ = 0, self.state['pass']
+        while True:
+            self.deferred = 0
+            loaded = self.run_phase('links', 'link', self.load_link_chunk, pass_)
+            rows += loaded
+            if not self.deferred:
+                return rows
+            if not loaded:
+                raise CommandError(f'{self.deferred} links reference unknown suppliers')
+            pass_ += 1
+            self.save_state('links', pass_, 0)
+
+    def load_link_chunk(self, chunk):
+        records = [record for _, record in chunk]
+        existing = set(Link.objects.filter(name__in=[record['name'] for record in records])
+                       .values_list('name', flat=True))
+        suppliers = Link.objects.filter(name__in={record['supplier'] for record in records if record.get('supplier')})
+        suppliers = {supplier.name: supplier for supplier in suppliers.only('id', 'name', 'path', 'level')}
+        product_names = {name for record in records for name in self.product_names(record)}
+        products = {}
+        for product in Product.objects.filter(name__in=product_names).only('id', 'name'):
+            if product.name in products:
+                raise CommandError(f'Several products are named {product.name!r}, links cannot reference it')
+            products[product.name] = product
+        catalog = SupplierCatalog()
+        catalog.preload(supplier.pk for supplier in suppliers.values())
+        validators = [StatusLinkSupplierValidator('status_link', 'supplier'),
+                      ProductSupplierRelationshipValidator('supplier', 'products', catalog)]
+
+        links, link_products = {}, {}
+        for record in records:
+            if record['name'] in existing or record['name'] in links:
+                continue
+            if record.get('supplier') and record['supplier'] not in suppliers:
+                self.deferred += 1
+                continue
+            if record['status_link'] not in Link.LinkStatus.values:
+                raise CommandError(f'Unknown status_link {record["status_link"]!r} for link {record["name"]!r}')
+            supplier = suppliers.get(record.get('supplier'))
+            link_products[record['name']] = [products[name] for name in dict.fromkeys(self.product_names(record))
+                                             if name in products]
+            # те же проверки, что и при создании звена через API
+            try:
+                for validator in validators:
+                    validator({'status_link': record['status_link'], 'supplier': supplier,
+                               'products': link_products[record['name']]})
+            except serializers.ValidationError as exc:
+                raise CommandError(f'Invalid link {record["name"]!r}: {" ".join(exc.detail)}')
+            path = Link.build_path(supplier)
+            links[record['name']] = Link(
+                status_link=record['status_link'], supplier=supplier, name=record['name'], path=path,
+                level=path.count('/'), debt=Decimal(record['debt']) if record.get('debt') else None,
+            )
+        Link.objects.bulk_create(links.values())
+        rollups.apply_queryset(Link.objects.filter(pk__in=[link.pk for link in links.values()]))
+        ledger.record_many({link.pk: link.debt for link in links.values() if link.debt is not None},
+                           DebtTransaction.Kind.OPENING)
+
+        LinkProduct = Link.products.through
+        LinkProduct.objects.bulk_create(
+            LinkProduct(link_id=link.pk, product_id=product.pk)
+            for name, link in links.items() for product in link_products[name]
+        )
+        return len(links)
+
+    def product_names(self, record):
+        products = record.get('products') or []
+        return products.split(';') if isinstance(products, str) else products
+
+    def load_contacts(self, chunk):
+        records = [record for _, record in chunk]
+        links = dict(Link.objects.filter(name__in={record['link'] for record in records}).values_list('name', 'id'))
+        unknown = {record['link'] for record in records} - links.keys()
+        if unknown:
+            raise CommandError(f'Contacts reference unknown links: {", ".join(sorted(unknown))}')
+        # контакты, которые уже есть у звена (например, загруженные до сбоя перед сохранением прогресса),
+        # пропускаются, поэтому --resume и повторная загрузка не создают дубликатов
+        existing = set(Contact.objects.filter(link_id__in=links.values()).values_list('link_id', *CONTACT_FIELDS))
+        contacts = []
+        for record in records:
+            key = (links[record['link']], *(record[field] for field in CONTACT_FIELDS))
+            if key not in existing:
+                existing.add(key)
+                contacts.append(Contact(link_id=key[0], **{field: record[field] for field in CONTACT_FIELDS}))
+        with rollups.track({contact.link_id for contact in contacts}):
+            Contact.objects.bulk_create(contacts)
+        return len(contacts)
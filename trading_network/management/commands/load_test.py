@@ -0,0 +1,257 @@
+import asyncio
+import json
+import math
+import random
+import time
+from collections import Counter, defaultdict
+from pathlib import Path
+from urllib.parse import urlsplit
+
+from django.core.management import BaseCommand, CommandError
+from django.utils import timezone
+
+from trading_network.benchmarks import summarize
+
+OPERATIONS = ('list', 'create', 'update', 'product')
+DEFAULT_MIX = 'list=60,product=20,create=10,update=10'
+# запросы без побочных эффектов, их можно повторить после разрыва соединения
+SAFE_METHODS = ('GET', 'HEAD')
+
+
+class Connection:
+    """HTTP/1.1 keep-alive соединение на asyncio streams, переподключается после Connection: close"""
+
+    def __init__(self, host, port):
+        self.host, self.port = host, port
+        self.reader = self.writer = None
+
+    async def request(self, method, path, body=None, headers=None):
+        payload = json.dumps(body).encode() if body is not None else b''
+        lines = [f'{method} {path} HTTP/1.1', f'Host: {self.host}:{self.port}', f'Content-Length: {len(payload)}',
+                 *(f'{name}: {value}' for name, value in (headers or {}).items())]
+        if body is not None:
+            lines.append('Content-Type: application/json')
+        message = '\r\n'.join(lines).encode() + b'\r\n\r\n' + payload
+
+        reused = self.writer is not None
+        try:
+            return await self.exchange(message)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            # сервер мог закрыть простаивающее соединение - безопасный запрос повторяется один раз на новом;
+            # запись могла быть выполнена до разрыва, поэтому POST и PATCH не повторяются и считаются ошибкой
+            await self.close()
+            if not reused or method not in SAFE_METHODS:
+                raise
+            return await self.exchange(message)
+
+    async def exchange(self, message):
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        self.writer.write(message)
+        await self.writer.drain()
+
+        status_line = await self.reader.readuntil(b'\r\n')
+        status = int(status_line.split()[1])
+        headers = {}
+        while (line := await self.reader.readuntil(b'\r\n')) != b'\r\n':
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        if headers.get('transfer-encoding') == 'chunked':
+            body = b''
+            while size := int((await self.reader.readuntil(b'\r\n')).split(b';')[0], 16):
+                body += (await self.reader.readexactly(size + 2))[:-2]
+            await self.reader.readuntil(b'\r\n')
+        elif 'content-length' in headers:
+            body = await self.reader.readexactly(int(headers['content-length']))
+        else:
+            body = await self.reader.read()
+            headers['connection'] = 'close'
+        if headers.get('connection', '').lower() == 'close':
+            await self.close()
+        return status, body
+
+    async def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            try:
+                await self.writer.wait_closed()
+            except ConnectionError:
+                pass
+        self.reader = self.writer = None
+
+
+class Command(BaseCommand):
+    help = ('Load-test a running server with concurrent asyncio clients replaying a mix of link list, create, '
+            'update and product list calls; report throughput, p50/p95/p99 latency and error rates as JSON')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000', help='server base URL')
+        parser.add_argument('--email', required=True, help='staff user that obtains a token at users/token/')
+        parser.add_argument('--password', required=True)
+        parser.add_argument('--concurrency', type=int, default=20, help='clients, each with one keep-alive connection')
+        parser.add_argument('--duration', type=float, default=30, help='seconds to run')
+        parser.add_argument('--requests', type=int, help='stop after this many requests instead of --duration')
+        parser.add_argument('--mix', default=DEFAULT_MIX,
+                            help=f'operation weights, operations: {", ".join(OPERATIONS)} (default {DEFAULT_MIX})')
+        parser.add_argument('--seed', type=int)
+        parser.add_argument('--output', type=Path, help='JSON result file')
+        parser.add_argument('--compare', type=Path, help='previous JSON result to compare with')
+        parser.add_argument('--cleanup', action='store_true', help='delete the links created by the run')
+
+    def handle(self, *args, **options):
+        url = urlsplit(options['url'])
+        if url.scheme != 'http' or not url.hostname:
+            raise CommandError('--url must be an http:// URL')
+        self.host, self.port, self.prefix = url.hostname, url.port or 80, url.path.rstrip('/')
+        self.mix = self.parse_mix(options['mix'])
+        self.random = random.Random(options['seed'])
+        self.run_id = f'load-{int(time.time())}'
+        self.created = []
+        self.latencies = defaultdict(list)
+        self.statuses = defaultdict(Counter)
+
+        elapsed = asyncio.run(self.run(options))
+        document = self.summary(options, elapsed)
+        if options['output']:
+            options['output'].parent.mkdir(parents=True, exist_ok=True)
+            options['output'].write_text(json.dumps(document, indent=2))
+            self.report(document)
+        else:
+            self.stdout.write(json.dumps(document, indent=2))
+        if options['compare']:
+            self.compare(json.loads(options['compare'].read_text()), document)
+
+    def parse_mix(self, mix):
+        weights = {}
+        for item in mix.split(','):
+            operation, _, weight = item.partition('=')
+            if operation not in OPERATIONS or not weight.isdigit():
+                raise CommandError(f'Invalid --mix item {item!r}, expected <operation>=<weight>')
+            weights[operation] = int(weight)
+        if not sum(weights.values()):
+            raise CommandError('--mix weights sum to zero')
+        return weights
+
+    async def run(self, options):
+        setup = Connection(self.host, self.port)
+        status, body = await setup.request('POST', f'{self.prefix}/users/token/',
+                                           {'email': options['email'], 'password': options['password']})
+        if status != 200:
+            raise CommandError(f'Token request failed with {status}: {body[:200]!r}')
+        self.headers = {'Authorization': f'Bearer {json.loads(body)["access"]}'}
+        status, body = await setup.request('GET', f'{self.prefix}/product/?page_size=50', headers=self.headers)
+        if status != 200:
+            raise CommandError(f'Product list failed with {status}')
+        self.products = [product['id'] for product in json.loads(body)['results']]
+        if not self.products and ({'create', 'update'} & {op for op, weight in self.mix.items() if weight}):
+            raise CommandError('create and update need at least one product')
+        status, body = await setup.request('GET', f'{self.prefix}/link/', headers=self.headers)
+        if status != 200:
+            raise CommandError(f'Link list failed with {status}')
+        # страницы списка, которые существуют до прогона (по 10 звеньев), не больше 10
+        self.list_pages = min(max(math.ceil(json.loads(body)['count'] / 10), 1), 10)
+
+        self.remaining = options['requests']
+        self.deadline = time.monotonic() + options['duration']
+        started = time.perf_counter()
+        await asyncio.gather(*(self.client(number) for number in range(options['concurrency'])))
+        elapsed = time.perf_counter() - started
+
+        if options['cleanup']:
+            # соединение простаивало весь прогон, удаления не повторяются - поэтому новое соединение
+            await setup.close()
+            for pk in self.created:
+                await setup.request('DELETE', f'{self.prefix}/link/{pk}/delete/', headers=self.headers)
+        await setup.close()
+        return elapsed
+
+    def next_operation(self):
+        if self.remaining is not None:
+            if self.remaining <= 0:
+                return None
+            self.remaining -= 1
+        elif time.monotonic() >= self.deadline:
+            return None
+        operation = self.random.choices(list(self.mix), weights=list(self.mix.values()))[0]
+        # обновлять можно только звенья, созданные этим прогоном
+        return 'create' if operation == 'update' and not self.created else operation
+
+    async def client(self, number):
+        connection = Connection(self.host, self.port)
+        sequence = 0
+        try:
+            while (operation := self.next_operation()) is not None:
+                sequence += 1
+                method, path, body = self.build(operation, f'{self.run_id}-{number}-{sequence}')
+                started = time.perf_counter()
+                try:
+                    status, content = await connection.request(method, path, body, self.headers)
+                except (OSError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, ValueError):
+                    status, content = 0, b''
+                    await connection.close()
+                self.latencies[operation].append(time.perf_counter() - started)
+                self.statuses[operation][status] += 1
+                if operation == 'create' and status == 201:
+                    self.created.append(json.loads(content)['id'])
+        finally:
+            await connection.close()
+
+    def build(self, operation, name):
+        if operation == 'list':
+            return 'GET', f'{self.prefix}/link/?page={self.random.randint(1, self.list_pages)}', None
+        if operation == 'product':
+            return 'GET', f'{self.prefix}/product/', None
+        if operation == 'create':
+            return 'POST', f'{self.prefix}/link/create/', {
+                'status_link': 'factory', 'name': name, 'products': self.random.sample(self.products, 1),
+                'contact': [{'email': 'load@example.com', 'country': 'Russia', 'city': 'Moscow', 'street': 'Main',
+                             'num_house': '1'}],
+            }
+        return 'PATCH', f'{self.prefix}/link/{self.random.choice(self.created)}/update/', {'name': name}
+
+    def summary(self, options, elapsed):
+        operations = {}
+        for operation, latencies in self.latencies.items():
+            statuses = self.statuses[operation]
+            errors = sum(count for status, count in statuses.items() if not 200 <= status < 300)
+            operations[operation] = {
+                'requests': len(latencies),
+                'errors': errors,
+                'error_rate': round(errors / len(latencies), 4),
+                'statuses': {str(status): count for status, count in sorted(statuses.items())},
+                'latency_ms': summarize(latencies),
+            }
+        total = sum(operation['requests'] for operation in operations.values())
+        errors = sum(operation['errors'] for operation in operations.values())
+        all_latencies = [latency for latencies in self.latencies.values() for latency in latencies]
+        return {
+            'created_at': timezone.now().isoformat(),
+            'url': options['url'],
+            'concurrency': options['concurrency'],
+            'mix': self.mix,
+            'elapsed_s': round(elapsed, 3),
+            'requests': total,
+            'throughput_rps': round(total / elapsed, 1) if elapsed else 0,
+            'error_rate': round(errors / total, 4) if total else 0,
+            'latency_ms': summarize(all_latencies) if all_latencies else None,
+            'operations': operations,
+        }
+
+    def report(self, document):
+        self.stdout.write(f'{document["requests"]} requests in {document["elapsed_s"]}s: '
+                          f'{document["throughput_rps"]} req/s, error rate {document["error_rate"]:.2%}')
+        for operation, result in document['operations'].items():
+            latency = result['latency_ms']
+            self.stdout.write(f'{operation}: {result["requests"]} requests, p50 {latency["p50"]} ms, '
+                              f'p95 {latency["p95"]} ms, p99 {latency["p99"]} ms, errors {result["errors"]}')
+
+    def compare(self, baseline, current):
+        self.stdout.write(f'throughput: {baseline["throughput_rps"]} -> {current["throughput_rps"]} req/s, '
+                          f'error rate: {baseline["error_rate"]} -> {current["error_rate"]}')
+        for operation, result in current['operations'].items():
+            previous = baseline['operations'].get(operation)
+            if previous is not None:
+                old, new = previous['latency_ms'], result['latency_ms']
+                self.stdout.write(f'{operation}: p50 {old["p50"]} -> {new["p50"]} ms, '
+                                  f'p95 {old["p95"]} -> {new["p95"]} ms, p99 {old["p99"]} -> {new["p99"]} ms')
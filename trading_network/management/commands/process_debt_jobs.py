@@ -0,0 +1,22 @@
+from django.core.management import BaseCommand
+
+from trading_network import jobs
+
+
+class Command(BaseCommand):
+    help = ('Run queued debt clearing jobs and continue stale running ones (no progress for DEBT_JOB_STALE_SECONDS), '
+            'or resume an interrupted one with --job')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--job', type=int, help='resume the job with this id (running or failed)')
+        parser.add_argument('--chunk-size', type=int, help='links per transaction, DEBT_CLEAR_CHUNK_SIZE by default')
+
+    def handle(self, *args, **options):
+        if options['job'] is not None:
+            if not jobs.run(options['job'], resume=True, chunk_size=options['chunk_size']):
+                self.stdout.write(self.style.WARNING(f'Job {options["job"]} is not running or failed'))
+                return
+            self.stdout.write(self.style.SUCCESS(f'Job {options["job"]} finished'))
+            return
+        count = jobs.process_pending(options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(f'{count} jobs finished'))
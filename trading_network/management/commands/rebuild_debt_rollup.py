@@ -0,0 +1,14 @@
+from django.core.management import BaseCommand
+
+from trading_network import rollups
+
+
+class Command(BaseCommand):
+    help = 'Recalculate the debt rollup table from links and contacts'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--root', type=int, action='append', help='factory id, may be repeated')
+
+    def handle(self, *args, **options):
+        rollups.rebuild(options['root'])
+        self.stdout.write(self.style.SUCCESS('Debt rollup rebuilt'))
@@ -0,0 +1,33 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from trading_network import ledger
+
+
+class Command(BaseCommand):
+    help = 'Snapshot debt balances of links changed since the previous snapshot'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--at', help='snapshot moment (ISO 8601), now minus --lag by default')
+        parser.add_argument('--lag', type=int, default=settings.DEBT_SNAPSHOT_LAG_SECONDS,
+                            help='seconds to stay behind now so that in-flight transactions are committed, '
+                                 'not less than DEBT_SNAPSHOT_LAG_SECONDS')
+
+    def handle(self, *args, **options):
+        if options['at']:
+            moment = parse_datetime(options['at'])
+            if moment is None:
+                raise CommandError(f'Invalid --at value {options["at"]!r}')
+            if timezone.is_naive(moment):
+                moment = timezone.make_aware(moment)
+        else:
+            moment = timezone.now() - timedelta(seconds=options['lag'])
+        try:
+            count = ledger.take_snapshot(moment)
+        except ValueError as exc:
+            raise CommandError(str(exc))
+        self.stdout.write(self.style.SUCCESS(f'{count} balances snapshotted at {moment.isoformat()}'))
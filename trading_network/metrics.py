@@ -0,0 +1,163 @@
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from bisect import bisect_left
+from pathlib import Path
+
+from django.conf import settings
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+DB_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+COUNTERS = {
+    'http_requests_total': ('Requests by URL name, method and status', ('view', 'method', 'status')),
+    'http_request_db_queries_total': ('SQL statements of sampled requests by URL name', ('view',)),
+}
+HISTOGRAMS = {
+    'http_request_duration_seconds': ('Request latency by URL name', DURATION_BUCKETS),
+    'http_request_db_seconds': ('SQL time of sampled requests by URL name', DB_BUCKETS),
+    'http_response_size_bytes': ('Response body size by URL name, streaming responses excluded', SIZE_BUCKETS),
+}
+
+logger = logging.getLogger(__name__)
+
+
+class Store:
+    """Метрики процесса: счетчики и гистограммы в словарях под одной короткой блокировкой
+
+    С METRICS_DIR снимок раз в METRICS_FLUSH_SECONDS записывается в файл <pid>.json этого каталога,
+    а выдача (render) складывает файлы всех процессов-воркеров.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.pid = os.getpid()
+        self.counters = {}
+        # (имя, view) -> [число значений в каждом интервале и в +Inf..., сумма]
+        self.histograms = {}
+        self.flush_at = 0
+
+    def observe(self, view, method, status, duration, size=None, db_duration=None, db_queries=None):
+        """Учет одного запроса к представлению view (имя URL с пространством имен)"""
+        if self.pid != os.getpid():
+            # после fork счетчики родителя остаются за родителем
+            self.reset()
+        with self.lock:
+            self.increment(('http_requests_total', view, method, str(status)), 1)
+            self.add('http_request_duration_seconds', view, duration)
+            if size is not None:
+                self.add('http_response_size_bytes', view, size)
+            if db_duration is not None:
+                self.add('http_request_db_seconds', view, db_duration)
+                self.increment(('http_request_db_queries_total', view), db_queries)
+        if settings.METRICS_DIR and self.flush_at <= time.monotonic():
+            self.flush()
+
+    def increment(self, key, value):
+        self.counters[key] = self.counters.get(key, 0) + value
+
+    def add(self, name, view, value):
+        buckets = HISTOGRAMS[name][1]
+        values = self.histograms.get((name, view))
+        if values is None:
+            values = self.histograms[(name, view)] = [0] * (len(buckets) + 2)
+        values[bisect_left(buckets, value)] += 1
+        values[-1] += value
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                'counters': [[*key, value] for key, value in self.counters.items()],
+                'histograms': [[*key, list(values)] for key, values in self.histograms.items()],
+            }
+
+    def flush(self, blocking=False):
+        """Запись снимка процесса в METRICS_DIR (через временный файл, чтобы читатели не видели половину)
+
+        Запись выполняет один поток: остальные не ждут его (blocking=False) и не пишут сами. Ошибка записи
+        только логируется - метрики не должны ломать запрос.
+        """
+        if not self.flush_lock.acquire(blocking=blocking):
+            return
+        try:
+            self.flush_at = time.monotonic() + settings.METRICS_FLUSH_SECONDS
+            directory = Path(settings.METRICS_DIR)
+            directory.mkdir(parents=True, exist_ok=True)
+            descriptor, temporary = tempfile.mkstemp(prefix=f'{self.pid}.', suffix='.tmp', dir=directory)
+            try:
+                with os.fdopen(descriptor, 'w') as file:
+                    json.dump(self.snapshot(), file)
+                os.replace(temporary, directory / f'{self.pid}.json')
+            except BaseException:
+                Path(temporary).unlink(missing_ok=True)
+                raise
+        except OSError:
+            logger.warning('Не удалось записать метрики процесса %s в %s', self.pid, settings.METRICS_DIR,
+                           exc_info=True)
+        finally:
+            self.flush_lock.release()
+
+    def collect(self):
+        """Снимки всех процессов: файлы METRICS_DIR (свой - свежий) или только этот процесс"""
+        if not settings.METRICS_DIR:
+            return [self.snapshot()]
+        self.flush(blocking=True)
+        snapshots = []
+        for file in Path(settings.METRICS_DIR).glob('*.json'):
+            try:
+                snapshots.append(json.loads(file.read_text()))
+            except (OSError, ValueError):
+                # файл процесса удален или заменяется прямо сейчас
+                continue
+        return snapshots
+
+
+def merge(snapshots):
+    counters, histograms = {}, {}
+    for snapshot in snapshots:
+        for *key, value in snapshot['counters']:
+            counters[tuple(key)] = counters.get(tuple(key), 0) + value
+        for name, view, values in snapshot['histograms']:
+            total = histograms.setdefault((name, view), [0] * len(values))
+            for index, value in enumerate(values):
+                total[index] += value
+    return counters, histograms
+
+
+def escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def labels(**values):
+    return '{' + ','.join(f'{name}="{escape(value)}"' for name, value in values.items()) + '}'
+
+
+def render(snapshots):
+    """Метрики в текстовом формате Prometheus 0.0.4"""
+    counters, histograms = merge(snapshots)
+    lines = []
+    for name, (description, label_names) in COUNTERS.items():
+        lines += [f'# HELP {name} {description}', f'# TYPE {name} counter']
+        for key, value in sorted(item for item in counters.items() if item[0][0] == name):
+            lines.append(f'{name}{labels(**dict(zip(label_names, key[1:])))} {value}')
+    for name, (description, buckets) in HISTOGRAMS.items():
+        lines += [f'# HELP {name} {description}', f'# TYPE {name} histogram']
+        for (_, view), values in sorted(item for item in histograms.items() if item[0][0] == name):
+            cumulative = 0
+            for bound, count in zip((*buckets, '+Inf'), values):
+                cumulative += count
+                lines.append(f'{name}_bucket{labels(view=view, le=bound)} {cumulative}')
+            lines.append(f'{name}_sum{labels(view=view)} {values[-1]}')
+            lines.append(f'{name}_count{labels(view=view)} {cumulative}')
+    return '\n'.join(lines) + '\n'
+
+
+store = Store()
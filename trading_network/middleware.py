@@ -0,0 +1,298 @@
+import json
+import logging
+import random
+import threading
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.http import JsonResponse
+from django.urls import Resolver404, resolve, reverse
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.exceptions import InvalidToken
+
+from trading_network import instrumentation, metrics, profiling, routers
+from users.authentication import CachedJWTAuthentication
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+sql_logger = logging.getLogger('trading_network.sql')
+
+
+class ReplicaRoutingMiddleware:
+    """Безопасные запросы к представлениям с read_replica = True читают с реплик
+
+    После запроса на запись клиент получает cookie, и REPLICA_STICKY_SECONDS его чтения идут
+    в основную базу, чтобы он видел свои изменения несмотря на отставание реплик.
+    Поддерживает и синхронную, и асинхронную цепочку (trading_network.async_views).
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        request.read_routing, token = routers.begin()
+        try:
+            response = self.get_response(request)
+        finally:
+            routers.reset(token)
+        return self.process_response(request, response)
+
+    async def __acall__(self, request):
+        request.read_routing, token = routers.begin()
+        try:
+            response = await self.get_response(request)
+        finally:
+            routers.reset(token)
+        return self.process_response(request, response)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        view_class = getattr(view_func, 'cls', None) or getattr(view_func, 'view_class', None)
+        if (request.method in SAFE_METHODS and getattr(view_class, 'read_replica', False)
+                and not self.is_sticky(request)):
+            request.read_routing.replica = True
+
+    def process_response(self, request, response):
+        if request.method not in SAFE_METHODS:
+            response.set_cookie(settings.REPLICA_STICKY_COOKIE, str(int(time.time()) + settings.REPLICA_STICKY_SECONDS),
+                                max_age=settings.REPLICA_STICKY_SECONDS, httponly=True, samesite='Lax')
+        return response
+
+    def is_sticky(self, request):
+        try:
+            return int(request.COOKIES.get(settings.REPLICA_STICKY_COOKIE, 0)) > time.time()
+        except ValueError:
+            return False
+
+
+class SqlInstrumentationMiddleware:
+    """Учет SQL-запросов представлений из SQL_INSTRUMENTATION_NAMESPACES
+
+    Для доли SQL_INSTRUMENTATION_SAMPLE_RATE запросов число выражений, время в базе и повторы
+    отдаются в заголовке Server-Timing. Запросы дольше SQL_SLOW_REQUEST_MS или с выражениями дольше
+    SQL_SLOW_QUERY_MS пишутся в журнал trading_network.sql одной JSON-строкой.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self.sampled():
+            return self.get_response(request)
+        request.sql_stats, token = instrumentation.begin(settings.SQL_SLOW_QUERY_MS)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            instrumentation.reset(token)
+        return self.process_response(request, response, time.perf_counter() - started)
+
+    async def __acall__(self, request):
+        if not self.sampled():
+            return await self.get_response(request)
+        request.sql_stats, token = instrumentation.begin(settings.SQL_SLOW_QUERY_MS)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            instrumentation.reset(token)
+        return self.process_response(request, response, time.perf_counter() - started)
+
+    def sampled(self):
+        rate = settings.SQL_INSTRUMENTATION_SAMPLE_RATE
+        return rate >= 1 or random.random() < rate
+
+    def process_response(self, request, response, elapsed):
+        match = request.resolver_match
+        if match is None or match.namespace not in settings.SQL_INSTRUMENTATION_NAMESPACES:
+            return response
+        stats = request.sql_stats
+        response['Server-Timing'] = (
+            f'db;dur={stats.duration * 1000:.3f};desc="{stats.count} queries, {stats.duplicated} duplicated", '
+            f'total;dur={elapsed * 1000:.3f}'
+        )
+        if elapsed * 1000 >= settings.SQL_SLOW_REQUEST_MS or stats.slow:
+            sql_logger.warning(json.dumps(self.log_record(request, response, elapsed, stats)))
+        return response
+
+    def log_record(self, request, response, elapsed, stats):
+        duplicates = sorted(stats.duplicates.items(), key=lambda item: item[1], reverse=True)
+        return {
+            'event': 'slow_request',
+            'method': request.method,
+            'path': request.get_full_path(),
+            'view': request.resolver_match.view_name,
+            'status': response.status_code,
+            'duration_ms': round(elapsed * 1000, 3),
+            'queries': stats.count,
+            'sql_ms': round(stats.duration * 1000, 3),
+            'duplicated': stats.duplicated,
+            'duplicates': [{'sql': sql[:1000], 'count': count} for sql, count in duplicates[:5]],
+            'slow_queries': [{'sql': sql[:1000], 'ms': round(duration * 1000, 3)} for sql, duration in stats.slow[:10]],
+        }
+
+
+class MetricsMiddleware:
+    """Число запросов, время, размер ответа и время в базе по имени URL (trading_network.metrics)
+
+    Стоит первым, чтобы время включало остальные middleware; время в базе берется
+    у SqlInstrumentationMiddleware и есть только у попавших в выборку запросов.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        started = time.perf_counter()
+        response = self.get_response(request)
+        self.observe(request, response, time.perf_counter() - started)
+        return response
+
+    async def __acall__(self, request):
+        started = time.perf_counter()
+        response = await self.get_response(request)
+        self.observe(request, response, time.perf_counter() - started)
+        return response
+
+    def observe(self, request, response, elapsed):
+        match = request.resolver_match
+        if match is None:
+            return
+        stats = getattr(request, 'sql_stats', None)
+        metrics.store.observe(
+            match.view_name, request.method, response.status_code, elapsed,
+            size=None if response.streaming else len(response.content),
+            db_duration=stats.duration if stats else None, db_queries=stats.count if stats else None,
+        )
+
+
+class ProfilingMiddleware:
+    """Профиль запроса администратора по заголовку X-Profile или параметру ?profile= (cprofile или stacks)
+
+    Профиль и его описание (время запроса, время и число SQL-запросов) сохраняются в PROFILE_DIR,
+    идентификатор возвращается в заголовке X-Profile-Id, скачать профиль можно по /profile/<id>/.
+    Запросы без заголовка и параметра проходят без проверок пользователя. Под ASGI синхронные представления
+    профилируются только выборкой стеков (stacks), cprofile для них отклоняется с кодом 400.
+    """
+    sync_capable = True
+    async_capable = True
+    authentication = CachedJWTAuthentication()
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        mode = self.requested_mode(request)
+        if mode is None:
+            return self.get_response(request)
+        try:
+            result = self.authentication.authenticate(request)
+        except (AuthenticationFailed, InvalidToken):
+            result = None
+        if not self.is_staff(result[0] if result is not None else request.user):
+            return self.get_response(request)
+
+        profile, token = self.begin(request, mode)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            profile.stop()
+            if token is not None:
+                instrumentation.reset(token)
+        return self.process_response(request, response, profile, time.perf_counter() - started)
+
+    async def __acall__(self, request):
+        mode = self.requested_mode(request)
+        if mode is None:
+            return await self.get_response(request)
+        try:
+            result = await self.authentication.aauthenticate(request)
+        except (AuthenticationFailed, InvalidToken):
+            result = None
+        if not self.is_staff(result[0] if result is not None else await request.auser()):
+            return await self.get_response(request)
+
+        sync_view = self.is_sync_view(request)
+        if sync_view and mode == 'cprofile':
+            return JsonResponse({'detail': 'Под ASGI синхронное представление выполняется в отдельном потоке, '
+                                           'cProfile его не видит: используйте profile=stacks'}, status=400)
+        profile, token = self.begin(request, mode)
+        if sync_view:
+            # поток представления становится известен в process_view
+            request.profile_to_follow = profile
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            profile.stop()
+            if token is not None:
+                instrumentation.reset(token)
+        return self.process_response(request, response, profile, time.perf_counter() - started)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        # под ASGI синхронный process_view выполняется через sync_to_async в том же потоке, что и представление
+        profile = getattr(request, 'profile_to_follow', None)
+        if profile is not None:
+            profile.follow(threading.get_ident())
+
+    def requested_mode(self, request):
+        mode = request.META.get('HTTP_X_PROFILE') or request.GET.get('profile')
+        return mode if mode in profiling.MODES else None
+
+    def is_sync_view(self, request):
+        try:
+            match = resolve(request.path_info, getattr(request, 'urlconf', None))
+        except Resolver404:
+            return False
+        return not iscoroutinefunction(match.func)
+
+    def is_staff(self, user):
+        return user.is_authenticated and user.is_staff
+
+    def begin(self, request, mode):
+        # время в базе нужно и для запросов, не попавших в выборку SqlInstrumentationMiddleware
+        token = None
+        if getattr(request, 'sql_stats', None) is None:
+            request.sql_stats, token = instrumentation.begin(settings.SQL_SLOW_QUERY_MS)
+        profile = profiling.Profile(mode)
+        profile.start()
+        return profile, token
+
+    def process_response(self, request, response, profile, elapsed):
+        match = request.resolver_match
+        stats = request.sql_stats
+        profile.save({
+            'method': request.method,
+            'path': request.get_full_path(),
+            'view': match.view_name if match is not None else None,
+            'status': response.status_code,
+            'duration_ms': round(elapsed * 1000, 3),
+            'queries': stats.count,
+            'sql_ms': round(stats.duration * 1000, 3),
+        })
+        response['X-Profile-Id'] = profile.id
+        response['X-Profile-Url'] = reverse('trading_network:profile', args=[profile.id])
+        return response
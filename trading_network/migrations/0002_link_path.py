@@ -0,0 +1,39 @@
+# Generated by Django 5.0.1 on 2026-10-18 12:59
+
+from django.db import migrations, models
+
+
+def fill_link_path(apps, schema_editor):
+    Link = apps.get_model('trading_network', 'Link')
+    generation = list(Link.objects.filter(supplier__isnull=True))
+    for link in generation:
+        link.path, link.level = '', 0
+    while generation:
+        Link.objects.bulk_update(generation, ['path', 'level'], batch_size=1000)
+        parents = {link.pk: link for link in generation}
+        generation = list(Link.objects.filter(supplier_id__in=parents))
+        for link in generation:
+            parent = parents[link.supplier_id]
+            link.path = f'{parent.path}{parent.pk}/'
+            link.level = parent.level + 1
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('trading_network', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='link',
+            name='path',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=255, verbose_name='Путь к звену'),
+        ),
+        migrations.AlterField(
+            model_name='link',
+            name='status_link',
+            field=models.CharField(choices=[('factory', 'Завод'), ('retail_network', 'Розничная сеть'), ('entrepreneur', 'Индивидуальный предприниматель')], max_length=30, verbose_name='звено сети'),
+        ),
+        migrations.RunPython(fill_link_path, migrations.RunPython.noop),
+    ]
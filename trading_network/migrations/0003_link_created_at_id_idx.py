@@ -0,0 +1,17 @@
+# Generated by Django 5.0.1 on 2026-10-18 13:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('trading_network', '0002_link_path'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='link',
+            index=models.Index(fields=['created_at', 'id'], name='link_created_at_id_idx'),
+        ),
+    ]
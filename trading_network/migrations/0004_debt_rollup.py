@@ -0,0 +1,70 @@
+# Generated by Django 5.0.1 on 2026-10-18 14:20
+
+from collections import defaultdict
+
+from django.db import migrations, models
+
+
+def fill_debt_rollup(apps, schema_editor):
+    """Сводка по текущей задолженности звеньев: строка-итог группы и строки стран контактов (как rollups.rebuild)"""
+    Link = apps.get_model('trading_network', 'Link')
+    Contact = apps.get_model('trading_network', 'Contact')
+    DebtRollup = apps.get_model('trading_network', 'DebtRollup')
+    groups = defaultdict(lambda: [0, 0])
+
+    def add(chunk):
+        countries = defaultdict(set)
+        for link_id, country in Contact.objects.filter(link_id__in=[row[0] for row in chunk]).values_list(
+                'link_id', 'country').distinct():
+            countries[link_id].add(country)
+        for pk, path, level, status_link, debt in chunk:
+            root_id = int(path.split('/', 1)[0]) if path else pk
+            for country in {''} | countries[pk]:
+                group = groups[(root_id, level, status_link, country)]
+                group[0] += debt
+                group[1] += 1
+
+    chunk = []
+    links = Link.objects.filter(debt__isnull=False).values_list('pk', 'path', 'level', 'status_link', 'debt')
+    for row in links.iterator(chunk_size=2000):
+        chunk.append(row)
+        if len(chunk) == 2000:
+            add(chunk)
+            chunk = []
+    add(chunk)
+    DebtRollup.objects.bulk_create(
+        (DebtRollup(root_id=root_id, level=level, status_link=status_link, country=country, total=total, links=count)
+         for (root_id, level, status_link, country), (total, count) in groups.items()),
+        batch_size=2000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('trading_network', '0003_link_created_at_id_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DebtRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('root_id', models.BigIntegerField(verbose_name='id завода')),
+                ('level', models.PositiveSmallIntegerField(verbose_name='Уровень звена')),
+                ('status_link', models.CharField(choices=[('factory', 'Завод'), ('retail_network', 'Розничная сеть'), ('entrepreneur', 'Индивидуальный предприниматель')], max_length=30, verbose_name='звено сети')),
+                ('country', models.CharField(blank=True, default='', max_length=100, verbose_name='Страна')),
+                ('total', models.DecimalField(decimal_places=2, default=0, max_digits=24, verbose_name='Задолженность')),
+                ('links', models.IntegerField(default=0, verbose_name='Количество звеньев с задолженностью')),
+            ],
+            options={
+                'verbose_name': 'Сводка задолженности',
+                'verbose_name_plural': 'Сводки задолженности',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='debtrollup',
+            constraint=models.UniqueConstraint(fields=('root_id', 'level', 'status_link', 'country'), name='debt_rollup_key'),
+        ),
+        migrations.RunPython(fill_debt_rollup, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.0.1 on 2026-10-18 14:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('trading_network', '0004_debt_rollup'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='contact',
+            index=models.Index(fields=['country', 'link'], name='contact_country_link_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='contact',
+            index=models.Index(fields=['city', 'link'], name='contact_city_link_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='link',
+            index=models.Index(fields=['status_link', 'level'], name='link_status_level_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='link',
+            index=models.Index(fields=['level', 'created_at'], name='link_level_created_at_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='link',
+            index=models.Index(fields=['debt', 'id'], name='link_debt_id_idx'),
+        ),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 5.0.1 on 2026-10-18 15:40
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('trading_network', '0005_link_filter_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DebtClearJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('pending', 'В очереди'), ('running', 'Выполняется'), ('done', 'Завершено'), ('failed', 'Ошибка')], default='pending', max_length=10, verbose_name='Статус')),
+                ('total', models.PositiveIntegerField(default=0, verbose_name='Звеньев в задании')),
+                ('processed', models.PositiveIntegerField(default=0, verbose_name='Обработано звеньев')),
+                ('cleared_total', models.DecimalField(decimal_places=2, default=0, max_digits=24, verbose_name='Очищено задолженности')),
+                ('error', models.TextField(blank=True, default='', verbose_name='Ошибка')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Время создания')),
+                ('started_at', models.DateTimeField(blank=True, null=True, verbose_name='Время запуска')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='Время завершения')),
+                ('created_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL, verbose_name='Автор')),
+            ],
+            options={
+                'verbose_name': 'Очистка задолженности',
+                'verbose_name_plural': 'Очистки задолженности',
+            },
+        ),
+        migrations.CreateModel(
+            name='DebtClearRecord',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('debt', models.DecimalField(blank=True, decimal_places=2, max_digits=20, null=True, verbose_name='Очищенная задолженность')),
+                ('processed_at', models.DateTimeField(blank=True, null=True, verbose_name='Время обработки')),
+                ('job', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='records', to='trading_network.debtclearjob', verbose_name='Задание')),
+                ('link', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='trading_network.link', verbose_name='Торговое звено')),
+            ],
+            options={
+                'verbose_name': 'Запись очистки задолженности',
+                'verbose_name_plural': 'Записи очистки задолженности',
+                'indexes': [models.Index(fields=['job', 'processed_at', 'id'], name='debt_clear_record_queue_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,71 @@
+# Generated by Django 5.0.1 on 2026-10-18 16:30
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def open_ledger(apps, schema_editor):
+    """Текущая задолженность звеньев переносится в журнал начальными остатками"""
+    Link = apps.get_model('trading_network', 'Link')
+    DebtTransaction = apps.get_model('trading_network', 'DebtTransaction')
+    now = django.utils.timezone.now()
+    batch = []
+    for link_id, debt in Link.objects.filter(debt__isnull=False).values_list('pk', 'debt').iterator(chunk_size=2000):
+        batch.append(DebtTransaction(link_id=link_id, amount=debt, kind='opening', created_at=now))
+        if len(batch) == 2000:
+            DebtTransaction.objects.bulk_create(batch)
+            batch = []
+    DebtTransaction.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('trading_network', '0006_debt_clear_job'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DebtTransaction',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=20, verbose_name='Изменение задолженности')),
+                ('kind', models.CharField(choices=[('opening', 'Начальный остаток'), ('charge', 'Начисление'), ('payment', 'Оплата'), ('adjustment', 'Корректировка'), ('clear', 'Очистка')], max_length=10, verbose_name='Вид проводки')),
+                ('comment', models.CharField(blank=True, default='', max_length=255, verbose_name='Комментарий')),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Время проводки')),
+                ('link', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='debt_transactions', to='trading_network.link', verbose_name='Торговое звено')),
+            ],
+            options={
+                'verbose_name': 'Проводка по задолженности',
+                'verbose_name_plural': 'Проводки по задолженности',
+            },
+        ),
+        migrations.CreateModel(
+            name='DebtSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('taken_at', models.DateTimeField(verbose_name='Момент снимка')),
+                ('balance', models.DecimalField(decimal_places=2, max_digits=20, verbose_name='Задолженность')),
+                ('link', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='debt_snapshots', to='trading_network.link', verbose_name='Торговое звено')),
+            ],
+            options={
+                'verbose_name': 'Снимок задолженности',
+                'verbose_name_plural': 'Снимки задолженности',
+                'indexes': [models.Index(fields=['taken_at'], name='debt_snapshot_taken_at_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='debtsnapshot',
+            constraint=models.UniqueConstraint(fields=('link', 'taken_at'), name='debt_snapshot_key'),
+        ),
+        migrations.AddIndex(
+            model_name='debttransaction',
+            index=models.Index(fields=['link', 'created_at', 'id'], name='debt_transaction_link_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='debttransaction',
+            index=models.Index(fields=['created_at'], name='debt_transaction_created_idx'),
+        ),
+        migrations.RunPython(open_ledger, migrations.RunPython.noop),
+    ]
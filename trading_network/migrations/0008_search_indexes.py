@@ -0,0 +1,78 @@
+# Generated by Django 5.0.1 on 2026-10-18 18:10
+
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVector
+from django.db import migrations
+
+# модель, имя GIN-индекса, поля поиска; выражение индекса совпадает с trading_network.search
+SEARCH_FIELDS = [
+    ('Link', 'link_search_idx', ('name',)),
+    ('Product', 'product_search_idx', ('name', 'model')),
+    ('Contact', 'contact_search_idx', ('country', 'city', 'street')),
+]
+SQLITE_TABLE = 'trading_network_search'
+
+
+def search_index(name, fields):
+    return GinIndex(SearchVector(*fields, config='simple'), name=name)
+
+
+def sqlite_statements(apps):
+    """FTS5-таблица поиска для SQLite и триггеры, поддерживающие ее в актуальном состоянии
+
+    rowid строки - id объекта * 3 + номер вида (звено, продукт, контакт), поэтому строки удаляются по rowid.
+    """
+    statements = [
+        f"CREATE VIRTUAL TABLE {SQLITE_TABLE} USING fts5(body, tokenize = 'unicode61 remove_diacritics 2')",
+    ]
+    for number, (model_name, _, fields) in enumerate(SEARCH_FIELDS):
+        table = apps.get_model('trading_network', model_name)._meta.db_table
+        rowid = f'{{row}}.id * 3 + {number}'
+        body = " || ' ' || ".join(f'{{row}}.{field}' for field in fields)
+        insert = (f'INSERT INTO {SQLITE_TABLE} (rowid, body) '
+                  f'VALUES ({rowid.format(row="new")}, {body.format(row="new")});')
+        delete = f'DELETE FROM {SQLITE_TABLE} WHERE rowid = {rowid.format(row="old")};'
+        statements += [
+            f'INSERT INTO {SQLITE_TABLE} (rowid, body) '
+            f'SELECT {rowid.format(row=table)}, {body.format(row=table)} FROM {table}',
+            f'CREATE TRIGGER {table}_search_insert AFTER INSERT ON {table} BEGIN {insert} END',
+            f'CREATE TRIGGER {table}_search_update AFTER UPDATE OF {", ".join(fields)} ON {table} '
+            f'BEGIN {delete} {insert} END',
+            f'CREATE TRIGGER {table}_search_delete AFTER DELETE ON {table} BEGIN {delete} END',
+        ]
+    return statements
+
+
+def create_search_indexes(apps, schema_editor):
+    """PostgreSQL - GIN-индексы полнотекстового поиска, SQLite - FTS5-таблица с триггерами"""
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        for model_name, name, fields in SEARCH_FIELDS:
+            schema_editor.add_index(apps.get_model('trading_network', model_name), search_index(name, fields))
+    elif vendor == 'sqlite':
+        for statement in sqlite_statements(apps):
+            schema_editor.execute(statement)
+
+
+def drop_search_indexes(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        for model_name, name, fields in SEARCH_FIELDS:
+            schema_editor.remove_index(apps.get_model('trading_network', model_name), search_index(name, fields))
+    elif vendor == 'sqlite':
+        for model_name, _, _ in SEARCH_FIELDS:
+            table = apps.get_model('trading_network', model_name)._meta.db_table
+            for event in ('insert', 'update', 'delete'):
+                schema_editor.execute(f'DROP TRIGGER IF EXISTS {table}_search_{event}')
+        schema_editor.execute(f'DROP TABLE IF EXISTS {SQLITE_TABLE}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('trading_network', '0007_debt_ledger'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_indexes, drop_search_indexes),
+    ]
@@ -1,6 +1,50 @@
+from django.db.models import Prefetch
+from rest_framework import serializers
+
 
 class RepresentationMixin:
     def to_representation(self, instance):
         representation = super().to_representation(instance)
         representation['status_link'] = instance.get_status_link_display()
         return representation
+
+
+class EagerLoadingMixin:
+    """Построение queryset с предзагрузкой связей по объявленным полям сериализатора
+
+    Вложенные сериализаторы (many=True) и ManyToMany-поля загружаются через Prefetch,
+    одиночные вложенные сериализаторы - через select_related.
+    Связи, которые нельзя вывести из полей (например, SerializerMethodField),
+    перечисляются в Meta.select_related_fields / Meta.prefetch_related_fields.
+    """
+
+    @classmethod
+    def setup_eager_loading(cls, queryset):
+        meta = getattr(cls, 'Meta', None)
+        select_related = list(getattr(meta, 'select_related_fields', ()))
+        prefetch_related = [Prefetch(lookup) for lookup in getattr(meta, 'prefetch_related_fields', ())]
+
+        for field in cls().fields.values():
+            if field.source == '*' or '.' in field.source:
+                continue
+            if isinstance(field, serializers.ListSerializer):
+                child_model = field.child.Meta.model
+                prefetch_related.append(Prefetch(field.source, queryset=child_model.objects.all()))
+            elif isinstance(field, serializers.ManyRelatedField):
+                prefetch_related.append(Prefetch(field.source))
+            elif isinstance(field, serializers.ModelSerializer):
+                select_related.append(field.source)
+
+        if select_related:
+            queryset = queryset.select_related(*select_related)
+        if prefetch_related:
+            queryset = queryset.prefetch_related(*prefetch_related)
+        return queryset
+
+
+class EagerLoadingViewMixin:
+    """Подготовка queryset представления через EagerLoadingMixin.setup_eager_loading сериализатора"""
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        return self.get_serializer_class().setup_eager_loading(queryset)
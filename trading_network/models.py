@@ -1,9 +1,30 @@
-from django.db import models
+from django.conf import settings
+from django.db import models, transaction
+from django.db.models import F, Value
+from django.db.models.functions import Concat, Substr
+from django.utils import timezone
 
 
 NULLABLE = {'null': True, 'blank': True}
 
 
+class LoadedValuesMixin:
+    """Сохраняет значения полей, загруженные из базы, для сравнения при сохранении без дополнительного запроса"""
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
+    def refresh_from_db(self, using=None, fields=None):
+        super().refresh_from_db(using, fields)
+        # перечитанные поля - новые значения из базы, иначе при сохранении сравнение идет с устаревшими
+        loaded = {field.attname: getattr(self, field.attname) for field in self._meta.concrete_fields
+                  if field.attname in self.__dict__ and (fields is None or {field.name, field.attname} & set(fields))}
+        self._loaded_values = {**getattr(self, '_loaded_values', {}), **loaded}
+
+
 class Product(models.Model):
     name = models.CharField(max_length=100, verbose_name='Название')
     model = models.CharField(max_length=100, verbose_name='Модель')
@@ -17,7 +38,15 @@ class Product(models.Model):
         verbose_name_plural = 'Продукты'
 
 
-class Link(models.Model):
+class LinkQuerySet(models.QuerySet):
+    def delete(self):
+        # rollups импортирует модели
+        from trading_network import rollups
+        with rollups.deleting():
+            return super().delete()
+
+
+class Link(LoadedValuesMixin, models.Model):
     class LinkStatus(models.TextChoices):
         FACTORY = 'factory', 'Завод'
         RETAIL_NETWORK = 'retail_network', 'Розничная сеть'
@@ -27,6 +56,8 @@ class Link(models.Model):
     supplier = models.ForeignKey('self', on_delete=models.CASCADE, verbose_name='Поставщик', **NULLABLE)
     name = models.CharField(max_length=100, verbose_name='Название', unique=True)
     level = models.PositiveSmallIntegerField(verbose_name='Уровень звена')
+    path = models.CharField(max_length=255, default='', editable=False, db_index=True,
+                            verbose_name='Путь к звену')
 
     products = models.ManyToManyField(Product, verbose_name='Продукты')
 
@@ -34,27 +65,107 @@ class Link(models.Model):
                                **NULLABLE)
     created_at = models.DateTimeField(auto_now_add=True, verbose_name='Время создания')
 
+    objects = LinkQuerySet.as_manager()
+
     def __str__(self):
         return f"{self.get_status_link_display()} - {self.name} (уровень - {self.level})"
 
     def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None and self.pk and not self._state.adding and not self.debt_changed:
+            # задолженность меняется проводками (ledger.post) без загрузки звена, поэтому неизмененная
+            # в памяти задолженность не записывается и не затирает проводку, сделанную после загрузки
+            update_fields = kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name != 'debt' and field.attname not in self.get_deferred_fields()
+            ]
+        if update_fields is not None and 'supplier' not in update_fields:
+            super().save(*args, **kwargs)
+            return
+
+        if self.is_supplier_cycle(self.supplier):
+            raise ValueError(f'Звено {self.pk} не может получать продукцию от себя или от звена своего поддерева')
+        old_prefix = self.descendants_prefix if self.pk else None
+        self.path = self.build_path(self.supplier)
         self.level = self.calculate_depth()
-        super().save(*args, **kwargs)
+        if update_fields is not None:
+            kwargs['update_fields'] = {*update_fields, 'path', 'level'}
+
+        if old_prefix is None or old_prefix == self.descendants_prefix:
+            super().save(*args, **kwargs)
+            return
+        # поддерево переносится до сохранения звена, чтобы сигналы post_save видели согласованную иерархию
+        with transaction.atomic():
+            self.rebase_descendants(old_prefix)
+            super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        from trading_network import rollups
+        with rollups.deleting():
+            return super().delete(*args, **kwargs)
+
+    @staticmethod
+    def build_path(supplier):
+        """Путь звена - id всех его поставщиков от завода, например '1/5/'"""
+        if supplier is None:
+            return ''
+        return f'{supplier.path}{supplier.pk}/'
+
+    @property
+    def debt_changed(self):
+        """Задолженность изменена в памяти относительно загруженной из базы"""
+        loaded = getattr(self, '_loaded_values', {}).get('debt', models.DEFERRED)
+        return loaded is models.DEFERRED or loaded != self._meta.get_field('debt').to_python(self.debt)
+
+    @property
+    def descendants_prefix(self):
+        return f'{self.path}{self.pk}/'
+
+    def is_supplier_cycle(self, supplier):
+        """Поставщик - само звено или звено его поддерева: такая смена поставщика замкнула бы иерархию в цикл"""
+        if self.pk is None or supplier is None:
+            return False
+        return supplier.pk == self.pk or supplier.path.startswith(self.descendants_prefix)
+
+    @property
+    def ancestor_ids(self):
+        return [int(pk) for pk in self.path.split('/') if pk]
+
+    @property
+    def root_id(self):
+        return self.ancestor_ids[0] if self.path else self.pk
 
     def calculate_depth(self):
-        depth = 0
-        parent = self.supplier
-        while parent:
-            depth += 1
-            parent = parent.supplier
-        return depth
+        return self.path.count('/')
+
+    def get_ancestors(self):
+        """Цепочка поставщиков звена от завода одним запросом"""
+        return Link.objects.filter(pk__in=self.ancestor_ids).order_by('level')
+
+    def get_descendants(self):
+        """Все звенья, получающие продукцию от данного звена, одним запросом по индексу"""
+        return Link.objects.filter(path__startswith=self.descendants_prefix)
+
+    def rebase_descendants(self, old_prefix):
+        """Перенос поддерева после смены поставщика: пути и уровни пересчитываются одним UPDATE"""
+        new_prefix = self.descendants_prefix
+        Link.objects.filter(path__startswith=old_prefix).update(
+            path=Concat(Value(new_prefix), Substr('path', len(old_prefix) + 1), output_field=models.CharField()),
+            level=F('level') + (new_prefix.count('/') - old_prefix.count('/')),
+        )
 
     class Meta:
         verbose_name = 'Торговое звено'
         verbose_name_plural = 'Торговые звенья'
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='link_created_at_id_idx'),
+            models.Index(fields=['status_link', 'level'], name='link_status_level_idx'),
+            models.Index(fields=['level', 'created_at'], name='link_level_created_at_idx'),
+            models.Index(fields=['debt', 'id'], name='link_debt_id_idx'),
+        ]
 
 
-class Contact(models.Model):
+class Contact(LoadedValuesMixin, models.Model):
     email = models.EmailField(max_length=100, verbose_name='email')
     country = models.CharField(max_length=100, verbose_name='Страна')
     city = models.CharField(max_length=100, verbose_name='Город')
@@ -68,3 +179,127 @@ class Contact(models.Model):
     class Meta:
         verbose_name = 'Контакт'
         verbose_name_plural = 'Контакты'
+        indexes = [
+            models.Index(fields=['country', 'link'], name='contact_country_link_idx'),
+            models.Index(fields=['city', 'link'], name='contact_city_link_idx'),
+        ]
+
+
+class DebtRollup(models.Model):
+    """Суммарная задолженность звеньев по заводу, уровню, типу звена и стране контактов
+
+    Строка с пустой страной - итог по всем звеньям группы. Звено с контактами в нескольких странах
+    учитывается в строке каждой страны, поэтому строки стран между собой не суммируются.
+    Поддерживается инкрементально модулем trading_network.rollups.
+    """
+    root_id = models.BigIntegerField(verbose_name='id завода')
+    level = models.PositiveSmallIntegerField(verbose_name='Уровень звена')
+    status_link = models.CharField(max_length=30, choices=Link.LinkStatus.choices, verbose_name='звено сети')
+    country = models.CharField(max_length=100, blank=True, default='', verbose_name='Страна')
+    total = models.DecimalField(max_digits=24, decimal_places=2, default=0, verbose_name='Задолженность')
+    links = models.IntegerField(default=0, verbose_name='Количество звеньев с задолженностью')
+
+    def __str__(self):
+        return f'{self.root_id} / {self.level} / {self.status_link} / {self.country or "*"}: {self.total}'
+
+    class Meta:
+        verbose_name = 'Сводка задолженности'
+        verbose_name_plural = 'Сводки задолженности'
+        constraints = [
+            models.UniqueConstraint(fields=['root_id', 'level', 'status_link', 'country'], name='debt_rollup_key'),
+        ]
+
+
+class DebtTransaction(models.Model):
+    """Проводка по задолженности звена; журнал только дополняется, Link.debt - кэшированный баланс по журналу"""
+    class Kind(models.TextChoices):
+        OPENING = 'opening', 'Начальный остаток'
+        CHARGE = 'charge', 'Начисление'
+        PAYMENT = 'payment', 'Оплата'
+        ADJUSTMENT = 'adjustment', 'Корректировка'
+        CLEAR = 'clear', 'Очистка'
+
+    link = models.ForeignKey(Link, on_delete=models.CASCADE, related_name='debt_transactions',
+                             verbose_name='Торговое звено')
+    amount = models.DecimalField(max_digits=20, decimal_places=2, verbose_name='Изменение задолженности')
+    kind = models.CharField(max_length=10, choices=Kind.choices, verbose_name='Вид проводки')
+    comment = models.CharField(max_length=255, blank=True, default='', verbose_name='Комментарий')
+    created_at = models.DateTimeField(default=timezone.now, verbose_name='Время проводки')
+
+    def __str__(self):
+        return f'{self.link_id}: {self.amount:+} ({self.get_kind_display()})'
+
+    class Meta:
+        verbose_name = 'Проводка по задолженности'
+        verbose_name_plural = 'Проводки по задолженности'
+        indexes = [
+            models.Index(fields=['link', 'created_at', 'id'], name='debt_transaction_link_idx'),
+            models.Index(fields=['created_at'], name='debt_transaction_created_idx'),
+        ]
+
+
+class DebtSnapshot(models.Model):
+    """Баланс звена на момент времени; баланс на дату - последний снимок плюс проводки после него"""
+    link = models.ForeignKey(Link, on_delete=models.CASCADE, related_name='debt_snapshots',
+                             verbose_name='Торговое звено')
+    taken_at = models.DateTimeField(verbose_name='Момент снимка')
+    balance = models.DecimalField(max_digits=20, decimal_places=2, verbose_name='Задолженность')
+
+    def __str__(self):
+        return f'{self.link_id} @ {self.taken_at}: {self.balance}'
+
+    class Meta:
+        verbose_name = 'Снимок задолженности'
+        verbose_name_plural = 'Снимки задолженности'
+        constraints = [
+            models.UniqueConstraint(fields=['link', 'taken_at'], name='debt_snapshot_key'),
+        ]
+        indexes = [
+            models.Index(fields=['taken_at'], name='debt_snapshot_taken_at_idx'),
+        ]
+
+
+class DebtClearJob(models.Model):
+    """Фоновое задание очистки задолженности, выполняется пачками в коротких транзакциях (trading_network.jobs)"""
+    class Status(models.TextChoices):
+        PENDING = 'pending', 'В очереди'
+        RUNNING = 'running', 'Выполняется'
+        DONE = 'done', 'Завершено'
+        FAILED = 'failed', 'Ошибка'
+
+    status = models.CharField(max_length=10, choices=Status.choices, default=Status.PENDING, verbose_name='Статус')
+    created_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, verbose_name='Автор',
+                                   **NULLABLE)
+    total = models.PositiveIntegerField(default=0, verbose_name='Звеньев в задании')
+    processed = models.PositiveIntegerField(default=0, verbose_name='Обработано звеньев')
+    cleared_total = models.DecimalField(max_digits=24, decimal_places=2, default=0,
+                                        verbose_name='Очищено задолженности')
+    error = models.TextField(blank=True, default='', verbose_name='Ошибка')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Время создания')
+    started_at = models.DateTimeField(verbose_name='Время запуска', **NULLABLE)
+    finished_at = models.DateTimeField(verbose_name='Время завершения', **NULLABLE)
+
+    def __str__(self):
+        return f'Задание №{self.pk} ({self.get_status_display()})'
+
+    class Meta:
+        verbose_name = 'Очистка задолженности'
+        verbose_name_plural = 'Очистки задолженности'
+
+
+class DebtClearRecord(models.Model):
+    """Звено в задании очистки задолженности; после обработки хранит очищенную сумму"""
+    job = models.ForeignKey(DebtClearJob, on_delete=models.CASCADE, related_name='records', verbose_name='Задание')
+    link = models.ForeignKey(Link, on_delete=models.SET_NULL, verbose_name='Торговое звено', **NULLABLE)
+    debt = models.DecimalField(max_digits=20, decimal_places=2, verbose_name='Очищенная задолженность', **NULLABLE)
+    processed_at = models.DateTimeField(verbose_name='Время обработки', **NULLABLE)
+
+    def __str__(self):
+        return f'{self.job_id} / {self.link_id}: {self.debt}'
+
+    class Meta:
+        verbose_name = 'Запись очистки задолженности'
+        verbose_name_plural = 'Записи очистки задолженности'
+        indexes = [
+            models.Index(fields=['job', 'processed_at', 'id'], name='debt_clear_record_queue_idx'),
+        ]
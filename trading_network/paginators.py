@@ -0,0 +1,70 @@
+from django.conf import settings
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import QuerySet
+from django.utils.functional import cached_property
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+
+
+class KeysetPagination(CursorPagination):
+    """Навигация по курсору: без COUNT(*) и OFFSET, устойчива к одновременным вставкам"""
+    page_size_query_param = 'page_size'
+    max_page_size = settings.MAX_PAGE_SIZE
+
+
+class OptionalCursorPagination(PageNumberPagination):
+    """Навигация по номеру страницы, по запросу (?pagination=cursor) - по курсору с порядком cursor_ordering
+
+    Последнее поле cursor_ordering уникально, порядок - от новых к старым, как у CursorPagination.
+    Другой порядок (ordering_param) курсор не поддерживает: такой запрос отклоняется, а не сортируется иначе.
+    """
+    page_size_query_param = 'page_size'
+    max_page_size = settings.MAX_PAGE_SIZE
+    cursor_ordering = ('-id',)
+    ordering_param = 'ordering'
+    cursor_paginator = None
+
+    def use_cursor(self, request):
+        return (request.query_params.get('pagination') == 'cursor'
+                or KeysetPagination.cursor_query_param in request.query_params)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.use_cursor(request):
+            if self.ordering_param in request.query_params:
+                raise ValidationError({self.ordering_param: [
+                    f'Навигация по курсору использует только порядок {", ".join(self.cursor_ordering)}'
+                ]})
+            self.cursor_paginator = KeysetPagination()
+            self.cursor_paginator.ordering = self.cursor_ordering
+            self.cursor_paginator.max_page_size = self.max_page_size
+            return self.cursor_paginator.paginate_queryset(queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.cursor_paginator is not None:
+            return self.cursor_paginator.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+
+class LinkPagination(OptionalCursorPagination):
+    # индекс link_created_at_id_idx читается в обратном порядке
+    cursor_ordering = ('-created_at', '-id')
+
+
+class EstimatedCountPaginator(Paginator):
+    """Пагинатор админки: для больших таблиц без фильтров вместо COUNT(*) используется оценка из pg_class"""
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if isinstance(queryset, QuerySet) and not queryset.query.where:
+            connection = connections[queryset.db]
+            if connection.vendor == 'postgresql':
+                with connection.cursor() as cursor:
+                    cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass',
+                                   [queryset.model._meta.db_table])
+                    row = cursor.fetchone()
+                if row and row[0] >= settings.ADMIN_COUNT_ESTIMATE_THRESHOLD:
+                    return row[0]
+        return super().count
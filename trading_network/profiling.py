@@ -0,0 +1,126 @@
+import cProfile
+import json
+import re
+import sys
+import threading
+import uuid
+from collections import Counter
+from pathlib import Path
+
+from django.conf import settings
+from django.utils import timezone
+
+MODES = ('cprofile', 'stacks')
+EXTENSIONS = {'cprofile': 'prof', 'stacks': 'folded'}
+PROFILE_ID = re.compile(r'\d{8}-\d{12}-[0-9a-f]{8}')
+
+
+def fold(frame):
+    """Стек кадра в свернутом виде: модуль.функция от внешнего вызова к внутреннему через ;"""
+    names = []
+    while frame is not None:
+        names.append(f'{frame.f_globals.get("__name__", "?")}.{frame.f_code.co_qualname}')
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+class StackSampler:
+    """Стеки одного потока раз в interval секунд из отдельного потока (sys._current_frames)"""
+
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, name='profile-sampler', daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                self.stacks[fold(frame)] += 1
+
+    def dump(self, path):
+        # формат flamegraph.pl и speedscope: "стек число_выборок" в строке
+        path.write_text(''.join(f'{stack} {count}\n' for stack, count in self.stacks.most_common()))
+
+
+class Profile:
+    """Профиль одного запроса: cProfile (.prof для pstats и snakeviz) или выборка стеков (.folded)
+
+    Профилируется поток, в котором создан профиль: поток запроса под WSGI, поток цикла событий под ASGI.
+    Синхронное представление под ASGI выполняется в потоке sync_to_async: выборка стеков переключается
+    на него методом follow, cProfile профилирует только свой поток и для таких представлений не подходит.
+    """
+
+    def __init__(self, mode):
+        self.mode = mode
+        self.id = f'{timezone.now():%Y%m%d-%H%M%S%f}-{uuid.uuid4().hex[:8]}'
+        if mode == 'cprofile':
+            self.profiler = cProfile.Profile()
+        else:
+            self.profiler = StackSampler(threading.get_ident(), settings.PROFILE_SAMPLE_INTERVAL_MS / 1000)
+
+    def follow(self, thread_id):
+        """Выборка стеков потока thread_id вместо потока, в котором создан профиль"""
+        self.profiler.thread_id = thread_id
+
+    def start(self):
+        if self.mode == 'cprofile':
+            self.profiler.enable()
+        else:
+            self.profiler.start()
+
+    def stop(self):
+        if self.mode == 'cprofile':
+            self.profiler.disable()
+        else:
+            self.profiler.stop()
+
+    def save(self, info):
+        """Запись профиля и его описания (info) в PROFILE_DIR, старые профили сверх PROFILE_KEEP удаляются"""
+        directory = Path(settings.PROFILE_DIR)
+        directory.mkdir(parents=True, exist_ok=True)
+        file = directory / f'{self.id}.{EXTENSIONS[self.mode]}'
+        if self.mode == 'cprofile':
+            self.profiler.dump_stats(file)
+        else:
+            self.profiler.dump(file)
+        (directory / f'{self.id}.json').write_text(json.dumps({'id': self.id, 'mode': self.mode, 'file': file.name,
+                                                               **info}))
+        for stale in list_profiles()[settings.PROFILE_KEEP:]:
+            delete(stale['id'])
+
+
+def list_profiles():
+    """Описания сохраненных профилей, новые первыми"""
+    profiles = []
+    for file in sorted(Path(settings.PROFILE_DIR).glob('*.json'), reverse=True):
+        try:
+            profiles.append(json.loads(file.read_text()))
+        except (OSError, ValueError):
+            continue
+    return profiles
+
+
+def get_file(profile_id):
+    """Файл профиля или None для неизвестного (или некорректного) идентификатора"""
+    if not PROFILE_ID.fullmatch(profile_id):
+        return None
+    for extension in EXTENSIONS.values():
+        file = Path(settings.PROFILE_DIR) / f'{profile_id}.{extension}'
+        if file.exists():
+            return file
+    return None
+
+
+def delete(profile_id):
+    for extension in ('json', *EXTENSIONS.values()):
+        (Path(settings.PROFILE_DIR) / f'{profile_id}.{extension}').unlink(missing_ok=True)
@@ -0,0 +1,155 @@
+from collections import defaultdict, namedtuple
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.db import IntegrityError, transaction
+from django.db.models import DEFERRED, F, Q
+
+from trading_network.models import Contact, DebtRollup, Link
+
+LinkState = namedtuple('LinkState', ['pk', 'path', 'level', 'status_link', 'debt'])
+
+_suspended = ContextVar('debt_rollup_suspended', default=False)
+_deleting = ContextVar('debt_rollup_deleting', default=frozenset())
+
+
+def root_of(pk, path):
+    return int(path.split('/', 1)[0]) if path else pk
+
+
+def link_state(link):
+    """Состояние звена, загруженное из базы (до изменений), без дополнительного запроса, если это возможно"""
+    loaded = getattr(link, '_loaded_values', {})
+    if all(loaded.get(field, DEFERRED) is not DEFERRED for field in LinkState._fields[1:]):
+        return LinkState(link.pk, *(loaded[field] for field in LinkState._fields[1:]))
+    row = Link.objects.filter(pk=link.pk).values_list(*LinkState._fields).first()
+    return LinkState(*row) if row else None
+
+
+def contributions(states, countries, sign=1, totals=True):
+    """Вклад звеньев в строки сводки: {(завод, уровень, тип, страна): [сумма, количество]}
+
+    totals=False - только строки стран, без строки-итога группы.
+    """
+    groups = defaultdict(lambda: [0, 0])
+    for state in states:
+        if state is None or state.debt is None:
+            continue
+        key = (root_of(state.pk, state.path), state.level, state.status_link)
+        for country in ({''} if totals else set()) | countries.get(state.pk, set()):
+            group = groups[(*key, country)]
+            group[0] += sign * state.debt
+            group[1] += sign
+    return groups
+
+
+def apply(groups):
+    for (root_id, level, status_link, country), (total, links) in groups.items():
+        if not total and not links:
+            continue
+        key = {'root_id': root_id, 'level': level, 'status_link': status_link, 'country': country}
+        values = {'total': F('total') + total, 'links': F('links') + links}
+        if DebtRollup.objects.filter(**key).update(**values):
+            continue
+        try:
+            with transaction.atomic():
+                DebtRollup.objects.create(**key, total=total, links=links)
+        except IntegrityError:
+            DebtRollup.objects.filter(**key).update(**values)
+
+
+def link_countries(link_ids):
+    countries = defaultdict(set)
+    for link_id, country in Contact.objects.filter(link_id__in=link_ids).values_list('link_id', 'country').distinct():
+        countries[link_id].add(country)
+    return countries
+
+
+def apply_queryset(queryset, sign=1):
+    """Добавление (sign=1) или вычитание (sign=-1) вклада всех звеньев queryset"""
+    indebted = queryset.filter(debt__isnull=False)
+    states = (LinkState(*row) for row in indebted.values_list(*LinkState._fields).iterator())
+    apply(contributions(states, link_countries(indebted.values('pk')), sign))
+
+
+def rebuild(root_ids=None):
+    """Полный пересчет сводки или только для указанных заводов"""
+    rollups, links = DebtRollup.objects.all(), Link.objects.all()
+    if root_ids is not None:
+        subtrees = Q(pk__in=root_ids)
+        for root_id in root_ids:
+            subtrees |= Q(path__startswith=f'{root_id}/')
+        rollups, links = rollups.filter(root_id__in=root_ids), links.filter(subtrees)
+    with transaction.atomic():
+        rollups.delete()
+        apply_queryset(links)
+
+
+@contextmanager
+def track(link_ids):
+    """Учет bulk-изменений звеньев: вклад вычитается до блока и добавляется после него,
+    обработчики сигналов внутри блока отключены"""
+    links = Link.objects.filter(pk__in=list(link_ids))
+    apply_queryset(links, -1)
+    token = _suspended.set(True)
+    try:
+        yield
+    finally:
+        _suspended.reset(token)
+    apply_queryset(links)
+
+
+def suspended():
+    return _suspended.get()
+
+
+def link_saved(old, new):
+    if old == new:
+        return
+    if old is not None and old.path != new.path:
+        # при смене поставщика переносится все поддерево
+        rebuild({root_of(old.pk, old.path), root_of(new.pk, new.path)})
+        return
+    if (old is None or old.debt is None) and new.debt is None:
+        return
+    countries = link_countries([new.pk])
+    groups = contributions([old], countries, -1)
+    for key, (total, links) in contributions([new], countries).items():
+        groups[key][0] += total
+        groups[key][1] += links
+    apply(groups)
+
+
+@contextmanager
+def deleting():
+    """Удаление звеньев: звенья, удаляемые в блоке, отмечаются в _deleting обработчиками pre_delete,
+    чтобы удаление их контактов не меняло сводку повторно; после блока, в том числе после ошибки,
+    отметки сбрасываются"""
+    token = _deleting.set(_deleting.get())
+    try:
+        yield
+    finally:
+        _deleting.reset(token)
+
+
+def link_deleting(link):
+    _deleting.set(_deleting.get() | {link.pk})
+    state = link_state(link)
+    if state is not None and state.debt is not None:
+        apply(contributions([state], link_countries([link.pk]), -1))
+
+
+def link_deleted(link):
+    _deleting.set(_deleting.get() - {link.pk})
+
+
+def contact_changed(link_id, country, sign, exclude_pk):
+    """Звено попадает в строку страны, пока у него есть хотя бы один контакт в этой стране"""
+    if link_id is None or link_id in _deleting.get():
+        return
+    state = Link.objects.filter(pk=link_id).values_list(*LinkState._fields).first()
+    if state is None or state[-1] is None:
+        return
+    if Contact.objects.filter(link_id=link_id, country=country).exclude(pk=exclude_pk).exists():
+        return
+    apply(contributions([LinkState(*state)], {link_id: {country}}, sign, totals=False))
@@ -0,0 +1,45 @@
+import random
+from contextvars import ContextVar
+
+from django.conf import settings
+
+_routing = ContextVar('read_routing', default=None)
+
+
+class ReadRouting:
+    """Режим чтения запроса. Объект изменяется на месте, поэтому включение реплик в process_view,
+    выполненном через sync_to_async, видно и асинхронному представлению"""
+
+    def __init__(self):
+        self.replica = False
+
+
+def begin():
+    """Режим чтения для текущего запроса (по умолчанию - основная база) и токен для его сброса"""
+    routing = ReadRouting()
+    return routing, _routing.set(routing)
+
+
+def reset(token):
+    _routing.reset(token)
+
+
+class ReplicaRouter:
+    """Чтение с реплик DATABASE_READ_REPLICAS только внутри запросов, отмеченных ReplicaRoutingMiddleware;
+    запись, миграции и все остальные чтения - основная база"""
+
+    def db_for_read(self, model, **hints):
+        routing = _routing.get()
+        if routing is not None and routing.replica and settings.DATABASE_READ_REPLICAS:
+            return random.choice(settings.DATABASE_READ_REPLICAS)
+        return None
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # реплики содержат те же данные, что и основная база
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == 'default'
@@ -0,0 +1,111 @@
+import re
+from dataclasses import dataclass
+from functools import reduce
+from operator import and_, or_
+from typing import Callable
+
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+from django.db import connections
+from django.db.models import Case, CharField, FloatField, Q, Value, When
+from django.db.models.expressions import RawSQL
+
+from trading_network.models import Contact, Link, Product
+
+# таблица FTS5 для SQLite (миграция 0008), rowid = id * 3 + номер вида
+SQLITE_TABLE = 'trading_network_search'
+
+
+@dataclass(frozen=True)
+class Kind:
+    """Вид результата поиска: модель, поля поиска (в порядке индекса миграции 0008), номер в rowid FTS5,
+    заголовок результата и звено, к которому он относится"""
+    name: str
+    model: type
+    fields: tuple
+    number: int
+    title: Callable
+    link_id: Callable
+
+
+KINDS = {
+    'link': Kind('link', Link, ('name',), 0, lambda link: link.name, lambda link: link.pk),
+    'product': Kind('product', Product, ('name', 'model'), 1, str, lambda product: None),
+    'contact': Kind('contact', Contact, ('country', 'city', 'street'), 2,
+                    lambda contact: f'{contact.country}, {contact.city}, {contact.street} {contact.num_house}',
+                    lambda contact: contact.link_id),
+}
+
+
+def terms(query):
+    """Слова запроса в нижнем регистре, каждое ищется как начало слова"""
+    return re.findall(r'[^\W_]+', query.lower())
+
+
+def search(query, kinds, limit):
+    """Звенья, продукты и контакты, в словах которых есть начала всех слов query, по убыванию релевантности
+
+    Результат - словари type, id, title, link (звено результата) и rank; для каждого вида берется
+    не больше limit лучших, общий список тоже обрезается до limit.
+    """
+    words = terms(query)
+    if not words:
+        return []
+    results = []
+    for kind in kinds:
+        connection = connections[kind.model.objects.db]
+        if connection.vendor == 'postgresql':
+            found = _search_postgresql(kind, query, limit)
+        elif connection.vendor == 'sqlite':
+            found = _search_sqlite(connection, kind, query, words, limit)
+        else:
+            found = _search_icontains(kind, query, words, limit)
+        results += [{'type': kind.name, 'id': obj.pk, 'title': kind.title(obj), 'link': kind.link_id(obj),
+                     'rank': round(rank, 6)} for obj, rank in found]
+    results.sort(key=lambda result: (-result['rank'], result['type'], result['id']))
+    return results[:limit]
+
+
+def _starts_with(kind, query):
+    return reduce(or_, (Q(**{f'{field}__istartswith': query}) for field in kind.fields))
+
+
+def _prefix_rank(kind, query):
+    # совпадение с началом поля важнее частоты слов
+    return Case(When(_starts_with(kind, query), then=Value(1.0)), default=Value(0.0), output_field=FloatField())
+
+
+def _search_postgresql(kind, query, limit):
+    # то же выражение, что и у GIN-индекса миграции 0008, иначе индекс не используется
+    vector = SearchVector(*kind.fields, config='simple')
+    # слова запроса разбирает тот же парсер, что и поля: 'gen-15' - это лексемы 'gen' и '-15'
+    prefixes = RawSQL("SELECT string_agg(quote_literal(lexeme) || ':*', ' & ') FROM unnest(to_tsvector('simple', %s))",
+                      [query], output_field=CharField())
+    search_query = SearchQuery(prefixes, config='simple', search_type='raw')
+    queryset = (kind.model.objects.alias(search=vector).filter(search=search_query)
+                .annotate(rank=SearchRank(vector, search_query) + _prefix_rank(kind, query))
+                .order_by('-rank', 'pk')[:limit])
+    return [(obj, obj.rank) for obj in queryset]
+
+
+def _search_sqlite(connection, kind, query, words, limit):
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'SELECT rowid / 3, bm25({SQLITE_TABLE}) FROM {SQLITE_TABLE} '
+            f'WHERE {SQLITE_TABLE} MATCH %s AND rowid %% 3 = %s ORDER BY bm25({SQLITE_TABLE}) LIMIT %s',
+            [' '.join(f'"{word}"*' for word in words), kind.number, limit],
+        )
+        rows = cursor.fetchall()
+    objects = kind.model.objects.in_bulk([pk for pk, _ in rows])
+    starts_with = set(kind.model.objects.filter(_starts_with(kind, query), pk__in=objects).values_list('pk', flat=True))
+    # bm25 тем меньше, чем релевантнее совпадение
+    found = [(objects[pk], -score + (pk in starts_with)) for pk, score in rows if pk in objects]
+    return sorted(found, key=lambda item: -item[1])
+
+
+def _search_icontains(kind, query, words, limit):
+    """Поиск в СУБД без полнотекстового индекса: каждое слово - подстрока одного из полей (полный просмотр таблицы),
+    релевантность - только совпадение с началом поля"""
+    matches = reduce(and_, (reduce(or_, (Q(**{f'{field}__icontains': word}) for field in kind.fields))
+                            for word in words))
+    queryset = kind.model.objects.filter(matches).annotate(rank=_prefix_rank(kind, query)).order_by('-rank', 'pk')
+    return [(obj, obj.rank) for obj in queryset[:limit]]
@@ -1,8 +1,15 @@
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import transaction
 from rest_framework import serializers
+from rest_framework.relations import MANY_RELATION_KWARGS
 
-from trading_network.mixins import RepresentationMixin
-from trading_network.models import Link, Contact, Product
-from trading_network.validators import ProductSupplierRelationshipValidator, StatusLinkSupplierValidator
+from trading_network import rollups
+from trading_network.cache import invalidate
+from trading_network.catalogs import prune_descendant_catalogs
+from trading_network.mixins import EagerLoadingMixin, RepresentationMixin
+from trading_network.models import DebtTransaction, Link, Contact, Product
+from trading_network.validators import ProductSupplierRelationshipValidator, StatusLinkSupplierValidator, \
+    SupplierCycleValidator
 
 
 class ContactSerializer(serializers.ModelSerializer):
@@ -12,6 +19,45 @@ class ContactSerializer(serializers.ModelSerializer):
         exclude = ('link',)
 
 
+class BulkManyRelatedField(serializers.ManyRelatedField):
+    """Список id связанных объектов проверяется одним запросом вместо запроса на каждый id"""
+
+    def to_internal_value(self, data):
+        if isinstance(data, str) or not hasattr(data, '__iter__'):
+            self.fail('not_a_list', input_type=type(data).__name__)
+        if not self.allow_empty and len(data) == 0:
+            self.fail('empty')
+
+        relation = self.child_relation
+        queryset = relation.get_queryset()
+        pks = []
+        for item in data:
+            try:
+                pks.append(queryset.model._meta.pk.to_python(item))
+            except (DjangoValidationError, TypeError, ValueError):
+                relation.fail('incorrect_type', data_type=type(item).__name__)
+        objects = queryset.in_bulk(set(pks))
+        for item, pk in zip(data, pks):
+            if pk not in objects:
+                relation.fail('does_not_exist', pk_value=item)
+        return [objects[pk] for pk in pks]
+
+
+class BulkPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    """PrimaryKeyRelatedField, у которого many=True проверяет весь список одним запросом"""
+
+    @classmethod
+    def many_init(cls, *args, **kwargs):
+        list_kwargs = {'child_relation': cls(*args, **kwargs)}
+        for key in kwargs:
+            if key in MANY_RELATION_KWARGS:
+                list_kwargs[key] = kwargs[key]
+        return BulkManyRelatedField(**list_kwargs)
+
+
+CONTACT_FIELDS = ['email', 'country', 'city', 'street', 'num_house']
+
+
 class ProductSerializer(serializers.ModelSerializer):
     """Сериализатор продуктов"""
     class Meta:
@@ -19,24 +65,31 @@ class ProductSerializer(serializers.ModelSerializer):
         fields = '__all__'
 
 
+class LinkContactSerializer(ContactSerializer):
+    """Сериализатор контакта в составе звена: переданный id указывает, какой контакт обновить"""
+    id = serializers.IntegerField(required=False)
+
+
 class LinkSerializer(RepresentationMixin, serializers.ModelSerializer):
     """Сериализатор на запись торговых звеньев"""
-    contact = ContactSerializer(required=True, many=True, source='contact_set')
+    contact = LinkContactSerializer(required=True, many=True, source='contact_set')
+    products = BulkPrimaryKeyRelatedField(many=True, queryset=Product.objects.all(), label='Продукты')
 
     class Meta:
         model = Link
         fields = ['id', 'status_link', 'supplier', 'name', 'level', 'products', 'debt', 'contact']
         read_only_fields = ['debt', 'level']
         validators = [StatusLinkSupplierValidator('status_link', 'supplier'),
-                      ProductSupplierRelationshipValidator('supplier', 'products')]
+                      ProductSupplierRelationshipValidator('supplier', 'products'),
+                      SupplierCycleValidator('supplier')]
 
     def create(self, validated_data):
         contacts = validated_data.pop('contact_set')
         products = validated_data.pop('products')
-        link = Link.objects.create(**validated_data)
-        for contact in contacts:
-            Contact.objects.create(link=link, **contact)
-        link.products.set(products)
+        with transaction.atomic():
+            link = Link.objects.create(**validated_data)
+            self.write_products(link, products, created=True)
+            self.write_contacts(link, contacts, created=True)
         return link
 
     def update(self, instance, validated_data):
@@ -44,30 +97,80 @@ class LinkSerializer(RepresentationMixin, serializers.ModelSerializer):
         instance.supplier = validated_data.get('supplier', instance.supplier)
         instance.name = validated_data.get('name', instance.name)
 
-        products_data = validated_data.get('products')
-        if products_data is not None:
-            instance.products.set(products_data)
-
-        instance.save()
-
-        get_contact_data = validated_data.get('contact_set')
-        if get_contact_data:
-            contact_data = validated_data.pop('contact_set')
-            contacts = instance.contact_set.all()
-
-            for i, contact in enumerate(contacts):
-                contact_info = contact_data[i]
-                contact.email = contact_info.get('email', contact.email)
-                contact.country = contact_info.get('country', contact.country)
-                contact.city = contact_info.get('city', contact.city)
-                contact.street = contact_info.get('street', contact.street)
-                contact.num_house = contact_info.get('num_house', contact.num_house)
-                contact.save()
-
+        with transaction.atomic():
+            # задолженность только для чтения и меняется проводками, устаревшее значение из памяти не записывается
+            instance.save(update_fields=['status_link', 'supplier', 'name'])
+            if 'products' in validated_data:
+                self.write_products(instance, validated_data['products'])
+            if 'contact_set' in validated_data:
+                self.write_contacts(instance, validated_data['contact_set'])
         return instance
 
-
-class LinkReadSerializer(RepresentationMixin, serializers.ModelSerializer):
+    @staticmethod
+    def write_products(link, products, created=False):
+        """Разница между текущими и переданными продуктами: одно удаление и одна вставка строк связи,
+        исключенные продукты удаляются и из каталогов поддерева"""
+        LinkProduct = Link.products.through
+        current = set()
+        if not created:
+            current = set(LinkProduct.objects.filter(link=link).values_list('product_id', flat=True))
+        wanted = {product.pk for product in products}
+        if current - wanted:
+            LinkProduct.objects.filter(link=link, product_id__in=current - wanted).delete()
+            prune_descendant_catalogs({link: current - wanted})
+        LinkProduct.objects.bulk_create(
+            LinkProduct(link_id=link.pk, product_id=product_id) for product_id in wanted - current
+        )
+
+    @staticmethod
+    def write_contacts(link, contacts, created=False):
+        """Разница между текущими и переданными контактами: bulk-вставка, bulk-обновление и одно удаление
+
+        Контакт с id обновляет контакт звена с этим id, контакты без id занимают оставшиеся
+        по порядку, лишние создаются (при частичном обновлении для них нужны все поля контакта),
+        не получившие данных удаляются.
+        """
+        if created:
+            Contact.objects.bulk_create(Contact(link=link, **dict(contact, id=None)) for contact in contacts)
+            invalidate('contact')
+            return
+
+        existing = {contact.pk: contact for contact in Contact.objects.filter(link=link).order_by('pk')}
+        unknown = [contact['id'] for contact in contacts if 'id' in contact and contact['id'] not in existing]
+        if unknown:
+            raise serializers.ValidationError(
+                {'contact': [f'Контакт с id={pk} не относится к звену' for pk in unknown]})
+
+        matched = {contact['id'] for contact in contacts if 'id' in contact}
+        free = iter([contact for pk, contact in existing.items() if pk not in matched])
+        to_create, to_update = [], []
+        for data in contacts:
+            data = dict(data)
+            contact = existing[data.pop('id')] if 'id' in data else next(free, None)
+            if contact is None:
+                to_create.append(data)
+                continue
+            for field, value in data.items():
+                setattr(contact, field, value)
+            to_update.append(contact)
+        to_delete = [contact.pk for contact in free]
+        incomplete = [[field for field in CONTACT_FIELDS if field not in data] for data in to_create]
+        if any(incomplete):
+            raise serializers.ValidationError({'contact': [
+                f'Для нового контакта обязательны поля: {", ".join(fields)}' for fields in incomplete if fields
+            ]})
+
+        # задолженность звена в сводке по странам пересчитывается один раз для всех изменений контактов
+        with rollups.track([link.pk] if link.debt is not None else []):
+            if to_delete:
+                Contact.objects.filter(pk__in=to_delete).delete()
+            if to_update:
+                Contact.objects.bulk_update(to_update, CONTACT_FIELDS)
+            Contact.objects.bulk_create(Contact(link=link, **data) for data in to_create)
+        invalidate('contact')
+
+
+class LinkReadSerializer(EagerLoadingMixin, RepresentationMixin, serializers.ModelSerializer):
     """Сериализатор на чтение торговых звеньев"""
     contact = ContactSerializer(many=True, source='contact_set')
     products = ProductSerializer(many=True)
@@ -76,6 +179,73 @@ class LinkReadSerializer(RepresentationMixin, serializers.ModelSerializer):
     class Meta:
         model = Link
         fields = ['id', 'status_link', 'supplier', 'name', 'level', 'products', 'debt', 'contact']
+        select_related_fields = ['supplier']
 
     def get_supplier(self, obj):
         return obj.supplier.__str__()
+
+
+class LinkBulkItemSerializer(serializers.Serializer):
+    """Сериализатор звена в пакетной загрузке, связи передаются id и проверяются для всего пакета сразу"""
+    id = serializers.IntegerField(required=False)
+    status_link = serializers.ChoiceField(choices=Link.LinkStatus.choices)
+    supplier = serializers.IntegerField(required=False, allow_null=True)
+    name = serializers.CharField(max_length=100)
+    products = serializers.ListField(child=serializers.IntegerField(), required=False)
+    contact = ContactSerializer(required=True, many=True, source='contact_set')
+
+
+class CatalogPruneSerializer(serializers.Serializer):
+    """Параметры удаления продуктов из каталогов поддерева звена"""
+    products = serializers.ListField(child=serializers.IntegerField(), required=False)
+    dry_run = serializers.BooleanField(default=False)
+
+
+class DebtTransactionSerializer(serializers.ModelSerializer):
+    """Сериализатор проводок по задолженности: начисление увеличивает задолженность, оплата уменьшает"""
+    kind = serializers.ChoiceField(choices=[
+        (kind.value, kind.label) for kind in (DebtTransaction.Kind.CHARGE, DebtTransaction.Kind.PAYMENT,
+                                              DebtTransaction.Kind.ADJUSTMENT)
+    ])
+
+    class Meta:
+        model = DebtTransaction
+        fields = ['id', 'amount', 'kind', 'comment', 'created_at']
+        read_only_fields = ['created_at']
+
+    def validate(self, attrs):
+        amount, kind = attrs['amount'], attrs['kind']
+        if not amount:
+            raise serializers.ValidationError({'amount': 'Сумма проводки не может быть нулевой'})
+        if kind == DebtTransaction.Kind.CHARGE and amount < 0:
+            raise serializers.ValidationError({'amount': 'Начисление должно быть положительным'})
+        if kind == DebtTransaction.Kind.PAYMENT and amount > 0:
+            raise serializers.ValidationError({'amount': 'Оплата должна быть отрицательной'})
+        return attrs
+
+
+class LinkBalanceSerializer(serializers.Serializer):
+    """Задолженность звена по журналу на момент as_of (без as_of - текущая), без задолженности - 0.00"""
+    id = serializers.IntegerField()
+    as_of = serializers.DateTimeField(allow_null=True)
+    debt = serializers.DecimalField(max_digits=20, decimal_places=2)
+
+
+class DebtRollupSerializer(serializers.Serializer):
+    """Сериализатор группы сводки задолженности, выводятся только поля группировки и итоги"""
+    root = serializers.IntegerField(required=False)
+    root_name = serializers.CharField(required=False)
+    level = serializers.IntegerField(required=False)
+    status_link = serializers.CharField(required=False)
+    country = serializers.CharField(required=False)
+    debt = serializers.DecimalField(max_digits=24, decimal_places=2)
+    links = serializers.IntegerField()
+
+
+class SearchResultSerializer(serializers.Serializer):
+    """Результат поиска: вид (link, product, contact), объект, заголовок, звено и релевантность"""
+    type = serializers.CharField()
+    id = serializers.IntegerField()
+    title = serializers.CharField()
+    link = serializers.IntegerField(allow_null=True)
+    rank = serializers.FloatField()
@@ -0,0 +1,194 @@
+import csv
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Q, QuerySet
+from rest_framework import serializers
+from rest_framework.relations import PrimaryKeyRelatedField
+from rest_framework.utils.encoders import JSONEncoder
+
+from trading_network import rollups
+from trading_network.cache import invalidate
+from trading_network.catalogs import prune_descendant_catalogs
+from trading_network.models import Contact, Link, Product
+from trading_network.serializers import LinkBulkItemSerializer
+from trading_network.validators import ProductSupplierRelationshipValidator, StatusLinkSupplierValidator, \
+    SupplierCatalog, SupplierCycleValidator
+
+DOES_NOT_EXIST = PrimaryKeyRelatedField.default_error_messages['does_not_exist']
+
+
+def build_tree(root, nodes, serializer_class, context=None):
+    """Вложенное представление поддерева: каждое звено дополняется списком children
+
+    nodes должны быть упорядочены так, чтобы поставщик шел раньше своих звеньев (например, по path).
+    """
+    nodes = list(nodes)
+    tree = {}
+    for node, data in zip([root] + nodes, serializer_class([root] + nodes, many=True, context=context).data):
+        data['children'] = []
+        tree[node.pk] = data
+        if node is not root:
+            tree[node.supplier_id]['children'].append(data)
+    return tree[root.pk]
+
+
+def iter_serialized(nodes, serializer_class, context=None, chunk_size=500):
+    """Поштучная сериализация звеньев, queryset читается серверным курсором пачками chunk_size"""
+    if isinstance(nodes, QuerySet):
+        nodes = nodes.iterator(chunk_size=chunk_size)
+    serializer = serializer_class(context=context)
+    for node in nodes:
+        data = serializer.to_representation(node)
+        data['supplier_id'] = node.supplier_id
+        yield data
+
+
+def iter_ndjson(nodes, serializer_class, context=None, chunk_size=500):
+    """Построчная (NDJSON) сериализация звеньев"""
+    encoder = JSONEncoder(ensure_ascii=False)
+    for data in iter_serialized(nodes, serializer_class, context, chunk_size):
+        yield encoder.encode(data) + '\n'
+
+
+class Echo:
+    """Псевдобуфер для csv.writer: возвращает записанную строку вместо записи в файл"""
+
+    def write(self, value):
+        return value
+
+
+def iter_csv(nodes, serializer_class, context=None, chunk_size=500):
+    """Построчная CSV-сериализация звеньев, вложенные списки записываются в ячейку как JSON"""
+    fields = list(serializer_class().fields) + ['supplier_id']
+    writer = csv.writer(Echo())
+    yield writer.writerow(fields)
+    encoder = JSONEncoder(ensure_ascii=False)
+    for data in iter_serialized(nodes, serializer_class, context, chunk_size):
+        yield writer.writerow([
+            encoder.encode(data[field]) if isinstance(data[field], list) else data[field] for field in fields
+        ])
+
+
+EXPORT_FORMATS = {
+    'ndjson': (iter_ndjson, 'application/x-ndjson'),
+    'csv': (iter_csv, 'text/csv; charset=utf-8'),
+}
+
+
+def bulk_upsert_links(items):
+    """Пакетное создание (без id) и обновление (с id) звеньев вместе с контактами и продуктами
+
+    Все проверки выполняются для пакета целиком фиксированным числом запросов,
+    запись - bulk-операциями в одной транзакции. Ошибочные элементы не прерывают пакет:
+    для каждого элемента возвращается либо id и статус, либо ошибки.
+    """
+    results = [None] * len(items)
+    valid = []
+    for index, item in enumerate(items):
+        serializer = LinkBulkItemSerializer(data=item)
+        if serializer.is_valid():
+            valid.append((index, serializer.validated_data))
+        else:
+            results[index] = {'index': index, 'errors': serializer.errors}
+
+    instances = Link.objects.in_bulk({data['id'] for _, data in valid if 'id' in data})
+    suppliers = Link.objects.in_bulk({data['supplier'] for _, data in valid if data.get('supplier') is not None})
+    catalog = SupplierCatalog()
+    catalog.preload(suppliers)
+    products = Product.objects.in_bulk({pk for _, data in valid for pk in data.get('products', [])})
+    taken_names = dict(Link.objects.filter(name__in=[data['name'] for _, data in valid]).values_list('name', 'pk'))
+    validators = [StatusLinkSupplierValidator('status_link', 'supplier'),
+                  ProductSupplierRelationshipValidator('supplier', 'products', catalog)]
+
+    batch_names = set()
+    accepted = []
+    for index, data in valid:
+        errors = {}
+        pk = data.get('id')
+        if pk is not None and pk not in instances:
+            errors['id'] = [DOES_NOT_EXIST.format(pk_value=pk)]
+        supplier_id = data.get('supplier')
+        if supplier_id is not None and (supplier_id not in suppliers or supplier_id == pk):
+            errors['supplier'] = [DOES_NOT_EXIST.format(pk_value=supplier_id)]
+        elif pk in instances and instances[pk].is_supplier_cycle(suppliers.get(supplier_id)):
+            errors['supplier'] = [SupplierCycleValidator.message]
+        missing_products = [product_id for product_id in data.get('products', []) if product_id not in products]
+        if missing_products:
+            errors['products'] = [DOES_NOT_EXIST.format(pk_value=product_id) for product_id in missing_products]
+        if data['name'] in batch_names or taken_names.get(data['name'], pk) != pk:
+            errors['name'] = ['Звено с таким названием уже существует']
+
+        if not errors:
+            # повторы продукта в элементе сводятся к одной строке связи, как в LinkSerializer.write_products
+            attrs = dict(data, supplier=suppliers.get(supplier_id),
+                         products=[products[product_id] for product_id in dict.fromkeys(data.get('products', []))])
+            try:
+                for validator in validators:
+                    validator(attrs)
+            except serializers.ValidationError as exc:
+                errors['non_field_errors'] = exc.detail
+
+        if errors:
+            results[index] = {'index': index, 'errors': errors}
+        else:
+            batch_names.add(data['name'])
+            accepted.append((index, attrs))
+
+    with transaction.atomic():
+        _write_links(accepted, instances, results)
+    return results
+
+
+def _write_links(accepted, instances, results):
+    links, to_create, to_update, rebased = {}, [], [], []
+    for index, attrs in accepted:
+        link = links[index] = instances[attrs['id']] if 'id' in attrs else Link()
+        old_prefix = link.descendants_prefix if link.pk else None
+        link.status_link = attrs['status_link']
+        link.supplier = attrs['supplier']
+        link.name = attrs['name']
+        link.path = Link.build_path(link.supplier)
+        link.level = link.calculate_depth()
+        if old_prefix is None:
+            to_create.append(link)
+        else:
+            to_update.append(link)
+            if old_prefix != link.descendants_prefix:
+                rebased.append((link, old_prefix))
+
+    # задолженность обновляемых звеньев и перенесенных поддеревьев учитывается в сводке заново
+    tracked = {link.pk for link in to_update}
+    if rebased:
+        subtrees = Q()
+        for link, old_prefix in rebased:
+            subtrees |= Q(path__startswith=old_prefix)
+        tracked.update(Link.objects.filter(subtrees).values_list('pk', flat=True))
+
+    with rollups.track(tracked):
+        Link.objects.bulk_create(to_create)
+        Link.objects.bulk_update(to_update, ['status_link', 'supplier', 'name', 'path', 'level'])
+        for link, old_prefix in rebased:
+            link.rebase_descendants(old_prefix)
+
+        LinkProduct = Link.products.through
+        removed = defaultdict(set)
+        for link_id, product_id in LinkProduct.objects.filter(link__in=to_update).values_list('link_id', 'product_id'):
+            removed[link_id].add(product_id)
+        Contact.objects.filter(link__in=to_update).delete()
+        LinkProduct.objects.filter(link__in=to_update).delete()
+        Contact.objects.bulk_create(
+            Contact(link=links[index], **contact) for index, attrs in accepted for contact in attrs['contact_set']
+        )
+        LinkProduct.objects.bulk_create(
+            LinkProduct(link_id=links[index].pk, product_id=product.pk)
+            for index, attrs in accepted for product in attrs['products']
+        )
+        prune_descendant_catalogs({
+            links[index]: removed[links[index].pk] - {product.pk for product in attrs['products']}
+            for index, attrs in accepted if 'id' in attrs
+        })
+    invalidate('link', 'contact')
+
+    for index, attrs in accepted:
+        results[index] = {'index': index, 'id': links[index].pk, 'status': 'updated' if 'id' in attrs else 'created'}
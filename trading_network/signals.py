@@ -0,0 +1,103 @@
+from django.db.models import DEFERRED
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from trading_network import ledger, rollups
+from trading_network.cache import invalidate
+from trading_network.catalogs import prune_descendant_catalogs
+from trading_network.models import Contact, Link, Product
+
+
+@receiver([post_save, post_delete], sender=Link)
+def invalidate_links(sender, **kwargs):
+    invalidate('link')
+
+
+@receiver(m2m_changed, sender=Link.products.through)
+def invalidate_link_products(sender, action, **kwargs):
+    if action.startswith('post_'):
+        invalidate('link')
+
+
+@receiver(m2m_changed, sender=Link.products.through)
+def propagate_catalog_removal(sender, instance, action, reverse, pk_set, **kwargs):
+    """Продукты, исключенные из каталога звена, исключаются и из каталогов его поддерева"""
+    if action == 'post_clear' and not reverse:
+        prune_descendant_catalogs({instance: None})
+    elif action == 'post_remove' and not reverse:
+        prune_descendant_catalogs({instance: pk_set})
+    elif action == 'post_remove':
+        prune_descendant_catalogs({link: [instance.pk] for link in Link.objects.filter(pk__in=pk_set)})
+
+
+@receiver([post_save, post_delete], sender=Product)
+def invalidate_products(sender, **kwargs):
+    invalidate('product')
+
+
+@receiver([post_save, post_delete], sender=Contact)
+def invalidate_contacts(sender, **kwargs):
+    invalidate('contact')
+
+
+@receiver(pre_save, sender=Link)
+def remember_ledger_debt(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and 'debt' not in update_fields:
+        return
+    loaded = getattr(instance, '_loaded_values', {}).get('debt', DEFERRED)
+    if loaded is DEFERRED and instance.pk:
+        loaded = Link.objects.filter(pk=instance.pk).values_list('debt', flat=True).first()
+    instance._ledger_debt = None if loaded is DEFERRED else loaded
+
+
+@receiver(post_save, sender=Link)
+def record_debt_change(sender, instance, created, **kwargs):
+    if '_ledger_debt' in instance.__dict__:
+        old = instance.__dict__.pop('_ledger_debt')
+        ledger.record_change(instance.pk, old, Link._meta.get_field('debt').to_python(instance.debt), created)
+
+
+@receiver(pre_save, sender=Link)
+def remember_debt_state(sender, instance, **kwargs):
+    if not rollups.suspended():
+        instance._rollup_state = rollups.link_state(instance) if instance.pk else None
+
+
+@receiver(post_save, sender=Link)
+def update_debt_rollup(sender, instance, **kwargs):
+    old = instance.__dict__.pop('_rollup_state', None)
+    debt = Link._meta.get_field('debt').to_python(instance.debt)
+    new = rollups.LinkState(instance.pk, instance.path, instance.level, instance.status_link, debt)
+    instance._loaded_values = {**getattr(instance, '_loaded_values', {}), **new._asdict()}
+    if not rollups.suspended():
+        rollups.link_saved(old, new)
+
+
+@receiver(pre_delete, sender=Link)
+def subtract_deleted_link_debt(sender, instance, **kwargs):
+    if not rollups.suspended():
+        rollups.link_deleting(instance)
+
+
+@receiver(post_delete, sender=Link)
+def forget_deleted_link(sender, instance, **kwargs):
+    rollups.link_deleted(instance)
+
+
+@receiver(post_save, sender=Contact)
+def update_contact_debt_rollup(sender, instance, created, **kwargs):
+    loaded = getattr(instance, '_loaded_values', {})
+    old = (loaded.get('link_id'), loaded.get('country'))
+    new = (instance.link_id, instance.country)
+    instance._loaded_values = {**loaded, 'link_id': instance.link_id, 'country': instance.country}
+    if rollups.suspended() or old == new:
+        return
+    if not created:
+        rollups.contact_changed(*old, sign=-1, exclude_pk=instance.pk)
+    rollups.contact_changed(*new, sign=1, exclude_pk=instance.pk)
+
+
+@receiver(post_delete, sender=Contact)
+def subtract_deleted_contact_debt(sender, instance, **kwargs):
+    if not rollups.suspended():
+        rollups.contact_changed(instance.link_id, instance.country, sign=-1, exclude_pk=instance.pk)
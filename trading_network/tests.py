@@ -1,10 +1,45 @@
+import asyncio
+import csv
+import json
+import os
+import pstats
+import sys
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from pathlib import Path
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.contrib.admin import AdminSite
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import DEFAULT_DB_ALIAS, connection, connections, transaction
 from django.urls import reverse
-from django.test import TestCase
+from django.utils import timezone
+from django.test import LiveServerTestCase, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from rest_framework import status
-from rest_framework.test import APITestCase
+from rest_framework.exceptions import ValidationError
+from rest_framework.test import APITestCase, APITransactionTestCase
 from rest_framework_simplejwt.tokens import AccessToken
 
-from trading_network.models import Link, Product, Contact
+from trading_network import instrumentation, jobs, ledger, metrics, profiling, rollups, search
+from trading_network.admin import LinkAdmin, clean_debt
+from trading_network.catalogs import prune_descendant_catalogs
+from trading_network.filters import LinkFilter
+from trading_network.management.commands import load_test
+from trading_network.models import DebtClearJob, DebtClearRecord, DebtRollup, DebtSnapshot, DebtTransaction, Link, \
+    Product, Contact
+from trading_network.paginators import EstimatedCountPaginator, OptionalCursorPagination
+from trading_network.serializers import LinkSerializer
+from trading_network.validators import ProductSupplierRelationshipValidator, SupplierCatalog
+from trading_network.views import LinkListAPIView
 from users.models import User
 
 
@@ -581,3 +616,1956 @@ class LinkAdminTestCase(TestCase):
         self.assertEqual(
             Link.objects.count(), 1
         )
+
+
+class NetworkReadQueriesTestCase(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(
+            email='reader@test.com',
+            is_active=True,
+            is_staff=True
+        )
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+
+        products = Product.objects.bulk_create(
+            Product(name=f'product_{i}', model=f'model_{i}', date='2024-03-04') for i in range(5)
+        )
+        factories = Link.objects.bulk_create(
+            Link(status_link='factory', name=f'factory_{i}', level=0) for i in range(5)
+        )
+        retail = Link.objects.bulk_create(
+            Link(status_link='retail_network', supplier=factory, name=f'retail_{factory.id}_{i}', level=1,
+                 path=f'{factory.id}/')
+            for factory in factories for i in range(20)
+        )
+        links = factories + retail
+        Contact.objects.bulk_create(
+            Contact(link=link, email='net@test.com', country=country, city='City', street='test', num_house='1')
+            for link in links for country in ('Russia', 'China')
+        )
+        Link.products.through.objects.bulk_create(
+            Link.products.through(link_id=link.id, product_id=product.id) for link in links for product in products
+        )
+        self.link = retail[0]
+
+    def test_link_list_num_queries(self):
+        """Число запросов списка звеньев не зависит от размера сети"""
+        # аутентификация, COUNT(*), страница звеньев с поставщиками, продукты, контакты
+        with self.assertNumQueries(5):
+            response = self.client.get(reverse('trading_network:link_list'))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()['count'], 105)
+
+        # пользователь уже в кэше аутентификации
+        with self.assertNumQueries(4):
+            response = self.client.get(reverse('trading_network:link_list'), {'page': 11})
+
+        self.assertEqual(len(response.json()['results']), 5)
+
+    def test_link_num_queries(self):
+        """Число запросов чтения звена"""
+        with self.assertNumQueries(4):
+            response = self.client.get(reverse('trading_network:link', args=[self.link.id]))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.json()['products']), 5)
+        self.assertEqual(len(response.json()['contact']), 2)
+        self.assertEqual(response.json()['supplier'], str(self.link.supplier))
+
+
+class NetworkAsyncReadTestCase(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(email='async@test.com', is_active=True, is_staff=True)
+        self.headers = {'Authorization': f'Bearer {AccessToken.for_user(self.user)}'}
+        self.client.credentials(HTTP_AUTHORIZATION=self.headers['Authorization'])
+
+        products = Product.objects.bulk_create(
+            Product(name=f'async_product_{i}', model=f'model_{i}', date='2024-03-04') for i in range(3)
+        )
+        factory = Link.objects.create(status_link='factory', name='async_factory')
+        links = [factory] + Link.objects.bulk_create(
+            Link(status_link='retail_network', supplier=factory, name=f'async_retail_{i}', level=1, debt=i,
+                 path=f'{factory.id}/')
+            for i in range(14)
+        )
+        Contact.objects.bulk_create(
+            Contact(link=link, email='async@test.com', country='Russia', city='City', street='test', num_house='1')
+            for link in links
+        )
+        Link.products.through.objects.bulk_create(
+            Link.products.through(link_id=link.id, product_id=product.id) for link in links for product in products
+        )
+        self.link = links[1]
+
+    def async_get(self, path, **kwargs):
+        return async_to_sync(self.async_client.get)(path, **kwargs)
+
+    def assertSameResponse(self, name, async_name, args=(), params=None, headers=None):
+        sync_response = self.client.get(reverse(f'trading_network:{name}', args=args), params)
+        async_response = self.async_get(reverse(f'trading_network:{async_name}', args=args), data=params,
+                                         headers=self.headers if headers is None else headers)
+        self.assertEqual(async_response.status_code, sync_response.status_code)
+        self.assertEqual(async_response['Content-Type'], sync_response['Content-Type'])
+        self.assertEqual(async_response.content.replace(b'/async/', b'/'), sync_response.content)
+        return async_response
+
+    def test_same_output(self):
+        """Асинхронные представления отдают то же, что и синхронные"""
+        response = self.assertSameResponse('link_list', 'async_link_list', params={'page': 2})
+        self.assertEqual(response.json()['count'], 15)
+        self.assertSameResponse('link_list', 'async_link_list',
+                                params={'level': '1', 'ordering': '-debt', 'page_size': 4, 'page': 'last'})
+        response = self.assertSameResponse('link', 'async_link', args=[self.link.pk])
+        self.assertEqual(response.json()['supplier'], str(self.link.supplier))
+        self.assertSameResponse('product-list', 'async_product_list', params={'page_size': 2})
+        self.assertSameResponse('product-detail', 'async_product', args=[Product.objects.first().pk])
+        self.assertSameResponse('contact-list', 'async_contact_list')
+        self.assertSameResponse('contact-detail', 'async_contact', args=[self.link.contact_set.get().pk])
+
+    def test_errors(self):
+        """Ошибки аутентификации, фильтров и пагинации в том же формате, что и у DRF"""
+        self.assertSameResponse('link', 'async_link', args=[0])
+        self.assertSameResponse('link_list', 'async_link_list', params={'page': 5})
+        self.assertSameResponse('link_list', 'async_link_list', params={'level': 'first'})
+
+        self.client.credentials()
+        response = self.assertSameResponse('link_list', 'async_link_list', headers={})
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(response['WWW-Authenticate'], 'Bearer realm="api"')
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer broken')
+        self.assertSameResponse('product-list', 'async_product_list', headers={'Authorization': 'Bearer broken'})
+
+        # сессия не аутентифицирует ни синхронные, ни асинхронные представления
+        self.client.credentials()
+        self.client.force_login(self.user)
+        self.async_client.force_login(self.user)
+        response = self.assertSameResponse('link_list', 'async_link_list', headers={})
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(response['WWW-Authenticate'], 'Bearer realm="api"')
+        self.client.credentials(HTTP_AUTHORIZATION=self.headers['Authorization'])
+
+        response = self.async_get(reverse('trading_network:async_link_list'), data={'pagination': 'cursor'},
+                                  headers=self.headers)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = async_to_sync(self.async_client.post)(reverse('trading_network:async_link_list'),
+                                                         headers=self.headers)
+        self.assertEqual(response.status_code, status.HTTP_405_METHOD_NOT_ALLOWED)
+
+    def test_link_list_num_queries(self):
+        """Асинхронный список звеньев - те же запросы, что и у синхронного"""
+        # аутентификация, COUNT(*), страница звеньев с поставщиками, продукты, контакты
+        with self.assertNumQueries(5):
+            response = self.async_get(reverse('trading_network:async_link_list'), headers=self.headers)
+        self.assertEqual(len(response.json()['results']), 10)
+
+        with self.assertNumQueries(4):
+            self.async_get(reverse('trading_network:async_link_list'), headers=self.headers)
+
+
+class NetworkSqlInstrumentationTestCase(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(email='sql@test.com', is_active=True, is_staff=True)
+        self.headers = {'Authorization': f'Bearer {AccessToken.for_user(self.user)}'}
+        self.client.credentials(HTTP_AUTHORIZATION=self.headers['Authorization'])
+        factory = Link.objects.create(status_link='factory', name='sql_factory')
+        Link.objects.bulk_create(
+            Link(status_link='retail_network', supplier=factory, name=f'sql_retail_{i}', level=1,
+                 path=f'{factory.id}/')
+            for i in range(3)
+        )
+
+    def server_timing(self, response):
+        db, total = response['Server-Timing'].split(', total;')
+        self.assertTrue(total.startswith('dur='))
+        return db
+
+    def test_server_timing(self):
+        """Заголовок Server-Timing содержит число запросов к базе и их время"""
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('trading_network:link_list'))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn(f'desc="{len(queries)} queries, 0 duplicated"', self.server_timing(response))
+
+        response = async_to_sync(self.async_client.get)(reverse('trading_network:async_link_list'),
+                                                        headers=self.headers)
+        self.assertIn('desc="4 queries, 0 duplicated"', self.server_timing(response))
+
+    @override_settings(SQL_SLOW_REQUEST_MS=0)
+    def test_slow_request_log(self):
+        """Медленный запрос пишется в журнал одной JSON-строкой"""
+        link = Link.objects.get(name='sql_retail_0')
+        with self.assertLogs('trading_network.sql', 'WARNING') as logs:
+            self.client.get(reverse('trading_network:link', args=[link.pk]))
+            self.client.get(reverse('trading_network:link', args=[link.pk]))
+
+        first, cached = (json.loads(record.getMessage()) for record in logs.records)
+        self.assertEqual(first['view'], 'trading_network:link')
+        self.assertEqual(first['status'], 200)
+        self.assertEqual(first['queries'], 4)
+        self.assertEqual(first['duplicated'], 0)
+        self.assertEqual(first['slow_queries'], [])
+        # ответ из кэша
+        self.assertEqual(cached['queries'], 0)
+
+    def test_duplicates(self):
+        """Повторы одного выражения (N+1) считаются по тексту SQL"""
+        stats, token = instrumentation.begin(slow_query_ms=1000)
+        try:
+            for link in Link.objects.order_by('pk'):
+                str(link.supplier)
+        finally:
+            instrumentation.reset(token)
+
+        self.assertEqual(stats.count, 4)
+        self.assertEqual(stats.duplicated, 2)
+        self.assertEqual(list(stats.duplicates.values()), [3])
+
+    @override_settings(SQL_SLOW_QUERY_MS=0)
+    def test_slow_queries(self):
+        """Выражения дольше SQL_SLOW_QUERY_MS попадают в журнал даже у быстрого запроса"""
+        with self.assertLogs('trading_network.sql', 'WARNING') as logs:
+            self.client.get(reverse('trading_network:link_list'))
+
+        record = json.loads(logs.records[-1].getMessage())
+        self.assertEqual(len(record['slow_queries']), record['queries'])
+        self.assertTrue(any('COUNT(*)' in query['sql'] for query in record['slow_queries']))
+
+    def test_sampling_and_namespaces(self):
+        """Без выборки и вне пространств имен trading_network и users заголовка нет"""
+        with override_settings(SQL_INSTRUMENTATION_SAMPLE_RATE=0):
+            response = self.client.get(reverse('trading_network:link_list'))
+        self.assertNotIn('Server-Timing', response)
+
+        response = self.client.post(reverse('users:token_obtain_pair'), {'email': 'sql@test.com', 'password': 'x'})
+        self.assertIn('Server-Timing', response)
+
+        self.client.force_login(User.objects.create(email='sql-admin@test.com', is_staff=True, is_superuser=True))
+        response = self.client.get(reverse('admin:trading_network_link_changelist'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotIn('Server-Timing', response)
+
+
+class NetworkMetricsTestCase(APITestCase):
+    def setUp(self):
+        cache.clear()
+        metrics.store.reset()
+        self.user = User.objects.create(email='metrics@test.com', is_active=True, is_staff=True)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+        Link.objects.create(status_link='factory', name='metrics_factory')
+
+    def scrape(self):
+        response = self.client.get(reverse('trading_network:metrics'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'text/plain; version=0.0.4; charset=utf-8')
+        return response.content.decode().splitlines()
+
+    def test_metrics(self):
+        """Счетчики и гистограммы по имени URL в формате Prometheus"""
+        self.client.get(reverse('trading_network:link_list'))
+        self.client.get(reverse('trading_network:link_list'))
+        self.client.get(reverse('trading_network:link', args=[0]))
+
+        lines = self.scrape()
+        self.assertIn('# TYPE http_request_duration_seconds histogram', lines)
+        self.assertIn('http_requests_total{view="trading_network:link_list",method="GET",status="200"} 2', lines)
+        self.assertIn('http_requests_total{view="trading_network:link",method="GET",status="404"} 1', lines)
+        self.assertIn('http_request_duration_seconds_bucket{view="trading_network:link_list",le="+Inf"} 2', lines)
+        self.assertIn('http_request_duration_seconds_count{view="trading_network:link_list"} 2', lines)
+        self.assertIn('http_response_size_bytes_count{view="trading_network:link_list"} 2', lines)
+        self.assertIn('http_request_db_seconds_count{view="trading_network:link_list"} 2', lines)
+        # аутентификация, COUNT(*), страница звеньев, продукты, контакты; второй ответ из кэша
+        self.assertIn('http_request_db_queries_total{view="trading_network:link_list"} 5', lines)
+
+        buckets = [int(line.rsplit(' ', 1)[1]) for line in lines
+                   if line.startswith('http_request_duration_seconds_bucket{view="trading_network:link_list"')]
+        self.assertEqual(buckets, sorted(buckets))
+
+    def test_staff_only(self):
+        """Метрики доступны только администраторам"""
+        self.user.is_staff = False
+        self.user.save()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+        self.assertEqual(self.client.get(reverse('trading_network:metrics')).status_code,
+                         status.HTTP_403_FORBIDDEN)
+
+    def test_shared_directory(self):
+        """Снимки процессов-воркеров из METRICS_DIR складываются при выдаче"""
+        with tempfile.TemporaryDirectory() as directory, override_settings(METRICS_DIR=directory):
+            self.client.get(reverse('trading_network:link_list'))
+            worker = metrics.Store()
+            worker.observe('trading_network:link_list', 'GET', 200, 0.2, size=100)
+            Path(directory, '1.json').write_text(json.dumps(worker.snapshot()))
+
+            lines = self.scrape()
+            self.assertTrue(Path(directory, f'{os.getpid()}.json').exists())
+
+        self.assertIn('http_requests_total{view="trading_network:link_list",method="GET",status="200"} 2', lines)
+        self.assertIn('http_response_size_bytes_count{view="trading_network:link_list"} 2', lines)
+        self.assertIn('http_request_db_seconds_count{view="trading_network:link_list"} 1', lines)
+
+    def test_concurrent_flush(self):
+        """Одновременная запись снимка из нескольких потоков не падает, ошибка записи только логируется"""
+        with tempfile.TemporaryDirectory() as directory, override_settings(METRICS_DIR=directory):
+            errors = []
+
+            def flush():
+                try:
+                    for _ in range(50):
+                        metrics.store.flush()
+                except OSError as error:
+                    errors.append(error)
+
+            threads = [threading.Thread(target=flush) for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            self.assertEqual(errors, [])
+            self.assertEqual([file.name for file in Path(directory).iterdir()], [f'{os.getpid()}.json'])
+
+            Path(directory, 'file').write_text('')
+            with override_settings(METRICS_DIR=str(Path(directory, 'file'))), \
+                    self.assertLogs('trading_network.metrics', 'WARNING'):
+                metrics.store.flush()
+
+
+class NetworkProfilingTestCase(APITestCase):
+    def setUp(self):
+        cache.clear()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = Path(directory.name)
+        settings_override = override_settings(PROFILE_DIR=self.directory, PROFILE_SAMPLE_INTERVAL_MS=0.1)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.user = User.objects.create(email='profile@test.com', is_active=True, is_staff=True)
+        self.headers = {'Authorization': f'Bearer {AccessToken.for_user(self.user)}'}
+        self.client.credentials(HTTP_AUTHORIZATION=self.headers['Authorization'])
+        factory = Link.objects.create(status_link='factory', name='profile_factory')
+        Link.objects.create(status_link='retail_network', supplier=factory, name='profile_retail')
+
+    def test_cprofile(self):
+        """Профиль cProfile запроса администратора сохраняется и скачивается"""
+        response = self.client.get(reverse('trading_network:link_list'), HTTP_X_PROFILE='cprofile')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        profile_id = response['X-Profile-Id']
+        self.assertEqual(response['X-Profile-Url'], reverse('trading_network:profile', args=[profile_id]))
+        functions = {name for _, _, name in pstats.Stats(str(self.directory / f'{profile_id}.prof')).stats}
+        self.assertIn('to_representation', functions)
+
+        info, = self.client.get(reverse('trading_network:profile_list')).json()
+        self.assertEqual(info['id'], profile_id)
+        self.assertEqual(info['view'], 'trading_network:link_list')
+        self.assertEqual(info['queries'], 5)
+
+        response = self.client.get(response['X-Profile-Url'])
+        self.assertEqual(b''.join(response.streaming_content), (self.directory / f'{profile_id}.prof').read_bytes())
+        self.assertIn('attachment', response['Content-Disposition'])
+        self.assertEqual(self.client.get(reverse('trading_network:profile', args=['..'])).status_code,
+                         status.HTTP_404_NOT_FOUND)
+
+    def test_stacks(self):
+        """Выборка стеков - в свернутом формате flame graph"""
+        link = Link.objects.get(name='profile_retail')
+        response = self.client.get(reverse('trading_network:link', args=[link.pk]), {'profile': 'stacks'})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        for line in (self.directory / f'{response["X-Profile-Id"]}.folded').read_text().splitlines():
+            stack, count = line.rsplit(' ', 1)
+            self.assertTrue(count.isdigit())
+            self.assertIn(';', stack)
+        self.assertTrue(profiling.fold(sys._getframe()).endswith(
+            ';trading_network.tests.NetworkProfilingTestCase.test_stacks'))
+
+    def test_async(self):
+        """Асинхронные представления тоже профилируются"""
+        response = async_to_sync(self.async_client.get)(reverse('trading_network:async_link_list'),
+                                                        headers={**self.headers, 'X-Profile': 'cprofile'})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        info, = profiling.list_profiles()
+        self.assertEqual(info['id'], response['X-Profile-Id'])
+        self.assertEqual(info['view'], 'trading_network:async_link_list')
+
+    def test_async_sync_view(self):
+        """Под ASGI выборка стеков синхронного представления снимается с потока представления"""
+        list_links = LinkListAPIView.list
+
+        def slow_list(*args, **kwargs):
+            time.sleep(0.05)
+            return list_links(*args, **kwargs)
+
+        with mock.patch.object(LinkListAPIView, 'list', slow_list):
+            response = async_to_sync(self.async_client.get)(reverse('trading_network:link_list'),
+                                                            headers={**self.headers, 'X-Profile': 'stacks'})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('.slow_list', (self.directory / f'{response["X-Profile-Id"]}.folded').read_text())
+
+        # cProfile не видит поток синхронного представления
+        response = async_to_sync(self.async_client.get)(reverse('trading_network:link_list'),
+                                                        headers={**self.headers, 'X-Profile': 'cprofile'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(profiling.list_profiles()[1:], [])
+
+    def test_not_triggered(self):
+        """Без заголовка, с неизвестным режимом и для обычного пользователя профиль не снимается"""
+        self.assertNotIn('X-Profile-Id', self.client.get(reverse('trading_network:link_list')))
+        self.assertNotIn('X-Profile-Id', self.client.get(reverse('trading_network:link_list'), {'profile': 'x'}))
+
+        self.user.is_staff = False
+        self.user.save()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+        response = self.client.get(reverse('trading_network:link_list'), HTTP_X_PROFILE='cprofile')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotIn('X-Profile-Id', response)
+        self.assertEqual(self.client.get(reverse('trading_network:profile_list')).status_code,
+                         status.HTTP_403_FORBIDDEN)
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer broken')
+        response = self.client.get(reverse('trading_network:link_list'), HTTP_X_PROFILE='cprofile')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(list(self.directory.iterdir()), [])
+
+    @override_settings(PROFILE_KEEP=2)
+    def test_keep(self):
+        """Хранятся только PROFILE_KEEP последних профилей"""
+        ids = [self.client.get(reverse('trading_network:link_list'), HTTP_X_PROFILE='cprofile')['X-Profile-Id']
+               for _ in range(3)]
+
+        self.assertEqual([info['id'] for info in profiling.list_profiles()], ids[:0:-1])
+        self.assertEqual(len(list(self.directory.iterdir())), 4)
+
+
+class NetworkSearchTestCase(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(email='search@test.com', is_active=True)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+        self.factory = Link.objects.create(status_link='factory', name='Apex Electronics-15')
+        self.retail = Link.objects.create(status_link='retail_network', supplier=self.factory, name='Market Apex',
+                                          level=1, path=f'{self.factory.id}/')
+        Link.objects.create(status_link='factory', name='Zenith Devices')
+        self.product = Product.objects.create(name='Nova Phone', model='A1254', date='2024-03-04')
+        self.contact = Contact.objects.create(link=self.retail, email='search@test.com', country='Russia',
+                                              city='Moscow', street='Lenina', num_house='7')
+
+    def search(self, **params):
+        response = self.client.get(reverse('trading_network:search'), params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [(result['type'], result['id']) for result in response.json()]
+
+    def test_prefix_search(self):
+        """Слова запроса ищутся как начала слов во всех полях поиска"""
+        self.assertEqual(self.search(q='apex'), [('link', self.factory.id), ('link', self.retail.id)])
+        self.assertEqual(self.search(q='Electronics-1'), [('link', self.factory.id)])
+        self.assertEqual(self.search(q='a125'), [('product', self.product.id)])
+        self.assertEqual(self.search(q='nova ph'), [('product', self.product.id)])
+        self.assertEqual(self.search(q='Moscow len'), [('contact', self.contact.id)])
+        self.assertEqual(self.search(q='moscow zenith'), [])
+
+        response = self.client.get(reverse('trading_network:search'), {'q': 'lenina'})
+        self.assertEqual(response.json(), [{'type': 'contact', 'id': self.contact.id,
+                                             'title': 'Russia, Moscow, Lenina 7', 'link': self.retail.id,
+                                             'rank': response.json()[0]['rank']}])
+
+    def test_other_vendor(self):
+        """В СУБД без полнотекстового поиска слова ищутся подстроками полей"""
+        with mock.patch.object(connection, 'vendor', 'mysql'):
+            self.assertEqual(self.search(q='apex'), [('link', self.factory.id), ('link', self.retail.id)])
+            self.assertEqual(self.search(q='Moscow len'), [('contact', self.contact.id)])
+            self.assertEqual(self.search(q='moscow zenith'), [])
+
+    def test_type_and_limit(self):
+        """Фильтр по видам результатов и ограничение их числа"""
+        self.assertEqual(self.search(q='apex', limit=1), [('link', self.factory.id)])
+        self.assertEqual(self.search(q='apex', type='product,contact'), [])
+        self.assertEqual(self.search(q='market', type='link'), [('link', self.retail.id)])
+
+        for params in ({}, {'q': '-'}, {'q': 'apex', 'type': 'user'}, {'q': 'apex', 'limit': 0},
+                       {'q': 'apex', 'limit': 'all'}):
+            response = self.client.get(reverse('trading_network:search'), params)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_index_scan(self):
+        """Поиск использует GIN-индексы миграции 0008"""
+        # индекс выбирается при обычных настройках планировщика, когда совпадений мало среди многих строк
+        links = Link.objects.bulk_create(Link(status_link='factory', name=f'Search Bulk {i}', level=0)
+                                         for i in range(3000))
+        Product.objects.bulk_create(Product(name=f'Search Bulk {i}', model=f'S{i}', date='2024-03-04')
+                                    for i in range(3000))
+        Contact.objects.bulk_create(Contact(link=link, email='search@test.com', country='Russia',
+                                            city=f'City {i}', street='Bulk', num_house='1')
+                                    for i, link in enumerate(links))
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE trading_network_link, trading_network_product, trading_network_contact')
+
+        for name, model in (('link', Link), ('product', Product), ('contact', Contact)):
+            with CaptureQueriesContext(connection) as queries:
+                search.search('apex', [search.KINDS[name]], 10)
+            with connection.cursor() as cursor:
+                cursor.execute(f'EXPLAIN {queries.captured_queries[0]["sql"]}')
+                plan = '\n'.join(row[0] for row in cursor.fetchall())
+            self.assertIn(f'{model._meta.model_name}_search_idx', plan)
+
+
+SQLITE = 'search_sqlite'
+
+
+class SqliteRouter:
+    """Чтения, записи и миграции - в базу SQLITE, которую создает NetworkSearchSqliteTestCase"""
+
+    def db_for_read(self, model, **hints):
+        return SQLITE
+
+    def db_for_write(self, model, **hints):
+        return SQLITE
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == SQLITE
+
+
+@override_settings(DATABASE_ROUTERS=['trading_network.tests.SqliteRouter'])
+class NetworkSearchSqliteTestCase(SimpleTestCase):
+    """Поиск на SQLite: FTS5-таблица и триггеры миграции 0008 в базе в памяти, основная база не используется"""
+
+    def setUp(self):
+        # configure_settings дополняет настройки значениями по умолчанию и требует псевдоним default
+        connections.settings[SQLITE] = connections.configure_settings(
+            {DEFAULT_DB_ALIAS: {'ENGINE': 'django.db.backends.sqlite3', 'NAME': ':memory:'}})[DEFAULT_DB_ALIAS]
+        self.addCleanup(connections.settings.pop, SQLITE)
+        self.addCleanup(connections.__delitem__, SQLITE)
+        self.addCleanup(lambda: connections[SQLITE].close())
+        call_command('migrate', database=SQLITE, verbosity=0)
+
+        # bulk_create: обработчики сигналов сводки задолженности открывают транзакции в основной базе
+        self.factory, self.retail, _ = Link.objects.bulk_create([
+            Link(status_link='factory', name='Apex Electronics-15', level=0),
+            Link(status_link='retail_network', name='Market Apex', level=1),
+            Link(status_link='factory', name='Zenith Devices', level=0),
+        ])
+        self.product, = Product.objects.bulk_create([Product(name='Nova Phone', model='A1254', date='2024-03-04')])
+        self.contact, = Contact.objects.bulk_create([Contact(link=self.retail, email='search@test.com',
+                                                             country='Russia', city='Moscow', street='Lenina',
+                                                             num_house='7')])
+
+    def search(self, query, kinds=('link', 'product', 'contact')):
+        return [(result['type'], result['id']) for result in search.search(query, [search.KINDS[kind]
+                                                                                   for kind in kinds], 10)]
+
+    def test_prefix_search(self):
+        """Слова запроса ищутся как начала слов, совпадение с началом поля поднимает результат"""
+        self.assertEqual(connections[Link.objects.db].vendor, 'sqlite')
+        self.assertEqual(self.search('apex'), [('link', self.factory.id), ('link', self.retail.id)])
+        self.assertEqual(self.search('Electronics-1'), [('link', self.factory.id)])
+        self.assertEqual(self.search('a125'), [('product', self.product.id)])
+        self.assertEqual(self.search('nova ph'), [('product', self.product.id)])
+        self.assertEqual(self.search('Moscow len'), [('contact', self.contact.id)])
+        self.assertEqual(self.search('moscow zenith'), [])
+        self.assertEqual(self.search('apex', ['product', 'contact']), [])
+
+    def test_triggers(self):
+        """Триггеры поддерживают FTS5-таблицу при изменении и удалении строк"""
+        Product.objects.filter(pk=self.product.pk).update(name='Orbit Tablet')
+        self.assertEqual(self.search('nova'), [])
+        self.assertEqual(self.search('orbit'), [('product', self.product.id)])
+
+        Product.objects.filter(pk=self.product.pk).update(date='2024-03-05')
+        self.assertEqual(self.search('orbit'), [('product', self.product.id)])
+
+        # без обработчиков сигналов: сброс кэша ждет фиксации транзакции в основной базе
+        with connections[SQLITE].cursor() as cursor:
+            cursor.execute(f'DELETE FROM {Product._meta.db_table} WHERE id = %s', [self.product.pk])
+        self.assertEqual(self.search('orbit'), [])
+
+
+class NetworkWriteQueriesTestCase(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create(email='write@test.com', is_active=True, is_staff=True)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+
+        self.products = Product.objects.bulk_create(
+            Product(name=f'write_{i}', model='write', date='2024-03-04') for i in range(20)
+        )
+        self.factory = Link.objects.create(status_link='factory', name='write_factory')
+        self.factory.products.set(self.products)
+
+    def contacts(self, count, start=0):
+        return [{'email': f'write_{i}@test.com', 'country': 'Russia', 'city': 'Moscow',
+                 'street': 'test', 'num_house': str(i)} for i in range(start, start + count)]
+
+    def data(self, name, contacts, products):
+        return {'status_link': 'retail_network', 'supplier': self.factory.id, 'name': name,
+                'products': [product.id for product in products], 'contact': contacts}
+
+    def test_num_queries_constant(self):
+        """Число запросов создания и обновления звена не зависит от числа контактов и продуктов"""
+        # первый запрос загружает пользователя в кэш аутентификации
+        self.client.get(reverse('trading_network:product-list'))
+        queries = {}
+        for count in (1, 10):
+            with CaptureQueriesContext(connection) as context:
+                response = self.client.post(reverse('trading_network:link_create'),
+                                            self.data(f'write_{count}', self.contacts(count), self.products[:count]),
+                                            format='json')
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+            queries[count] = len(context)
+
+            url = reverse('trading_network:link_update', args=[response.json()['id']])
+            data = self.data(f'write_{count}', self.contacts(count, 1), self.products[count:2 * count])
+            with CaptureQueriesContext(connection) as context:
+                response = self.client.put(url, data, format='json')
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            queries[-count] = len(context)
+
+        self.assertEqual(queries[1], queries[10])
+        self.assertEqual(queries[-1], queries[-10])
+
+    def test_update_contacts_diff(self):
+        """Контакты с id обновляются, без id занимают оставшиеся, лишние удаляются или создаются"""
+        link = Link.objects.create(status_link='retail_network', supplier=self.factory, name='write_diff')
+        first, second, third = Contact.objects.bulk_create(
+            Contact(link=link, **contact) for contact in self.contacts(3)
+        )
+        url = reverse('trading_network:link_update', args=[link.id])
+
+        contacts = self.contacts(2, 10)
+        contacts[0]['id'] = second.id
+        response = self.client.patch(url, {'contact': contacts}, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            dict(link.contact_set.values_list('id', 'email')),
+            {second.id: 'write_10@test.com', first.id: 'write_11@test.com'}
+        )
+        self.assertFalse(Contact.objects.filter(pk=third.id).exists())
+
+        response = self.client.patch(url, {'contact': self.contacts(3, 20)}, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(link.contact_set.count(), 3)
+        self.assertEqual(link.contact_set.filter(pk__in=[first.id, second.id]).count(), 2)
+
+        contacts = self.contacts(1)
+        contacts[0]['id'] = Contact.objects.create(link=self.factory, **self.contacts(1)[0]).id
+        response = self.client.patch(url, {'contact': contacts}, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(link.contact_set.count(), 3)
+
+        # новый контакт при частичном обновлении создается только со всеми полями
+        contacts = [{'city': f'City_{i}'} for i in range(4)]
+        response = self.client.patch(url, {'contact': contacts}, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.json()['contact'],
+                         ['Для нового контакта обязательны поля: email, country, street, num_house'])
+        self.assertEqual(link.contact_set.count(), 3)
+        self.assertFalse(link.contact_set.filter(city__startswith='City_').exists())
+
+        response = self.client.patch(url, {'contact': contacts[:3]}, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(link.contact_set.filter(city__startswith='City_').count(), 3)
+
+    def test_update_contacts_debt_rollup(self):
+        """Сводка по странам учитывает изменения контактов звена с задолженностью"""
+        link = Link.objects.create(status_link='retail_network', supplier=self.factory, name='write_debt', debt=10)
+        Contact.objects.create(link=link, **self.contacts(1)[0])
+        contacts = self.contacts(2)
+        contacts[1]['country'] = 'China'
+
+        response = self.client.patch(reverse('trading_network:link_update', args=[link.id]),
+                                     {'contact': contacts}, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            dict(DebtRollup.objects.filter(root_id=self.factory.id).values_list('country', 'links')),
+            {'': 1, 'Russia': 1, 'China': 1}
+        )
+
+
+class NetworkCatalogTestCase(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create(email='catalog@test.com', is_active=True, is_staff=True)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+
+        self.products = Product.objects.bulk_create(
+            Product(name=f'catalog_{i}', model='catalog', date='2024-03-04') for i in range(3)
+        )
+        self.factory = Link.objects.create(status_link='factory', name='catalog_factory')
+        self.retail = Link.objects.create(status_link='retail_network', supplier=self.factory, name='catalog_retail')
+        self.entrepreneur = Link.objects.create(status_link='entrepreneur', supplier=self.retail,
+                                                name='catalog_entrepreneur')
+        self.other = Link.objects.create(status_link='factory', name='catalog_other')
+        LinkProduct = Link.products.through
+        LinkProduct.objects.bulk_create(
+            LinkProduct(link_id=link.id, product_id=product.id)
+            for link in (self.factory, self.retail, self.entrepreneur, self.other) for product in self.products
+        )
+
+    def catalog(self, link):
+        return set(link.products.values_list('id', flat=True))
+
+    def test_remove_propagates(self):
+        """Исключение продукта из каталога звена удаляет его из каталогов поддерева"""
+        first, second, third = self.products
+        self.factory.products.remove(second)
+
+        self.assertEqual(self.catalog(self.retail), {first.id, third.id})
+        self.assertEqual(self.catalog(self.entrepreneur), {first.id, third.id})
+        self.assertEqual(self.catalog(self.other), {first.id, second.id, third.id})
+
+        self.retail.products.clear()
+
+        self.assertEqual(self.catalog(self.entrepreneur), set())
+        self.assertEqual(self.catalog(self.factory), {first.id, third.id})
+
+        first.link_set.remove(self.factory)
+
+        self.assertEqual(self.catalog(self.factory), {third.id})
+
+    def test_update_propagates(self):
+        """Обновление звена через API удаляет исключенные продукты из поддерева"""
+        response = self.client.patch(reverse('trading_network:link_update', args=[self.retail.id]),
+                                     {'products': [self.products[0].id]}, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.catalog(self.entrepreneur), {self.products[0].id})
+
+    def test_prune_one_query(self):
+        """Удаление по всему поддереву - один запрос, dry_run только считает строки"""
+        Link.products.through.objects.filter(link=self.factory, product=self.products[2]).delete()
+        removed = {self.factory: None}
+
+        with self.assertNumQueries(1):
+            self.assertEqual(prune_descendant_catalogs(removed, dry_run=True), 2)
+        self.assertEqual(self.catalog(self.entrepreneur), {product.id for product in self.products})
+
+        with self.assertNumQueries(1):
+            self.assertEqual(prune_descendant_catalogs(removed), 2)
+        self.assertEqual(self.catalog(self.retail), {self.products[0].id, self.products[1].id})
+
+    def test_prune_endpoint(self):
+        """Удаление переданных продуктов из каталогов поддерева через API"""
+        url = reverse('trading_network:link_catalog_prune', args=[self.factory.id])
+
+        response = self.client.post(url, {'products': [self.products[0].id], 'dry_run': True}, format='json')
+
+        self.assertEqual(response.json(), {'rows': 2, 'dry_run': True})
+        self.assertIn(self.products[0].id, self.catalog(self.entrepreneur))
+
+        response = self.client.post(url, {'products': [self.products[0].id]}, format='json')
+
+        self.assertEqual(response.json(), {'rows': 2, 'dry_run': False})
+        self.assertNotIn(self.products[0].id, self.catalog(self.entrepreneur))
+        self.assertIn(self.products[0].id, self.catalog(self.factory))
+
+
+class NetworkAdminTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(email='admin_scale@test.com', is_staff=True, is_active=True,
+                                        is_superuser=True)
+        self.client.force_login(self.user)
+        self.products = Product.objects.bulk_create(
+            Product(name=f'admin_{i}', model='admin', date='2024-03-04') for i in range(30)
+        )
+        self.factory = Link.objects.create(status_link='factory', name='admin_factory')
+        self.factory.products.set(self.products)
+
+    def add_links(self, count):
+        start = Link.objects.count()
+        links = Link.objects.bulk_create(
+            Link(status_link='retail_network', supplier=self.factory, name=f'admin_{self.factory.id}_{i}',
+                 level=1, path=f'{self.factory.id}/') for i in range(start, start + count)
+        )
+        Contact.objects.bulk_create(
+            Contact(link=link, email='admin@test.com', country='Russia', city=f'City {link.id % 3}',
+                    street='test', num_house='1') for link in links
+        )
+        LinkProduct = Link.products.through
+        LinkProduct.objects.bulk_create(
+            LinkProduct(link_id=link.id, product_id=product.id) for link in links for product in self.products[:3]
+        )
+        return links
+
+    def assertConstantQueries(self, url, grow):
+        grow(3)
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as small:
+            self.assertEqual(self.client.get(url).status_code, 200)
+        grow(30)
+        with CaptureQueriesContext(connection) as large:
+            self.assertEqual(self.client.get(url).status_code, 200)
+        self.assertEqual(len(small), len(large))
+        return len(large)
+
+    def test_link_changelist_num_queries(self):
+        """Число запросов списка звеньев в админке не зависит от числа строк на странице"""
+        url = reverse('admin:trading_network_link_changelist')
+        # сессия, пользователь, оценка из pg_class, COUNT(*), страница звеньев с поставщиками
+        self.assertEqual(self.assertConstantQueries(url, self.add_links), 5)
+
+    def test_product_changelist_num_queries(self):
+        """Список поставщиков продукта собирается подзапросами для всей страницы"""
+        url = reverse('admin:trading_network_product_changelist')
+        self.assertEqual(self.assertConstantQueries(url, self.add_links), 5)
+
+        response = self.client.get(url)
+
+        self.assertContains(response, '<td class="field-supplier_list">admin_factory</td>')
+        self.assertContains(response, ' и еще 24')
+
+    def test_contact_changelist_num_queries(self):
+        """Список контактов загружает звенья одним запросом со страницей"""
+        url = reverse('admin:trading_network_contact_changelist')
+        self.assertEqual(self.assertConstantQueries(url, self.add_links), 5)
+
+    def test_city_filter(self):
+        """Список городов фильтра кэшируется, отбор звеньев по городу работает"""
+        self.add_links(6)
+        url = reverse('admin:trading_network_link_changelist')
+
+        with CaptureQueriesContext(connection) as context:
+            self.client.get(url)
+        self.assertTrue(any('DISTINCT' in query['sql'] for query in context.captured_queries))
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url, {'city': 'City 1'})
+        self.assertFalse(any('DISTINCT' in query['sql'] for query in context.captured_queries))
+
+        self.assertEqual(len(response.context['cl'].result_list), 2)
+        self.assertContains(response, '?city=City+2')
+
+    def test_change_form_autocomplete(self):
+        """Форма звена не выводит все продукты и звенья, только выбранные"""
+        link = self.add_links(1)[0]
+
+        response = self.client.get(reverse('admin:trading_network_link_change', args=[link.id]))
+
+        self.assertContains(response, 'admin-autocomplete')
+        self.assertContains(response, f'<option value="{self.products[0].id}" selected>')
+        self.assertNotContains(response, f'>{self.products[10]}</option>')
+
+    def test_estimated_count(self):
+        """Без фильтров число строк большой таблицы берется из статистики без COUNT(*)"""
+        # статистика pg_class обновляется вне транзакции теста, поэтому берется таблица без проверок планов
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE trading_network_product')
+
+        with self.settings(ADMIN_COUNT_ESTIMATE_THRESHOLD=10):
+            paginator = EstimatedCountPaginator(Product.objects.order_by('pk'), 5)
+            with CaptureQueriesContext(connection) as context:
+                self.assertEqual(paginator.count, 30)
+            self.assertFalse(any('COUNT(' in query['sql'] for query in context.captured_queries))
+
+            paginator = EstimatedCountPaginator(Product.objects.filter(model='admin').order_by('pk'), 5)
+            with self.assertNumQueries(1):
+                self.assertEqual(paginator.count, 30)
+
+
+class NetworkHierarchyTestCase(TestCase):
+    def setUp(self):
+        self.factory = Link.objects.create(status_link='factory', name='factory')
+        self.factory_2 = Link.objects.create(status_link='factory', name='factory_2')
+        self.retail = Link.objects.create(status_link='retail_network', supplier=self.factory, name='retail')
+        self.entrepreneur = Link.objects.create(status_link='entrepreneur', supplier=self.retail, name='entrepreneur')
+
+    def test_path(self):
+        """Путь и уровень звена вычисляются без обхода цепочки поставщиков"""
+        self.assertEqual(self.entrepreneur.path, f'{self.factory.id}/{self.retail.id}/')
+        self.assertEqual(self.entrepreneur.level, 2)
+
+        retail = Link.objects.get(pk=self.retail.pk)
+        with self.assertNumQueries(2):
+            # загрузка поставщика и сохранение
+            retail.save()
+
+    def test_ancestors_descendants(self):
+        """Предки и потомки звена одним запросом"""
+        with self.assertNumQueries(1):
+            self.assertEqual(list(self.entrepreneur.get_ancestors()), [self.factory, self.retail])
+
+        with self.assertNumQueries(1):
+            self.assertEqual(set(self.factory.get_descendants()), {self.retail, self.entrepreneur})
+
+        self.assertEqual(self.entrepreneur.root_id, self.factory.id)
+        self.assertEqual(self.factory.root_id, self.factory.id)
+
+    def test_change_supplier(self):
+        """Смена поставщика пересчитывает уровни всего поддерева"""
+        self.retail.supplier = None
+        self.retail.status_link = 'factory'
+        self.retail.save()
+
+        self.entrepreneur.refresh_from_db()
+        self.assertEqual(self.entrepreneur.path, f'{self.retail.id}/')
+        self.assertEqual(self.entrepreneur.level, 1)
+
+        self.retail.supplier = self.factory_2
+        self.retail.status_link = 'retail_network'
+        self.retail.save()
+
+        self.entrepreneur.refresh_from_db()
+        self.assertEqual(self.entrepreneur.path, f'{self.factory_2.id}/{self.retail.id}/')
+        self.assertEqual(self.entrepreneur.level, 2)
+        self.assertFalse(self.factory.get_descendants().exists())
+
+    def test_supplier_cycle(self):
+        """Поставщиком не может быть само звено или звено его поддерева"""
+        for supplier in (self.retail, self.entrepreneur):
+            self.factory.status_link = 'retail_network'
+            self.factory.supplier = supplier
+            with self.assertRaises(ValueError):
+                self.factory.save()
+        self.retail.refresh_from_db()
+        self.assertEqual(self.retail.path, f'{self.factory.id}/')
+
+
+class NetworkTreeTestCase(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create(email='tree@test.com', is_active=True, is_staff=True)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+
+        self.factory = Link.objects.create(status_link='factory', name='factory')
+        self.retail = Link.objects.create(status_link='retail_network', supplier=self.factory, name='retail')
+        self.retail_2 = Link.objects.create(status_link='retail_network', supplier=self.factory, name='retail_2')
+        self.entrepreneur = Link.objects.create(status_link='entrepreneur', supplier=self.retail, name='entrepreneur')
+
+    def test_supplier_cycle(self):
+        """Смена поставщика на звено своего поддерева отклоняется API и пакетной загрузкой"""
+        for pk, supplier in ((self.factory.id, self.entrepreneur.id), (self.retail.id, self.retail.id)):
+            response = self.client.patch(reverse('trading_network:link_update', args=[pk]),
+                                         {'status_link': 'retail_network', 'supplier': supplier}, format='json')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        response = self.client.post(reverse('trading_network:link_bulk'), [{
+            'id': self.factory.id, 'status_link': 'retail_network', 'supplier': self.retail.id, 'name': 'factory',
+            'contact': [],
+        }], format='json')
+        self.assertIn('supplier', response.json()['results'][0]['errors'])
+        self.assertEqual(Link.objects.get(pk=self.retail.pk).path, f'{self.factory.id}/')
+
+    def test_link_tree(self):
+        """Тест получения поддерева звена"""
+        # аутентификация, звено с продуктами и контактами, поддерево с продуктами и контактами
+        with self.assertNumQueries(7):
+            response = self.client.get(reverse('trading_network:link_tree', args=[self.factory.id]))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        tree = response.json()
+        self.assertEqual(tree['name'], 'factory')
+        self.assertEqual([child['name'] for child in tree['children']], ['retail', 'retail_2'])
+        self.assertEqual(tree['children'][0]['children'][0]['name'], 'entrepreneur')
+
+        response = self.client.get(reverse('trading_network:link_tree', args=[self.factory.id]), {'depth': 1})
+        self.assertEqual(response.json()['children'][0]['children'], [])
+
+        response = self.client.get(reverse('trading_network:link_tree', args=[self.factory.id]), {'depth': 'x'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_link_ancestors(self):
+        """Тест получения цепочки поставщиков звена"""
+        response = self.client.get(reverse('trading_network:link_ancestors', args=[self.entrepreneur.id]))
+
+        chain = response.json()
+        self.assertEqual(chain['name'], 'factory')
+        self.assertEqual(chain['children'][0]['name'], 'retail')
+        self.assertEqual(chain['children'][0]['children'][0]['name'], 'entrepreneur')
+
+        response = self.client.get(reverse('trading_network:link_ancestors', args=[self.entrepreneur.id]), {'depth': 1})
+        self.assertEqual(response.json()['name'], 'retail')
+
+    def test_link_tree_stream(self):
+        """Тест потоковой выдачи поддерева в формате NDJSON"""
+        response = self.client.get(reverse('trading_network:link_tree', args=[self.factory.id]), {'stream': 1})
+
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual([row['name'] for row in rows], ['factory', 'retail', 'retail_2', 'entrepreneur'])
+        self.assertEqual(rows[3]['supplier_id'], self.retail.id)
+
+
+class NetworkBulkTestCase(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create(email='bulk@test.com', is_active=True, is_staff=True)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+
+        self.product = Product.objects.create(name='bulk', model='bulk', date='2024-03-04')
+        self.product_2 = Product.objects.create(name='bulk_2', model='bulk_2', date='2024-03-04')
+        self.factory = Link.objects.create(status_link='factory', name='bulk_factory')
+        self.factory.products.set([self.product])
+        self.retail = Link.objects.create(status_link='retail_network', supplier=self.factory, name='bulk_retail')
+        Contact.objects.create(link=self.retail, email='old@test.com', country='Russia', city='Moscow',
+                               street='test', num_house='1')
+
+    def item(self, name, **kwargs):
+        item = {
+            'status_link': 'retail_network',
+            'supplier': self.factory.id,
+            'name': name,
+            'products': [self.product.id],
+            'contact': [{'email': 'bulk@test.com', 'country': 'China', 'city': 'Beijing',
+                         'street': 'test', 'num_house': '1'}],
+        }
+        item.update(kwargs)
+        return item
+
+    def post(self, items):
+        return self.client.post(reverse('trading_network:link_bulk'), items)
+
+    def test_bulk_upsert(self):
+        """Тест пакетного создания и обновления звеньев с ошибками отдельных элементов"""
+        response = self.post([
+            self.item('bulk_1'),
+            self.item('bulk_retail', id=self.retail.id, contact=[]),
+            self.item('bulk_2', products=[self.product_2.id]),
+            self.item('bulk_1'),
+            self.item('bulk_3', supplier=0),
+        ])
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        results = response.json()['results']
+        self.assertEqual(results[0]['status'], 'created')
+        self.assertEqual(results[1], {'index': 1, 'id': self.retail.id, 'status': 'updated'})
+        self.assertEqual(results[2]['errors'], {'non_field_errors': [
+            'Продукт %s не принадлежит поставщику %s' % (self.product_2.name, self.factory.name)
+        ]})
+        self.assertIn('name', results[3]['errors'])
+        self.assertIn('supplier', results[4]['errors'])
+
+        link = Link.objects.get(pk=results[0]['id'])
+        self.assertEqual((link.level, link.path), (1, f'{self.factory.id}/'))
+        self.assertEqual(list(link.products.all()), [self.product])
+        self.assertEqual(link.contact_set.get().city, 'Beijing')
+        self.assertFalse(self.retail.contact_set.exists())
+        self.assertEqual(Link.objects.count(), 3)
+
+    def test_bulk_duplicate_products(self):
+        """Повторы продукта в элементе не ломают пакет и дают одну строку связи"""
+        response = self.post([
+            self.item('bulk_1', products=[self.product.id, self.product.id]),
+            self.item('bulk_retail', id=self.retail.id, products=[self.product.id, self.product.id]),
+        ])
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        results = response.json()['results']
+        self.assertEqual([result['status'] for result in results], ['created', 'updated'])
+        for result in results:
+            self.assertEqual(list(Link.objects.get(pk=result['id']).products.all()), [self.product])
+
+    def test_bulk_num_queries(self):
+        """Число запросов пакетной записи не зависит от размера пакета"""
+        # первый запрос загружает пользователя в кэш аутентификации
+        self.post([])
+        with CaptureQueriesContext(connection) as small:
+            self.post([self.item(f'small_{i}') for i in range(2)])
+        with CaptureQueriesContext(connection) as large:
+            self.post([self.item(f'large_{i}') for i in range(50)])
+
+        self.assertEqual(len(small), len(large))
+        self.assertEqual(Link.objects.filter(name__startswith='large_').count(), 50)
+
+    def test_bulk_not_list(self):
+        response = self.post(self.item('bulk_1'))
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class NetworkLoadCommandTestCase(TestCase):
+    records = [
+        {'type': 'contact', 'link': 'load_retail', 'email': 'load@test.com', 'country': 'Russia',
+         'city': 'Moscow', 'street': 'test', 'num_house': '1'},
+        {'type': 'link', 'name': 'load_entrepreneur', 'status_link': 'entrepreneur', 'supplier': 'load_retail',
+         'products': ['load']},
+        {'type': 'link', 'name': 'load_retail', 'status_link': 'retail_network', 'supplier': 'load_factory',
+         'debt': '10.50', 'products': ['load']},
+        {'type': 'link', 'name': 'load_factory', 'status_link': 'factory', 'products': ['load']},
+        {'type': 'product', 'name': 'load', 'model': 'load', 'date': '2024-03-04'},
+    ]
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def write(self, name, content):
+        path = Path(self.directory.name) / name
+        path.write_text(content, encoding='utf-8')
+        return path
+
+    def assertNetworkLoaded(self):
+        entrepreneur = Link.objects.get(name='load_entrepreneur')
+        self.assertEqual(entrepreneur.level, 2)
+        self.assertEqual([link.name for link in entrepreneur.get_ancestors()], ['load_factory', 'load_retail'])
+        self.assertEqual(entrepreneur.products.get().name, 'load')
+        self.assertEqual(Link.objects.get(name='load_retail').contact_set.get().city, 'Moscow')
+        self.assertEqual(str(Link.objects.get(name='load_retail').debt), '10.50')
+
+    def test_load_ndjson(self):
+        """Тест загрузки сети из NDJSON с поставщиками после получателей"""
+        path = self.write('network.ndjson', '\n'.join(json.dumps(record) for record in self.records))
+
+        call_command('load_network', path, chunk_size=2, stdout=StringIO())
+
+        self.assertNetworkLoaded()
+        self.assertFalse(path.with_name('network.ndjson.progress.json').exists())
+
+        # повторная загрузка не создает дубликатов звеньев и продуктов
+        call_command('load_network', path, stdout=StringIO())
+        self.assertEqual(Link.objects.count(), 3)
+        self.assertEqual(Product.objects.count(), 1)
+
+    def test_load_csv_resume(self):
+        """Тест загрузки CSV и возобновления после ошибки"""
+        fields = ['type', 'name', 'model', 'date', 'status_link', 'supplier', 'debt', 'products',
+                  'link', 'email', 'country', 'city', 'street', 'num_house']
+        rows = [dict(record, products=';'.join(record.get('products', []))) for record in self.records]
+        broken = dict(rows[0], link='unknown')
+        content = StringIO()
+        writer = csv.DictWriter(content, fields)
+        writer.writeheader()
+        writer.writerows(rows + [broken])
+        path = self.write('network.csv', content.getvalue())
+
+        with self.assertRaises(CommandError):
+            call_command('load_network', path, chunk_size=1, stdout=StringIO())
+        self.assertNetworkLoaded()
+
+        # после исправления файла загрузка продолжается с последней сохраненной пачки
+        path.write_text(content.getvalue().replace('unknown', 'load_factory'), encoding='utf-8')
+        call_command('load_network', path, resume=True, stdout=StringIO())
+
+        self.assertEqual(Contact.objects.count(), 2)
+        self.assertEqual(Link.objects.get(name='load_factory').contact_set.count(), 1)
+
+    def test_resume_contacts(self):
+        """Тест возобновления с пачки контактов, записанной до сбоя: дубликаты не создаются"""
+        path = self.write('network.ndjson', '\n'.join(json.dumps(record) for record in self.records))
+        call_command('load_network', path, stdout=StringIO())
+
+        # сбой между фиксацией пачки и сохранением прогресса
+        path.with_name('network.ndjson.progress.json').write_text(
+            json.dumps({'phase': 'contacts', 'pass': 0, 'line': 0}))
+        call_command('load_network', path, resume=True, stdout=StringIO())
+
+        self.assertEqual(Contact.objects.count(), 1)
+
+    def test_products_by_name_and_model(self):
+        """Тест загрузки продуктов с одинаковым названием и разными моделями"""
+        records = [{'type': 'product', 'name': 'load', 'model': model, 'date': '2024-03-04'} for model in 'ab']
+        path = self.write('network.ndjson', '\n'.join(json.dumps(record) for record in records))
+
+        call_command('load_network', path, stdout=StringIO())
+        call_command('load_network', path, stdout=StringIO())
+
+        self.assertEqual(sorted(Product.objects.values_list('model', flat=True)), ['a', 'b'])
+
+    def test_invalid_links(self):
+        """Тест проверки звеньев: иерархия и продукты поставщика"""
+        product = {'type': 'product', 'name': 'other', 'model': 'other', 'date': '2024-03-04'}
+        cases = [
+            ({'type': 'link', 'name': 'load_factory2', 'status_link': 'factory', 'supplier': 'load_factory'},
+             'У завода не может быть Поставщика'),
+            ({'type': 'link', 'name': 'load_retail2', 'status_link': 'retail_network'},
+             'Без поставщика может быть только Завод'),
+            ({'type': 'link', 'name': 'load_retail2', 'status_link': 'retail_network', 'supplier': 'load_factory',
+              'products': ['other']}, 'other'),
+        ]
+        for record, message in cases:
+            with self.subTest(message):
+                path = self.write('network.ndjson', '\n'.join(json.dumps(record)
+                                                              for record in [*self.records, product, record]))
+                with self.assertRaisesMessage(CommandError, message):
+                    call_command('load_network', path, stdout=StringIO())
+                self.assertFalse(Link.objects.filter(name=record['name']).exists())
+
+
+class NetworkGenerateCommandTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        call_command('generate_network', factories=2, retail=5, entrepreneurs=30, products=12, products_per_link=3,
+                     contacts_per_link=2, batch_size=7, seed=1, prefix='gen', stdout=StringIO())
+
+    def test_generate(self):
+        """Сгенерированная сеть согласована: иерархия, каталоги, журнал и сводка задолженности"""
+        self.assertEqual(Link.objects.filter(level=0).count(), 2)
+        self.assertEqual(Link.objects.filter(status_link='retail_network', level=1).count(), 5)
+        self.assertEqual(Link.objects.filter(status_link='entrepreneur').count(), 30)
+        self.assertEqual(Contact.objects.count(), 37 * 2)
+        self.assertFalse(Link.objects.filter(level=0, debt__isnull=False).exists())
+
+        for link in Link.objects.exclude(level=0).select_related('supplier'):
+            self.assertEqual(link.path, Link.build_path(link.supplier))
+            self.assertLessEqual(set(link.products.values_list('pk', flat=True)),
+                                 set(link.supplier.products.values_list('pk', flat=True)))
+            self.assertEqual(ledger.balance(link.pk), link.debt or 0)
+
+        rollup = list(DebtRollup.objects.order_by('root_id', 'level', 'status_link', 'country')
+                      .values_list('root_id', 'level', 'status_link', 'country', 'total', 'links'))
+        rollups.rebuild()
+        self.assertEqual(rollup, list(DebtRollup.objects.filter(links__gt=0)
+                                      .order_by('root_id', 'level', 'status_link', 'country')
+                                      .values_list('root_id', 'level', 'status_link', 'country', 'total', 'links')))
+
+        with self.assertRaises(CommandError):
+            call_command('generate_network', factories=1, prefix='gen', stdout=StringIO())
+
+    def test_interrupted(self):
+        """После сбоя генерации созданные пачки звеньев учтены в сводке задолженности"""
+        record_many = ledger.record_many
+        calls = []
+
+        def fail_fourth_batch(*args):
+            calls.append(args)
+            if len(calls) == 4:
+                raise RuntimeError('boom')
+            record_many(*args)
+
+        with mock.patch('trading_network.ledger.record_many', side_effect=fail_fourth_batch):
+            with self.assertRaises(RuntimeError):
+                call_command('generate_network', factories=2, retail=5, entrepreneurs=30, batch_size=7, seed=2,
+                             prefix='crash', stdout=StringIO())
+
+        self.assertEqual(Link.objects.filter(name__startswith='crash entrepreneurs').count(), 7)
+        rollup = list(DebtRollup.objects.filter(links__gt=0).order_by('root_id', 'level', 'status_link', 'country')
+                      .values_list('root_id', 'level', 'status_link', 'country', 'total', 'links'))
+        rollups.rebuild()
+        self.assertEqual(rollup, list(DebtRollup.objects.filter(links__gt=0)
+                                      .order_by('root_id', 'level', 'status_link', 'country')
+                                      .values_list('root_id', 'level', 'status_link', 'country', 'total', 'links')))
+
+    def test_benchmark_endpoints(self):
+        """Бенчмарк измеряет эндпоинты, откатывает записи и сравнивает результаты с предыдущим прогоном"""
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        output = Path(directory.name) / 'endpoints.json'
+        names = ['trading_network:link_list', 'trading_network:link_create', 'trading_network:link_delete',
+                 'users:token_obtain_pair']
+        links = Link.objects.count()
+        call_command('benchmark_endpoints', repeat=2, warmup=1, only=names, output=output, stdout=StringIO())
+
+        document = json.loads(output.read_text())
+        self.assertEqual(list(document['results']), names)
+        self.assertEqual([result['status'] for result in document['results'].values()], [200, 201, 204, 200])
+        self.assertEqual(document['results']['trading_network:link_list']['queries'], 4)
+        self.assertEqual(Link.objects.count(), links)
+        self.assertFalse(User.objects.exists())
+
+        document['results']['trading_network:link_list']['queries'] = 1
+        output.write_text(json.dumps(document))
+        with self.assertRaises(CommandError):
+            call_command('benchmark_endpoints', repeat=1, warmup=1, only=names[:1], output=output.with_suffix('.2'),
+                         compare=output, fail_on_regression=True, stdout=StringIO())
+
+
+class NetworkLoadTestCommandTestCase(LiveServerTestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(email='load@test.com', is_active=True, is_staff=True)
+        self.user.set_password('load')
+        self.user.save()
+        Product.objects.create(name='load', model='load', date='2024-03-04')
+
+    def test_load_test(self):
+        """Нагрузочный прогон по живому серверу: смесь чтения и записи, отчет в JSON, удаление созданных звеньев"""
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        output = Path(directory.name) / 'load.json'
+        call_command('load_test', url=self.live_server_url, email='load@test.com', password='load', requests=40,
+                     concurrency=4, mix='list=1,product=1,create=1,update=1', seed=1, output=output, cleanup=True,
+                     stdout=StringIO())
+
+        document = json.loads(output.read_text())
+        self.assertEqual(document['requests'], 40)
+        self.assertEqual(document['error_rate'], 0)
+        self.assertEqual(set(document['operations']), {'list', 'product', 'create', 'update'})
+        self.assertEqual(sum(operation['requests'] for operation in document['operations'].values()), 40)
+        self.assertTrue(all(key in document['latency_ms'] for key in ('p50', 'p95', 'p99')))
+        self.assertFalse(Link.objects.exists())
+
+        with self.assertRaises(CommandError):
+            call_command('load_test', url=self.live_server_url, email='load@test.com', password='wrong',
+                         requests=1, stdout=StringIO())
+
+
+class NetworkLoadTestConnectionTestCase(SimpleTestCase):
+    async def serve(self, method):
+        """Ответ на запрос method по соединению, которое сервер закрыл после первого ответа"""
+        accepted = []
+
+        async def handle(reader, writer):
+            accepted.append(writer)
+            await reader.readuntil(b'\r\n\r\n')
+            writer.write(b'HTTP/1.1 200 OK\r\nContent-Length: 2\r\n\r\n{}')
+            await writer.drain()
+            if len(accepted) == 1:
+                # простаивающее соединение закрывается сервером
+                writer.close()
+
+        server = await asyncio.start_server(handle, '127.0.0.1', 0)
+        client = load_test.Connection('127.0.0.1', server.sockets[0].getsockname()[1])
+        try:
+            await client.request('GET', '/')
+            await asyncio.sleep(0.05)
+            return await client.request(method, '/', {})
+        finally:
+            await client.close()
+            server.close()
+
+    def test_retry_safe_methods(self):
+        """После разрыва соединения повторяются только GET и HEAD, запись считается ошибкой"""
+        self.assertEqual(asyncio.run(self.serve('GET')), (200, b'{}'))
+        for method in ('POST', 'PATCH'):
+            with self.subTest(method), self.assertRaises((ConnectionError, asyncio.IncompleteReadError)):
+                asyncio.run(self.serve(method))
+
+
+class NetworkExportTestCase(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create(email='export@test.com', is_active=True, is_staff=True)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+
+        self.product = Product.objects.create(name='export', model='export', date='2024-03-04')
+        self.factory = Link.objects.create(status_link='factory', name='export_factory')
+        self.retail = Link.objects.create(status_link='retail_network', supplier=self.factory, name='export_retail')
+        for link, country in ((self.factory, 'Russia'), (self.retail, 'China')):
+            link.products.set([self.product])
+            Contact.objects.create(link=link, email='export@test.com', country=country, city='City',
+                                   street='test', num_house='1')
+
+    def test_export_ndjson(self):
+        """Тест потоковой выгрузки звеньев в NDJSON с фильтрацией"""
+        response = self.client.get(reverse('trading_network:link_export'))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual([row['name'] for row in rows], ['export_factory', 'export_retail'])
+        self.assertEqual(rows[1]['supplier_id'], self.factory.id)
+        self.assertEqual(rows[1]['products'][0]['name'], 'export')
+
+        response = self.client.get(reverse('trading_network:link_export'), {'country': 'China'})
+        rows = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual([json.loads(row)['name'] for row in rows], ['export_retail'])
+
+    def test_export_csv(self):
+        """Тест потоковой выгрузки звеньев в CSV"""
+        response = self.client.get(reverse('trading_network:link_export'), {'output': 'csv'})
+
+        rows = list(csv.DictReader(StringIO(b''.join(response.streaming_content).decode())))
+        self.assertEqual(rows[0]['name'], 'export_factory')
+        self.assertEqual(json.loads(rows[0]['contact'])[0]['country'], 'Russia')
+
+        response = self.client.get(reverse('trading_network:link_export'), {'output': 'xml'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_export_command(self):
+        """Тест выгрузки звеньев командой"""
+        out = StringIO()
+        call_command('export_network', filter=['country=Russia'], stdout=out)
+
+        rows = [json.loads(line) for line in out.getvalue().splitlines()]
+        self.assertEqual([row['name'] for row in rows], ['export_factory'])
+
+
+class NetworkPaginationTestCase(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(email='pages@test.com', is_active=True, is_staff=True)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+
+        Link.objects.bulk_create(Link(status_link='factory', name=f'page_{i}', level=0) for i in range(25))
+        Product.objects.bulk_create(
+            Product(name=f'page_{i}', model='page', date='2024-03-04') for i in range(15)
+        )
+
+    def test_link_cursor_pagination(self):
+        """Тест навигации по курсору списка звеньев"""
+        names = []
+        url = reverse('trading_network:link_list') + '?pagination=cursor&page_size=10'
+        # первый запрос загружает пользователя в кэш аутентификации
+        self.client.get(reverse('trading_network:product-list'))
+        while url:
+            with self.assertNumQueries(3):
+                # страница звеньев, продукты, контакты - без COUNT(*)
+                response = self.client.get(url)
+            self.assertNotIn('count', response.json())
+            names += [link['name'] for link in response.json()['results']]
+            url = response.json()['next']
+
+        # от новых звеньев к старым
+        self.assertEqual(names, [f'page_{i}' for i in reversed(range(25))])
+
+        # порядок курсора не подменяет запрошенный молча
+        response = self.client.get(reverse('trading_network:link_list'), {'pagination': 'cursor', 'ordering': 'debt'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('ordering', response.json())
+
+    def test_link_cursor_same_created_at(self):
+        """Тест навигации по курсору по звеньям с одинаковым временем создания"""
+        Link.objects.update(created_at=timezone.now())
+        names = []
+        url = reverse('trading_network:link_list') + '?pagination=cursor&page_size=10'
+        while url:
+            response = self.client.get(url)
+            names += [link['name'] for link in response.json()['results']]
+            url = response.json()['next']
+
+        self.assertEqual(names, [f'page_{i}' for i in reversed(range(25))])
+
+    def test_product_cursor_pagination(self):
+        """Тест навигации по курсору списка продуктов"""
+        response = self.client.get('/product/', {'pagination': 'cursor'})
+
+        self.assertEqual(len(response.json()['results']), 10)
+        response = self.client.get(response.json()['next'])
+        self.assertEqual(len(response.json()['results']), 5)
+        self.assertIsNone(response.json()['next'])
+
+    def test_max_page_size(self):
+        """Тест ограничения размера страницы"""
+        response = self.client.get(reverse('trading_network:link_list'), {'page_size': 20})
+        self.assertEqual(len(response.json()['results']), 20)
+
+        with mock.patch.object(OptionalCursorPagination, 'max_page_size', 12):
+            response = self.client.get(reverse('trading_network:link_list'), {'page_size': 25})
+            self.assertEqual(len(response.json()['results']), 12)
+
+            response = self.client.get('/contact/', {'page_size': 20, 'pagination': 'cursor'})
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+
+class NetworkCacheTestCase(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create(email='cache@test.com', is_active=True, is_staff=True)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+
+        self.product = Product.objects.create(name='cache', model='cache', date='2024-03-04')
+        self.link = Link.objects.create(status_link='factory', name='cache_factory')
+        self.contact = Contact.objects.create(link=self.link, email='cache@test.com', country='Russia',
+                                              city='Moscow', street='test', num_house='1')
+
+    def test_cached_link(self):
+        """Повторный запрос звена отдается из кэша, изменения сбрасывают кэш"""
+        url = reverse('trading_network:link', args=[self.link.id])
+        response = self.client.get(url)
+        etag = response['ETag']
+
+        with self.assertNumQueries(0):
+            # и пользователь, и ответ берутся из кэша
+            response = self.client.get(url)
+        self.assertEqual(response['ETag'], etag)
+
+        self.link.products.set([self.product])
+        response = self.client.get(url)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.json()['products'][0]['name'], 'cache')
+
+        self.contact.city = 'Kazan'
+        self.contact.save()
+        self.assertEqual(self.client.get(url).json()['contact'][0]['city'], 'Kazan')
+
+        self.product.name = 'cache_2'
+        self.product.save()
+        self.assertEqual(self.client.get(url).json()['products'][0]['name'], 'cache_2')
+
+    def test_conditional_request(self):
+        """Условный запрос с совпадающим ETag возвращает 304, Last-Modified не отдается"""
+        response = self.client.get('/product/')
+        self.assertFalse(response.has_header('Last-Modified'))
+
+        response = self.client.get('/product/', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        # контакты не влияют на кэш продуктов
+        etag = self.client.get('/product/')['ETag']
+        Contact.objects.create(link=self.link, email='cache@test.com', country='Russia',
+                               city='Moscow', street='test', num_house='2')
+        self.assertEqual(self.client.get('/product/', HTTP_IF_NONE_MATCH=etag).status_code,
+                         status.HTTP_304_NOT_MODIFIED)
+
+        Product.objects.create(name='cache_3', model='cache', date='2024-03-04')
+        response = self.client.get('/product/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()['count'], 2)
+
+
+class NetworkDebtRollupTestCase(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create(email='debt@test.com', is_active=True, is_staff=True)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+
+        self.factory = Link.objects.create(status_link='factory', name='debt_factory')
+        self.factory_2 = Link.objects.create(status_link='factory', name='debt_factory_2')
+        self.retail = Link.objects.create(status_link='retail_network', supplier=self.factory, name='debt_retail',
+                                          debt=100)
+        self.entrepreneur = Link.objects.create(status_link='entrepreneur', supplier=self.retail,
+                                                name='debt_entrepreneur', debt=50)
+        self.entrepreneur_2 = Link.objects.create(status_link='entrepreneur', supplier=self.factory_2,
+                                                  name='debt_entrepreneur_2', debt='25.50')
+        for link, country in ((self.retail, 'Russia'), (self.retail, 'China'), (self.entrepreneur, 'Russia')):
+            Contact.objects.create(link=link, email='debt@test.com', country=country, city='City',
+                                   street='test', num_house='1')
+
+    def rollup(self):
+        return sorted(DebtRollup.objects.filter(links__gt=0).values_list(
+            'root_id', 'level', 'status_link', 'country', 'total', 'links'))
+
+    def assertRollupConsistent(self):
+        incremental = self.rollup()
+        rollups.rebuild()
+        self.assertEqual(incremental, self.rollup())
+
+    def get(self, group_by):
+        response = self.client.get(reverse('trading_network:link_debt'), {'group_by': group_by})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.json()
+
+    def test_debt_rollup(self):
+        """Тест агрегирования задолженности по заводу, уровню, типу звена и стране"""
+        self.assertEqual(self.get('root'), [
+            {'root': self.factory.id, 'root_name': 'debt_factory', 'debt': '150.00', 'links': 2},
+            {'root': self.factory_2.id, 'root_name': 'debt_factory_2', 'debt': '25.50', 'links': 1},
+        ])
+        self.assertEqual(self.get('level'), [{'level': 1, 'debt': '125.50', 'links': 2},
+                                             {'level': 2, 'debt': '50.00', 'links': 1}])
+        self.assertEqual(self.get('country'), [{'country': 'China', 'debt': '100.00', 'links': 1},
+                                               {'country': 'Russia', 'debt': '150.00', 'links': 2}])
+        self.assertEqual(self.get('status_link,country')[0],
+                         {'status_link': 'entrepreneur', 'country': 'Russia', 'debt': '50.00', 'links': 1})
+
+        response = self.client.get(reverse('trading_network:link_debt'), {'group_by': 'name'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_incremental_updates(self):
+        """Сводка обновляется инкрементально при изменении звеньев и контактов"""
+        self.retail.debt = 10
+        self.retail.save()
+        self.assertEqual(self.get('root')[0]['debt'], '60.00')
+
+        contact = self.retail.contact_set.get(country='China')
+        contact.country = 'India'
+        contact.save()
+        self.assertEqual([row['country'] for row in self.get('country')], ['India', 'Russia'])
+        self.retail.contact_set.filter(country='Russia').delete()
+        self.assertRollupConsistent()
+
+        # смена поставщика переносит задолженность поддерева
+        self.retail.supplier = self.factory_2
+        self.retail.save()
+        self.assertEqual(self.get('root'), [
+            {'root': self.factory_2.id, 'root_name': 'debt_factory_2', 'debt': '85.50', 'links': 3},
+        ])
+        self.assertRollupConsistent()
+
+        self.retail.delete()
+        self.assertEqual(self.get('root')[0]['debt'], '25.50')
+        self.assertRollupConsistent()
+
+    def test_failed_delete(self):
+        """После ошибки удаления звено не остается отмеченным как удаляемое"""
+        with mock.patch('trading_network.rollups.link_deleted', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError), transaction.atomic():
+                Link.objects.filter(pk=self.entrepreneur_2.pk).delete()
+        self.assertEqual(rollups._deleting.get(), frozenset())
+
+        Contact.objects.create(link=self.entrepreneur_2, email='debt@test.com', country='Spain', city='Madrid',
+                               street='test', num_house='1')
+        self.assertIn({'country': 'Spain', 'debt': '25.50', 'links': 1}, self.get('country'))
+        self.assertRollupConsistent()
+
+    def test_save_after_refresh(self):
+        """Сохранение после refresh_from_db вычитает из сводки перечитанную задолженность"""
+        ledger.post(self.entrepreneur_2.pk, 7)
+        self.entrepreneur_2.refresh_from_db()
+        self.entrepreneur_2.debt = 1
+        self.entrepreneur_2.save()
+
+        total = DebtRollup.objects.get(root_id=self.factory_2.pk, level=1, status_link='entrepreneur', country='')
+        self.assertEqual(total.total, 1)
+        self.assertRollupConsistent()
+
+    def test_bulk_changes(self):
+        """Сводка учитывает пакетную запись и очистку задолженности в админке"""
+        self.client.post(reverse('trading_network:link_bulk'), [{
+            'id': self.retail.id, 'status_link': 'retail_network', 'supplier': self.factory_2.id,
+            'name': 'debt_retail', 'products': [],
+            'contact': [{'email': 'debt@test.com', 'country': 'Spain', 'city': 'Madrid', 'street': 'test',
+                         'num_house': '1'}],
+        }])
+        self.assertEqual(self.get('country')[0], {'country': 'Russia', 'debt': '50.00', 'links': 1})
+        self.assertRollupConsistent()
+
+        request = mock.Mock(user=AnonymousUser())
+        clean_debt(LinkAdmin(Link, AdminSite()), request, Link.objects.filter(pk=self.entrepreneur.pk))
+        jobs.process_pending()
+        self.assertEqual(self.get('level'), [{'level': 1, 'debt': '125.50', 'links': 2}])
+        self.assertRollupConsistent()
+
+
+@override_settings(DEBT_JOB_RUNNER='command')
+class NetworkDebtClearJobTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(email='debt_job@test.com', is_staff=True, is_active=True, is_superuser=True)
+        self.client.force_login(self.user)
+        self.factory = Link.objects.create(status_link='factory', name='debt_job_factory')
+        self.links = [
+            Link.objects.create(status_link='retail_network', supplier=self.factory, name=f'debt_job_{i}',
+                                debt=i * 10 if i < 5 else None)
+            for i in range(7)
+        ]
+
+    def test_chunked_clean(self):
+        """Задолженность очищается пачками, суммы сохраняются в записях задания"""
+        job = jobs.enqueue_clean_debt(Link.objects.all(), self.user)
+        self.assertEqual(job.total, 5)
+
+        with CaptureQueriesContext(connection) as context:
+            self.assertTrue(jobs.run(job.pk, chunk_size=2))
+        self.assertEqual(sum(query['sql'].startswith('SAVEPOINT') for query in context.captured_queries), 4)
+
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.processed, job.cleared_total), ('done', 5, 100))
+        self.assertFalse(Link.objects.filter(debt__isnull=False).exists())
+        self.assertEqual(
+            dict(job.records.values_list('link__name', 'debt')),
+            {f'debt_job_{i}': i * 10 for i in range(5)}
+        )
+        self.assertFalse(DebtRollup.objects.exclude(total=0).exists())
+        self.assertFalse(jobs.run(job.pk))
+
+    def test_resume_failed(self):
+        """Задание, прерванное ошибкой, продолжается с первой необработанной пачки"""
+        job = jobs.enqueue_clean_debt(Link.objects.all())
+
+        with mock.patch('trading_network.jobs.invalidate', side_effect=[None, RuntimeError('boom')]):
+            with self.assertRaises(RuntimeError):
+                jobs.run(job.pk, chunk_size=2)
+
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.processed, job.error), ('failed', 2, 'boom'))
+        self.assertEqual(Link.objects.filter(debt__isnull=False).count(), 3)
+
+        call_command('process_debt_jobs', job=job.pk, chunk_size=2, stdout=StringIO())
+
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.processed, job.cleared_total), ('done', 5, 100))
+
+    def test_reclaim_stale(self):
+        """Задание, исполнитель которого остановился, продолжается командой после DEBT_JOB_STALE_SECONDS"""
+        job = jobs.enqueue_clean_debt(Link.objects.all())
+        hour_ago = timezone.now() - timedelta(hours=1)
+        DebtClearJob.objects.filter(pk=job.pk).update(status='running', started_at=hour_ago)
+        DebtClearRecord.objects.filter(pk=job.records.order_by('pk')[0].pk).update(processed_at=timezone.now())
+
+        # пачка обработана недавно - задание еще выполняется
+        call_command('process_debt_jobs', stdout=StringIO())
+        self.assertEqual(DebtClearJob.objects.get().status, 'running')
+
+        job.records.update(processed_at=None)
+        with self.assertLogs('trading_network.jobs', 'WARNING'):
+            call_command('process_debt_jobs', stdout=StringIO())
+
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.processed, job.cleared_total), ('done', 5, 100))
+        self.assertFalse(Link.objects.filter(debt__isnull=False).exists())
+
+    @override_settings(DEBT_JOB_RUNNER='command')
+    def test_admin_action(self):
+        """Действие админки ставит задание в очередь, прогресс виден в карточке задания"""
+        changelist = reverse('admin:trading_network_link_changelist')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(changelist, {
+                'action': 'clean_debt', 'select_across': '1', 'index': '0',
+                '_selected_action': [self.links[0].pk],
+            }, follow=True)
+
+        self.assertContains(response, 'Очистка задолженности у 5 звеньев поставлена в очередь')
+        self.assertEqual(Link.objects.filter(debt__isnull=False).count(), 5)
+        # фоновый поток не запускается, задание выполняет команда в потоке теста
+        self.assertEqual(DebtClearJob.objects.get().status, 'pending')
+
+        call_command('process_debt_jobs', stdout=StringIO())
+        job = DebtClearJob.objects.get()
+
+        response = self.client.get(reverse('admin:trading_network_debtclearjob_change', args=[job.pk]))
+
+        self.assertContains(response, '5 / 5 (100%)')
+        self.assertFalse(Link.objects.filter(debt__isnull=False).exists())
+
+
+class NetworkLedgerTestCase(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(email='ledger@test.com', is_active=True)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+        self.factory = Link.objects.create(status_link='factory', name='ledger_factory')
+        self.retail = Link.objects.create(status_link='retail_network', supplier=self.factory, name='ledger_retail',
+                                          debt=100)
+
+    def entries(self, link):
+        return list(link.debt_transactions.order_by('id').values_list('kind', 'amount'))
+
+    def debt(self, link):
+        return Link.objects.values_list('debt', flat=True).get(pk=link.pk)
+
+    def test_post(self):
+        """Проводка добавляется в журнал и меняет кэшированный баланс и сводку"""
+        ledger.post(self.retail.pk, Decimal('25.50'))
+        ledger.post(self.retail.pk, -40, DebtTransaction.Kind.PAYMENT, 'оплата')
+        ledger.post(self.factory.pk, 10)
+
+        self.assertEqual(self.debt(self.retail), Decimal('85.50'))
+        self.assertEqual(self.entries(self.retail), [('opening', 100), ('charge', Decimal('25.50')), ('payment', -40)])
+        self.assertEqual(ledger.balance(self.retail.pk), self.debt(self.retail))
+        self.assertEqual(self.debt(self.factory), 10)
+        self.assertEqual(DebtRollup.objects.get(root_id=self.factory.pk, level=1, country='').total, Decimal('85.50'))
+
+    def test_direct_changes_recorded(self):
+        """Изменение задолженности через save (админка) записывается в журнал корректировкой"""
+        self.retail.debt = 70
+        self.retail.save()
+        self.retail.name = 'ledger_retail_2'
+        self.retail.save(update_fields=['name'])
+        jobs.run(jobs.enqueue_clean_debt(Link.objects.filter(pk=self.retail.pk)).pk)
+
+        self.assertEqual(self.entries(self.retail), [('opening', 100), ('adjustment', -30), ('clear', -70)])
+        self.assertEqual(ledger.balance(self.retail.pk), 0)
+        self.assertIsNone(self.debt(self.retail))
+
+    def test_stale_instance_keeps_posted_debt(self):
+        """Сохранение звена, загруженного до проводки, не затирает задолженность, изменение через API тоже"""
+        stale = Link.objects.get(pk=self.retail.pk)
+        ledger.post(self.retail.pk, 7)
+        stale.name = 'ledger_retail_2'
+        stale.save()
+        self.assertEqual(self.debt(self.retail), 107)
+
+        ledger.post(self.retail.pk, 3)
+        serializer = LinkSerializer(stale, data={'name': 'ledger_retail_3'}, partial=True)
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+
+        self.assertEqual(self.debt(self.retail), 110)
+        self.assertEqual(ledger.balance(self.retail.pk), 110)
+
+    def test_save_after_refresh(self):
+        """После refresh_from_db корректировка считается от перечитанной задолженности"""
+        ledger.post(self.retail.pk, 7)
+        self.retail.refresh_from_db()
+        self.retail.debt = 1
+        self.retail.save()
+
+        self.assertEqual(self.entries(self.retail), [('opening', 100), ('charge', 7), ('adjustment', -106)])
+        self.assertEqual(ledger.balance(self.retail.pk), 1)
+
+    def test_balance_as_of(self):
+        """Баланс на дату - последний снимок плюс проводки после него, два запроса"""
+        start = timezone.now() - timedelta(days=10)
+        DebtTransaction.objects.filter(link=self.retail).update(created_at=start)
+        for day in range(1, 10):
+            entry = ledger.post(self.retail.pk, day)
+            DebtTransaction.objects.filter(pk=entry.pk).update(created_at=start + timedelta(days=day))
+            if day % 3 == 0:
+                ledger.take_snapshot(start + timedelta(days=day, hours=12))
+
+        self.assertEqual(DebtSnapshot.objects.filter(link=self.retail).count(), 3)
+        with self.assertRaises(ValueError):
+            ledger.take_snapshot(start)
+        # проводки последних DEBT_SNAPSHOT_LAG_SECONDS могут быть еще не зафиксированы
+        with self.assertRaises(ValueError):
+            ledger.take_snapshot(timezone.now())
+
+        for day in range(10):
+            with self.assertNumQueries(2):
+                self.assertEqual(ledger.balance(self.retail.pk, start + timedelta(days=day, hours=1)),
+                                 100 + sum(range(day + 1)))
+
+        response = self.client.get(reverse('trading_network:link_balance', args=[self.retail.pk]),
+                                   {'as_of': (start + timedelta(days=4, hours=1)).isoformat()})
+        self.assertEqual(response.json()['debt'], '110.00')
+        response = self.client.get(reverse('trading_network:link_balance', args=[self.retail.pk]))
+        self.assertEqual(response.json(), {'id': self.retail.pk, 'as_of': None, 'debt': '145.00'})
+
+    def test_balance_api(self):
+        """Баланс звена без задолженности - 0.00 с as_of и без него, некорректная дата - ошибка 400"""
+        url = reverse('trading_network:link_balance', args=[self.factory.pk])
+        self.assertEqual(self.client.get(url).json()['debt'], '0.00')
+        self.assertEqual(self.client.get(url, {'as_of': timezone.now().isoformat()}).json()['debt'], '0.00')
+
+        for as_of in ('yesterday', '2024-13-45T00:00'):
+            response = self.client.get(url, {'as_of': as_of})
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+            self.assertIn('as_of', response.json())
+
+    def test_ledger_api(self):
+        """Проводки добавляет только администратор, журнал доступен на чтение"""
+        url = reverse('trading_network:link_ledger', args=[self.retail.pk])
+
+        response = self.client.post(url, {'amount': '-20.00', 'kind': 'payment'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+        self.user.is_staff = True
+        self.user.save()
+        response = self.client.post(url, {'amount': '20.00', 'kind': 'payment'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.post(url, {'amount': '-20.00', 'kind': 'payment'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        response = self.client.get(url)
+        self.assertEqual([entry['amount'] for entry in response.json()['results']], ['100.00', '-20.00'])
+        self.assertEqual(self.debt(self.retail), 80)
+
+
+@override_settings(DATABASE_READ_REPLICAS=['replica_1'])
+class NetworkReplicaRoutingTestCase(APITransactionTestCase):
+    # replica_1 - зеркало тестовой базы со своим соединением, поэтому данные должны быть зафиксированы
+    databases = {'default', 'replica_1'}
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(email='replica@test.com', is_active=True, is_staff=True)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+        self.factory = Link.objects.create(status_link='factory', name='replica_factory')
+
+    def get(self, url):
+        with CaptureQueriesContext(connections['default']) as primary, \
+                CaptureQueriesContext(connections['replica_1']) as replica:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return len(primary), len(replica)
+
+    def test_reads_from_replica(self):
+        """Чтения отмеченных представлений идут в реплику, остальные - в основную базу"""
+        primary, replica = self.get(reverse('trading_network:link_list'))
+        self.assertEqual(primary, 0)
+        self.assertGreater(replica, 0)
+
+        primary, replica = self.get(reverse('trading_network:link_ledger', args=[self.factory.pk]))
+        self.assertGreater(primary, 0)
+        self.assertEqual(replica, 0)
+
+    def test_reads_after_write_from_primary(self):
+        """После записи клиент читает из основной базы, пока не истечет REPLICA_STICKY_SECONDS"""
+        with CaptureQueriesContext(connections['replica_1']) as replica:
+            response = self.client.post(reverse('trading_network:link_create'),
+                                        {'status_link': 'factory', 'name': 'replica_factory_2', 'products': [],
+                                         'contact': []}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(replica), 0)
+        self.assertIn(settings.REPLICA_STICKY_COOKIE, response.cookies)
+
+        primary, replica = self.get(reverse('trading_network:link', args=[response.json()['id']]))
+        self.assertGreater(primary, 0)
+        self.assertEqual(replica, 0)
+
+        self.client.cookies[settings.REPLICA_STICKY_COOKIE] = '0'
+        cache.clear()
+        primary, replica = self.get(reverse('trading_network:link', args=[response.json()['id']]))
+        self.assertEqual(primary, 0)
+        self.assertGreater(replica, 0)
+
+
+class NetworkFilterTestCase(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create(email='filter@test.com', is_active=True, is_staff=True)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+
+        self.product = Product.objects.create(name='filter', model='filter', date='2024-03-04')
+        self.factory = Link.objects.create(status_link='factory', name='filter_factory')
+        self.retail = Link.objects.create(status_link='retail_network', supplier=self.factory, name='filter_retail',
+                                          debt=100)
+        self.entrepreneur = Link.objects.create(status_link='entrepreneur', supplier=self.retail,
+                                                name='filter_entrepreneur', debt=10)
+        self.retail.products.set([self.product])
+        for link, country, city in ((self.factory, 'Russia', 'Moscow'), (self.factory, 'Russia', 'Kazan'),
+                                    (self.retail, 'China', 'Beijing'), (self.entrepreneur, 'India', 'Mumbai')):
+            Contact.objects.create(link=link, email='filter@test.com', country=country, city=city,
+                                   street='test', num_house='1')
+
+    def names(self, params):
+        response = self.client.get(reverse('trading_network:link_list'), params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [link['name'] for link in response.json()['results']]
+
+    def test_filters(self):
+        """Тест фильтрации звеньев без дублирования"""
+        self.assertEqual(self.names({'country': 'Russia'}), ['filter_factory'])
+        self.assertEqual(self.names({'country': 'China,India', 'ordering': 'id'}),
+                         ['filter_retail', 'filter_entrepreneur'])
+        self.assertEqual(self.names({'city': 'Moscow,Kazan'}), ['filter_factory'])
+        self.assertEqual(self.names({'level': '1,2', 'status_link': 'entrepreneur'}), ['filter_entrepreneur'])
+        self.assertEqual(self.names({'product': self.product.id}), ['filter_retail'])
+        self.assertEqual(self.names({'debt_min': 50}), ['filter_retail'])
+        self.assertEqual(self.names({'debt_max': 50}), ['filter_entrepreneur'])
+        self.assertEqual(self.names({'created_at_after': '2000-01-01T00:00:00Z', 'ordering': '-level'}),
+                         ['filter_entrepreneur', 'filter_retail', 'filter_factory'])
+        self.assertEqual(self.names({'created_at_before': '2000-01-01T00:00:00Z'}), [])
+        self.assertEqual(self.names({'debt_min': 1, 'ordering': 'debt'}), ['filter_entrepreneur', 'filter_retail'])
+
+    def assertIndexScan(self, params, index):
+        plan = LinkFilter(params, queryset=Link.objects.all()).qs.explain()
+        self.assertNotIn('Seq Scan', plan)
+        self.assertIn(index, plan)
+
+    def test_filters_use_indexes(self):
+        """Фильтры выполняются по индексам"""
+        # статистика собирается по заведомо большой таблице, иначе выбор плана зависит от того,
+        # успел ли autovacuum проанализировать таблицы после предыдущих тестов;
+        # каждому фильтру соответствует малая доля строк, поэтому индекс выбирается при обычных настройках
+        links = Link.objects.bulk_create(
+            Link(status_link='entrepreneur' if i % 100 == 0 else ('factory', 'retail_network')[i % 2],
+                 name=f'filter_bulk_{i}', level=2 if i % 100 == 0 else i % 2, debt=i % 1000)
+            for i in range(5000)
+        )
+        Contact.objects.bulk_create(
+            Contact(link=link, email='filter@test.com', country=f'Country_{i % 50}', city=f'City_{i % 300}',
+                    street='test', num_house='1')
+            for i, link in enumerate(links)
+        )
+        Link.objects.filter(pk__in=[link.pk for link in links if not link.name.endswith('00')]).update(
+            created_at='2020-01-01T00:00:00Z')
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE trading_network_link, trading_network_contact')
+
+        self.assertIndexScan({'country': 'Russia,China'}, 'contact_country_link_idx')
+        self.assertIndexScan({'city': 'Moscow'}, 'contact_city_link_idx')
+        self.assertIndexScan({'status_link': 'entrepreneur'}, 'link_status_level_idx')
+        self.assertIndexScan({'level': '1,2', 'created_at_after': '2024-01-01T00:00:00Z'}, 'link_level_created_at_idx')
+        self.assertIndexScan({'debt_min': 10, 'debt_max': 20}, 'link_debt_id_idx')
+        self.assertIndexScan({'created_at_after': '2024-01-01T00:00:00Z'}, 'link_created_at_id_idx')
+
+
+class SupplierCatalogTestCase(TestCase):
+    def setUp(self):
+        self.products = Product.objects.bulk_create(
+            Product(name=f'catalog_{i}', model='catalog', date='2024-03-04') for i in range(4)
+        )
+        self.factory = Link.objects.create(status_link='factory', name='catalog_factory')
+        self.factory_2 = Link.objects.create(status_link='factory', name='catalog_factory_2')
+        self.factory.products.set(self.products[:3])
+        self.factory_2.products.set(self.products[3:])
+
+    def test_missing_products(self):
+        """Проверка каталога поставщика одним запросом"""
+        with self.assertNumQueries(1):
+            missing = SupplierCatalog().missing_products(self.factory, self.products)
+        self.assertEqual(missing, self.products[3:])
+
+    def test_preloaded_catalogs(self):
+        """Пакетная проверка по предзагруженным каталогам без запросов"""
+        catalog = SupplierCatalog()
+        with self.assertNumQueries(1):
+            catalog.preload([self.factory.id, self.factory_2.id])
+        with self.assertNumQueries(0):
+            self.assertEqual(catalog.missing_products(self.factory_2, self.products), self.products[:3])
+            validator = ProductSupplierRelationshipValidator('supplier', 'products', catalog)
+            with self.assertRaisesMessage(ValidationError, 'Продукт catalog_3 не принадлежит поставщику catalog_factory'):
+                validator({'supplier': self.factory, 'products': self.products[2:]})
@@ -1,7 +1,7 @@
 from django.urls import path
 from rest_framework.routers import DefaultRouter
 
-from trading_network import views
+from trading_network import async_views, views
 from trading_network.apps import TradingNetworkConfig
 from trading_network.views import ContactViewSet, ProductViewSet
 
@@ -13,8 +13,26 @@ router.register(r'product', ProductViewSet, basename='product')
 
 urlpatterns = [
     path('link/<int:pk>/', views.LinkRetrieveAPIView.as_view(), name='link'),
+    path('link/<int:pk>/tree/', views.LinkTreeAPIView.as_view(), name='link_tree'),
+    path('link/<int:pk>/ancestors/', views.LinkAncestorsAPIView.as_view(), name='link_ancestors'),
     path('link/', views.LinkListAPIView.as_view(), name='link_list'),
+    path('link/export/', views.LinkExportAPIView.as_view(), name='link_export'),
+    path('link/debt/', views.DebtRollupAPIView.as_view(), name='link_debt'),
     path('link/create/', views.LinkCreateAPIView.as_view(), name='link_create'),
+    path('link/bulk/', views.LinkBulkAPIView.as_view(), name='link_bulk'),
     path('link/<int:pk>/update/', views.LinkUpdateAPIView.as_view(), name='link_update'),
+    path('link/<int:pk>/catalog/prune/', views.LinkCatalogPruneAPIView.as_view(), name='link_catalog_prune'),
+    path('link/<int:pk>/ledger/', views.LinkLedgerAPIView.as_view(), name='link_ledger'),
+    path('link/<int:pk>/balance/', views.LinkBalanceAPIView.as_view(), name='link_balance'),
     path('link/<int:pk>/delete/', views.LinkDestroyAPIView.as_view(), name='link_delete'),
+    path('async/link/', async_views.LinkListView.as_view(), name='async_link_list'),
+    path('async/link/<int:pk>/', async_views.LinkRetrieveView.as_view(), name='async_link'),
+    path('async/product/', async_views.ProductListView.as_view(), name='async_product_list'),
+    path('async/product/<int:pk>/', async_views.ProductRetrieveView.as_view(), name='async_product'),
+    path('async/contact/', async_views.ContactListView.as_view(), name='async_contact_list'),
+    path('async/contact/<int:pk>/', async_views.ContactRetrieveView.as_view(), name='async_contact'),
+    path('search/', views.SearchAPIView.as_view(), name='search'),
+    path('metrics/', views.MetricsAPIView.as_view(), name='metrics'),
+    path('profile/', views.ProfileListAPIView.as_view(), name='profile_list'),
+    path('profile/<str:profile_id>/', views.ProfileDownloadAPIView.as_view(), name='profile'),
 ] + router.urls
@@ -1,6 +1,49 @@
 from django.utils.translation import ngettext
 from rest_framework import serializers
 
+from trading_network.models import Link
+
+
+class SupplierCatalog:
+    """Проверка принадлежности продуктов каталогу поставщика
+
+    Без предзагрузки каждая проверка - один запрос по уникальному индексу (link_id, product_id)
+    through-таблицы. Для пакетных проверок каталоги поставщиков загружаются заранее одним запросом
+    (preload) и дальше проверяются по множеству id без обращения к базе.
+    """
+
+    def __init__(self):
+        self.catalogs = {}
+
+    def preload(self, supplier_ids):
+        missing = set(supplier_ids) - self.catalogs.keys()
+        if not missing:
+            return
+        for supplier_id in missing:
+            self.catalogs[supplier_id] = set()
+        rows = Link.products.through.objects.filter(link_id__in=missing).values_list('link_id', 'product_id')
+        for supplier_id, product_id in rows:
+            self.catalogs[supplier_id].add(product_id)
+
+    def missing_products(self, supplier, products):
+        """Продукты из списка, которых нет в каталоге поставщика"""
+        product_ids = {product.pk for product in products}
+        if supplier.pk in self.catalogs:
+            present = self.catalogs[supplier.pk] & product_ids
+        else:
+            present = set(Link.products.through.objects.filter(link_id=supplier.pk, product_id__in=product_ids)
+                          .values_list('product_id', flat=True))
+        return [product for product in products if product.pk not in present]
+
+
+def foreign_products_message(products, supplier):
+    names = [product.name for product in products]
+    return ngettext(
+        "Продукт %s не принадлежит поставщику %s",
+        "Продукты %s не принадлежат поставщику %s",
+        len(names),
+    ) % (', '.join(names), supplier.name)
+
 
 class StatusLinkSupplierValidator:
     """Валидация установки поставщика и иерархической структуры"""
@@ -20,23 +63,33 @@ class StatusLinkSupplierValidator:
 
 
 class ProductSupplierRelationshipValidator:
-    """Валидация наличия продукта у определенного поставщика"""
-    def __init__(self, supplier, products):
+    """Валидация наличия продукта у определенного поставщика
+
+    Для пакетной проверки передается общий SupplierCatalog с предзагруженными каталогами.
+    """
+    def __init__(self, supplier, products, catalog=None):
         self.supplier = supplier
         self.products = products
+        self.catalog = catalog
 
     def __call__(self, attrs):
         supplier_ = attrs.get(self.supplier)
         product_list_ = attrs.get(self.products)
         if supplier_ and product_list_:
-            supplier_products = supplier_.products.all()
-            products = [product.name for product in product_list_ if product not in supplier_products]
+            products = (self.catalog or SupplierCatalog()).missing_products(supplier_, product_list_)
             if products:
-                raise serializers.ValidationError(
-                    ngettext(
-                        "Продукт %s не принадлежит поставщику %s",
-                        "Продукты %s не принадлежат поставщику %s",
-                        len(products),
-                    )
-                    % (', '.join(products), supplier_.name)
-                )
+                raise serializers.ValidationError(foreign_products_message(products, supplier_))
+
+
+class SupplierCycleValidator:
+    """Валидация смены поставщика: им не может быть само звено или звено его поддерева"""
+    requires_context = True
+    message = 'Поставщиком не может быть само звено или звено, получающее от него продукцию'
+
+    def __init__(self, supplier):
+        self.supplier = supplier
+
+    def __call__(self, attrs, serializer):
+        instance = serializer.instance
+        if instance is not None and instance.is_supplier_cycle(attrs.get(self.supplier)):
+            raise serializers.ValidationError(self.message)
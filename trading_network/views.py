@@ -1,42 +1,307 @@
+from abc import ABC, abstractmethod
+from itertools import chain
+
+from django.db.models import Sum
+from django.http import FileResponse, Http404, HttpResponse, StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from rest_framework import generics
+from rest_framework.exceptions import ValidationError
 from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
+from rest_framework.views import APIView
 from rest_framework.viewsets import ModelViewSet
 
+from trading_network import ledger, metrics, profiling, search
+from trading_network.cache import CachedResponseMixin
+from trading_network.catalogs import prune_descendant_catalogs
 from trading_network.filters import LinkFilter
-from trading_network.models import Contact, Product, Link
-from trading_network.serializers import ContactSerializer, ProductSerializer, LinkSerializer, LinkReadSerializer
+from trading_network.mixins import EagerLoadingViewMixin
+from trading_network.models import Contact, DebtRollup, DebtTransaction, Product, Link
+from trading_network.paginators import LinkPagination, OptionalCursorPagination
+from trading_network.serializers import ContactSerializer, ProductSerializer, LinkSerializer, LinkReadSerializer, \
+    LinkBulkItemSerializer, DebtRollupSerializer, CatalogPruneSerializer, DebtTransactionSerializer, \
+    LinkBalanceSerializer, SearchResultSerializer
+from trading_network.services import EXPORT_FORMATS, build_tree, iter_ndjson, bulk_upsert_links
 
 
-class ContactViewSet(ModelViewSet):
+class ContactViewSet(CachedResponseMixin, ModelViewSet):
     queryset = Contact.objects.all()
     serializer_class = ContactSerializer
+    pagination_class = OptionalCursorPagination
+    cache_namespaces = ('contact',)
+    read_replica = True
 
 
-class ProductViewSet(ModelViewSet):
+class ProductViewSet(CachedResponseMixin, ModelViewSet):
     queryset = Product.objects.all()
     serializer_class = ProductSerializer
+    pagination_class = OptionalCursorPagination
+    cache_namespaces = ('product',)
+    read_replica = True
 
 
 class LinkCreateAPIView(generics.CreateAPIView):
     serializer_class = LinkSerializer
 
 
+class LinkBulkAPIView(generics.GenericAPIView):
+    """Пакетное создание и обновление звеньев, ошибки возвращаются по каждому элементу"""
+    serializer_class = LinkBulkItemSerializer
+
+    def post(self, request, *args, **kwargs):
+        if not isinstance(request.data, list):
+            raise ValidationError({'non_field_errors': ['Ожидается список звеньев']})
+        return Response({'results': bulk_upsert_links(request.data)})
+
+
 class LinkUpdateAPIView(generics.UpdateAPIView):
     queryset = Link.objects.all()
     serializer_class = LinkSerializer
 
 
-class LinkListAPIView(generics.ListAPIView):
+class LinkListAPIView(CachedResponseMixin, EagerLoadingViewMixin, generics.ListAPIView):
     queryset = Link.objects.all()
     serializer_class = LinkReadSerializer
     filterset_class = LinkFilter
+    pagination_class = LinkPagination
+    read_replica = True
+
+
+class LinkExportAPIView(EagerLoadingViewMixin, generics.ListAPIView):
+    """Потоковая выгрузка звеньев в NDJSON или CSV (?output=csv) с учетом фильтров LinkFilter"""
+    queryset = Link.objects.order_by('id')
+    serializer_class = LinkReadSerializer
+    filterset_class = LinkFilter
+    pagination_class = None
+
+    def list(self, request, *args, **kwargs):
+        output = request.query_params.get('output', 'ndjson')
+        if output not in EXPORT_FORMATS:
+            raise ValidationError({'output': f'Допустимые форматы: {", ".join(EXPORT_FORMATS)}'})
+        iter_rows, content_type = EXPORT_FORMATS[output]
+        queryset = self.filter_queryset(self.get_queryset())
+        response = StreamingHttpResponse(
+            iter_rows(queryset, self.get_serializer_class(), self.get_serializer_context()),
+            content_type=content_type,
+        )
+        response['Content-Disposition'] = f'attachment; filename="links.{output}"'
+        return response
+
+
+class DebtRollupAPIView(generics.GenericAPIView):
+    """Суммарная задолженность с группировкой ?group_by=root,level,status_link,country
+
+    Читается из таблицы сводки DebtRollup, поэтому время ответа зависит от числа групп, а не звеньев.
+    """
+    serializer_class = DebtRollupSerializer
+    pagination_class = None
+    group_fields = {'root': 'root_id', 'level': 'level', 'status_link': 'status_link', 'country': 'country'}
+    read_replica = True
+
+    def get(self, request, *args, **kwargs):
+        group_by = [group for group in request.query_params.get('group_by', '').split(',') if group] or ['root']
+        unknown = set(group_by) - self.group_fields.keys()
+        if unknown:
+            raise ValidationError({'group_by': f'Допустимые группировки: {", ".join(self.group_fields)}'})
+
+        # строки стран и строки-итоги (с пустой страной) не суммируются между собой
+        rollups = DebtRollup.objects.filter(country='')
+        if 'country' in group_by:
+            rollups = DebtRollup.objects.exclude(country='')
+        fields = [self.group_fields[group] for group in group_by]
+        groups = (rollups.values(*fields).annotate(debt=Sum('total'), links_count=Sum('links'))
+                  .filter(links_count__gt=0).order_by(*fields))
+
+        rows = [
+            dict({group: row[self.group_fields[group]] for group in group_by},
+                 debt=row['debt'], links=row['links_count'])
+            for row in groups
+        ]
+        if 'root' in group_by:
+            roots = Link.objects.only('name').in_bulk([row['root'] for row in rows])
+            for row in rows:
+                row['root_name'] = roots[row['root']].name if row['root'] in roots else None
+        return Response(self.get_serializer(rows, many=True).data)
 
 
-class LinkRetrieveAPIView(generics.RetrieveAPIView):
+class LinkRetrieveAPIView(CachedResponseMixin, EagerLoadingViewMixin, generics.RetrieveAPIView):
     queryset = Link.objects.all()
     serializer_class = LinkReadSerializer
+    read_replica = True
 
 
 class LinkDestroyAPIView(generics.DestroyAPIView):
     queryset = Link.objects.all()
     permission_classes = [IsAdminUser]
+
+
+class LinkCatalogPruneAPIView(generics.GenericAPIView):
+    """Удаление из каталогов поддерева звена переданных продуктов (по умолчанию - всех, которых нет у звена)
+
+    С dry_run=true только возвращает число строк, которые будут удалены.
+    """
+    queryset = Link.objects.all()
+    serializer_class = CatalogPruneSerializer
+    permission_classes = [IsAdminUser]
+
+    def post(self, request, *args, **kwargs):
+        link = self.get_object()
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        dry_run = serializer.validated_data['dry_run']
+        rows = prune_descendant_catalogs({link: serializer.validated_data.get('products')}, dry_run=dry_run)
+        return Response({'rows': rows, 'dry_run': dry_run})
+
+
+class LinkLedgerAPIView(generics.ListCreateAPIView):
+    """Журнал проводок по задолженности звена; проводки добавляет только администратор"""
+    serializer_class = DebtTransactionSerializer
+    pagination_class = OptionalCursorPagination
+
+    def get_permissions(self):
+        if self.request.method == 'POST':
+            return [IsAdminUser()]
+        return super().get_permissions()
+
+    def get_queryset(self):
+        link = get_object_or_404(Link.objects.only('pk'), pk=self.kwargs['pk'])
+        return DebtTransaction.objects.filter(link=link).order_by('id')
+
+    def perform_create(self, serializer):
+        link = get_object_or_404(Link.objects.only('pk'), pk=self.kwargs['pk'])
+        serializer.instance = ledger.post(link.pk, **serializer.validated_data)
+
+
+class LinkBalanceAPIView(generics.GenericAPIView):
+    """Задолженность звена на момент ?as_of= (ISO 8601) по снимкам и журналу, без параметра - текущая"""
+    queryset = Link.objects.all()
+    serializer_class = LinkBalanceSerializer
+
+    def get(self, request, *args, **kwargs):
+        link = self.get_object()
+        as_of = request.query_params.get('as_of')
+        if as_of is None:
+            # звено без задолженности (debt = NULL) по журналу имеет нулевой баланс
+            debt = link.debt if link.debt is not None else ledger.ZERO
+            return Response(self.get_serializer({'id': link.pk, 'as_of': None, 'debt': debt}).data)
+        try:
+            # None - строка не похожа на дату, ValueError - несуществующая дата (2024-13-45T00:00)
+            moment = parse_datetime(as_of)
+        except ValueError:
+            moment = None
+        if moment is None:
+            raise ValidationError({'as_of': 'Ожидается дата и время в формате ISO 8601'})
+        if timezone.is_naive(moment):
+            moment = timezone.make_aware(moment)
+        debt = ledger.balance(link.pk, moment)
+        return Response(self.get_serializer({'id': link.pk, 'as_of': moment, 'debt': debt}).data)
+
+
+class LinkHierarchyAPIView(EagerLoadingViewMixin, generics.RetrieveAPIView, ABC):
+    """Базовое представление цепочки звеньев: ограничение глубины (?depth=) и потоковый режим (?stream=1)"""
+    queryset = Link.objects.all()
+    serializer_class = LinkReadSerializer
+    read_replica = True
+
+    def get_depth(self):
+        depth = self.request.query_params.get('depth')
+        if depth is None:
+            return None
+        if not depth.isdigit():
+            raise ValidationError({'depth': 'Глубина должна быть неотрицательным целым числом'})
+        return int(depth)
+
+    @abstractmethod
+    def get_nodes(self, link, depth):
+        """Возвращает верхнее звено цепочки и остальные звенья, упорядоченные по path"""
+
+    def retrieve(self, request, *args, **kwargs):
+        link = self.get_object()
+        root, nodes = self.get_nodes(link, self.get_depth())
+        serializer_class = self.get_serializer_class()
+        context = self.get_serializer_context()
+        if request.query_params.get('stream') in ('1', 'true'):
+            return StreamingHttpResponse(
+                chain(iter_ndjson([root], serializer_class, context), iter_ndjson(nodes, serializer_class, context)),
+                content_type='application/x-ndjson',
+            )
+        return Response(build_tree(root, nodes, serializer_class, context))
+
+
+class LinkTreeAPIView(LinkHierarchyAPIView):
+    """Поддерево звена (все получатели его продукции) одним запросом по индексу path"""
+
+    def get_nodes(self, link, depth):
+        nodes = self.get_queryset().filter(path__startswith=link.descendants_prefix)
+        if depth is not None:
+            nodes = nodes.filter(level__lte=link.level + depth)
+        return link, nodes.order_by('path', 'id')
+
+
+class LinkAncestorsAPIView(LinkHierarchyAPIView):
+    """Цепочка поставщиков звена от завода одним запросом по id из path"""
+
+    def get_nodes(self, link, depth):
+        ancestor_ids = link.ancestor_ids
+        if depth is not None:
+            ancestor_ids = ancestor_ids[-depth:] if depth else []
+        nodes = list(self.get_queryset().filter(pk__in=ancestor_ids).order_by('path')) + [link]
+        return nodes[0], nodes[1:]
+
+
+class SearchAPIView(generics.GenericAPIView):
+    """Поиск звеньев (по названию), продуктов (по названию и модели) и контактов (по адресу)
+
+    ?q= - слова запроса, каждое ищется как начало слова; ?type=link,product,contact - виды результатов;
+    ?limit= - число результатов (по умолчанию 20, не больше 100).
+    """
+    serializer_class = SearchResultSerializer
+    pagination_class = None
+    read_replica = True
+    default_limit = 20
+    max_limit = 100
+
+    def get(self, request, *args, **kwargs):
+        query = request.query_params.get('q', '').strip()
+        if not search.terms(query):
+            raise ValidationError({'q': 'Укажите хотя бы одно слово для поиска'})
+        kinds = [kind for kind in request.query_params.get('type', '').split(',') if kind] or list(search.KINDS)
+        unknown = set(kinds) - search.KINDS.keys()
+        if unknown:
+            raise ValidationError({'type': f'Допустимые виды: {", ".join(search.KINDS)}'})
+        limit = request.query_params.get('limit', str(self.default_limit))
+        if not limit.isdigit() or not 1 <= int(limit) <= self.max_limit:
+            raise ValidationError({'limit': f'Ожидается число от 1 до {self.max_limit}'})
+
+        results = search.search(query, [search.KINDS[kind] for kind in kinds], int(limit))
+        return Response(self.get_serializer(results, many=True).data)
+
+
+class MetricsAPIView(APIView):
+    """Метрики запросов всех процессов-воркеров в текстовом формате Prometheus"""
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, *args, **kwargs):
+        return HttpResponse(metrics.render(metrics.store.collect()),
+                            content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+class ProfileListAPIView(APIView):
+    """Сохраненные профили запросов (ProfilingMiddleware), новые первыми"""
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, *args, **kwargs):
+        return Response(profiling.list_profiles())
+
+
+class ProfileDownloadAPIView(APIView):
+    """Файл профиля: .prof (pstats, snakeviz) или .folded (flamegraph.pl, speedscope)"""
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, profile_id, *args, **kwargs):
+        file = profiling.get_file(profile_id)
+        if file is None:
+            raise Http404
+        return FileResponse(file.open('rb'), as_attachment=True, filename=file.name)
@@ -0,0 +1,70 @@
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+USER_CACHE_KEY = 'users:jwt_user:{}'
+
+
+def forget_users(*user_ids):
+    """Сброс закэшированных пользователей, вызывается сигналами users.signals"""
+    cache.delete_many([USER_CACHE_KEY.format(user_id) for user_id in user_ids])
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """JWTAuthentication, который берет пользователя из кэша, а не из базы на каждый запрос
+
+    Пользователь кэшируется на JWT_USER_CACHE_TIMEOUT секунд независимо от срока жизни токена и сбрасывается
+    при сохранении, удалении и изменении групп или прав (users.signals). Изменения через queryset.update()
+    и сброс в кэше другого процесса (LocMemCache) вступают в силу по истечении этого времени.
+    """
+
+    def get_user(self, validated_token):
+        user_id = validated_token.get(api_settings.USER_ID_CLAIM)
+        if user_id is None:
+            return super().get_user(validated_token)
+
+        key = USER_CACHE_KEY.format(user_id)
+        user = cache.get(key)
+        if user is None:
+            user = super().get_user(validated_token)
+            cache.set(key, user, settings.JWT_USER_CACHE_TIMEOUT)
+            return user
+        return self.check_user(user, validated_token)
+
+    async def aauthenticate(self, request):
+        """Асинхронный authenticate для представлений trading_network.async_views"""
+        header = self.get_header(request)
+        if header is None:
+            return None
+        raw_token = self.get_raw_token(header)
+        if raw_token is None:
+            return None
+        validated_token = self.get_validated_token(raw_token)
+        return await self.aget_user(validated_token), validated_token
+
+    async def aget_user(self, validated_token):
+        user_id = validated_token.get(api_settings.USER_ID_CLAIM)
+        if user_id is None:
+            return await sync_to_async(super().get_user)(validated_token)
+
+        key = USER_CACHE_KEY.format(user_id)
+        user = await cache.aget(key)
+        if user is None:
+            user = await sync_to_async(super().get_user)(validated_token)
+            await cache.aset(key, user, settings.JWT_USER_CACHE_TIMEOUT)
+            return user
+        return self.check_user(user, validated_token)
+
+    def check_user(self, user, validated_token):
+        # те же проверки, что и в JWTAuthentication.get_user, но без запроса к базе
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed(_('User is inactive'), code='user_inactive')
+        if api_settings.CHECK_REVOKE_TOKEN and (
+                validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != get_md5_hash_password(user.password)):
+            raise AuthenticationFailed(_("The user's password has been changed."), code='password_changed')
+        return user
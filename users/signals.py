@@ -0,0 +1,22 @@
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from users.authentication import forget_users
+from users.models import User
+
+
+@receiver([post_save, post_delete], sender=User)
+def forget_changed_user(sender, instance, **kwargs):
+    forget_users(instance.pk)
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+@receiver(m2m_changed, sender=User.user_permissions.through)
+def forget_users_with_changed_access(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse and action.startswith('post_'):
+        forget_users(instance.pk)
+    elif reverse and action in ('post_add', 'post_remove'):
+        forget_users(*pk_set)
+    elif reverse and action == 'pre_clear':
+        # после очистки связей участников группы уже не найти
+        forget_users(*instance.user_set.values_list('pk', flat=True))
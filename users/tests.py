@@ -1,7 +1,15 @@
+import time
+from unittest import mock
+
+from django.contrib.auth.models import Group
+from django.core.cache import cache
+from django.db import connection
 from django.urls import reverse
-from django.test import TestCase
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from rest_framework import status
 from rest_framework.test import APITestCase
+from rest_framework_simplejwt.tokens import AccessToken
 from django.core.management import call_command
 
 from users.models import User
@@ -48,3 +56,60 @@ class CreateUserTestCase(APITestCase):
             str(user),
             'user@example.com'
         )
+
+
+class CachedJWTAuthenticationTestCase(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(email='jwt@test.com', is_active=True)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+        self.url = reverse('trading_network:product-list')
+
+    def user_queries(self):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(self.url)
+        return response, sum('"users_user"' in query['sql'] for query in context.captured_queries)
+
+    def test_user_cached(self):
+        """Пользователь загружается из базы только при первом запросе"""
+        self.assertEqual(self.user_queries()[1], 1)
+        response, queries = self.user_queries()
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(queries, 0)
+
+    @override_settings(JWT_USER_CACHE_TIMEOUT=60)
+    def test_user_cache_timeout(self):
+        """Пользователь кэшируется на JWT_USER_CACHE_TIMEOUT, а не на время жизни токена"""
+        self.user_queries()
+        with mock.patch('time.time', return_value=time.time() + 61):
+            response, queries = self.user_queries()
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(queries, 1)
+
+    def test_deactivated_user(self):
+        """Сохранение пользователя сбрасывает кэш, отключенный пользователь не проходит аутентификацию"""
+        self.user_queries()
+        self.user.is_active = False
+        self.user.save()
+
+        response, queries = self.user_queries()
+
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(queries, 1)
+
+    def test_group_change(self):
+        """Изменение групп пользователя сбрасывает кэш"""
+        group = Group.objects.create(name='jwt')
+        self.user_queries()
+        self.user.groups.add(group)
+        self.assertEqual(self.user_queries()[1], 1)
+
+        group.user_set.remove(self.user)
+        self.assertEqual(self.user_queries()[1], 1)
+
+        group.user_set.add(self.user)
+        self.user_queries()
+        group.user_set.clear()
+        self.assertEqual(self.user_queries()[1], 1)